@@ -1,6 +1,8 @@
 """IntelliForge Application Package"""
-from flask import Flask
-from app.repositories.database import init_db
+from flask import Flask, g, request
+
+# Request bytes allowed on top of the uploaded files (multipart headers, form fields)
+FORM_OVERHEAD = 1024 * 1024
 
 
 def create_app():
@@ -9,7 +11,14 @@ def create_app():
                 template_folder='../templates',
                 static_folder='../static')
     
+    # Werkzeug reads and spools the whole body before request.files exists, so
+    # the upload limit has to hold while it parses: larger requests get a 413
+    # as soon as the limit is passed instead of being received in full
+    from app.config import config
+    app.config['MAX_CONTENT_LENGTH'] = config.MAX_FILE_SIZE * config.MAX_FILES_PER_UPLOAD + FORM_OVERHEAD
+    
     # Initialize database
+    from app.repositories.database import init_db
     with app.app_context():
         init_db()
     
@@ -22,4 +31,33 @@ def create_app():
     app.register_blueprint(rag_bp, url_prefix='/rag')
     app.register_blueprint(chat_bp, url_prefix='/regularchat')
     
+    # Start link refresh on the first request, so only the serving process
+    # (not the reloader's parent) runs the scheduler
+    if config.ENABLE_LINK_REFRESH:
+        from app.services.link_refresh_service import link_refresh_scheduler
+        app.before_request(link_refresh_scheduler.start)
+    
+    # One trace per request; spans below it are only recorded for sampled requests
+    from app.utils.tracing import tracer
+    
+    @app.before_request
+    def start_request_trace():
+        g.trace = tracer.start_trace(f"{request.method} {request.url_rule or request.path}",
+                                     method=request.method, path=request.path)
+        g.trace.__enter__()
+    
+    @app.after_request
+    def add_trace_header(response):
+        trace = g.get('trace')
+        if trace is not None:
+            response.headers['X-Trace-Id'] = trace.trace_id
+            trace.set_attribute('status_code', response.status_code)
+        return response
+    
+    @app.teardown_request
+    def end_request_trace(error=None):
+        trace = g.pop('trace', None)
+        if trace is not None:
+            trace.__exit__(type(error) if error else None, error, None)
+    
     return app
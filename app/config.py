@@ -23,6 +23,10 @@ class Config:
     )
     LLM_MODEL_NAME: Optional[str] = os.getenv("LLM_MODEL_NAME")
     
+    # Model Endpoints
+    OLLAMA_BASE_URL: str = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+    GITHUB_MODELS_BASE_URL: str = os.getenv("GITHUB_MODELS_BASE_URL", "https://models.github.ai/inference")
+    
     # Database
     DATABASE_PATH: str = "database.db"
     
@@ -32,27 +36,68 @@ class Config:
     # File Upload
     UPLOAD_FOLDER: str = "uploads"
     MAX_FILE_SIZE: int = 16 * 1024 * 1024  # 16MB
+    MAX_FILES_PER_UPLOAD: int = 4  # Files one upload request carries; with MAX_FILE_SIZE bounds the request body
     
     # Chunk Settings
     DEFAULT_CHUNK_SIZE: int = 1000
     DEFAULT_CHUNK_OVERLAP: int = 50
+    CHUNK_LEASE_SECONDS: int = 24 * 3600  # Unreferenced chunks a build resolved are kept from GC this long
+    
+    # Ingestion Settings
+    INGEST_BATCH_SIZE: int = 256           # Chunks embedded and indexed per step
+    INGEST_TEXT_BLOCK_SIZE: int = 1024 * 1024  # Characters read from a text file at a time
+    
+    # Link Ingestion Settings
+    LINK_FETCH_WORKERS: int = 16       # Concurrent link downloads
+    LINK_FETCH_PER_HOST: int = 4       # Concurrent downloads per host
+    LINK_CONNECT_TIMEOUT: float = 5.0  # Seconds
+    LINK_READ_TIMEOUT: float = 30.0    # Seconds
+    LINK_FETCH_RETRIES: int = 2        # Retries on connection errors, 429 and 5xx
+    LINK_EXTRACT_WORKERS: int = 4      # Processes converting HTML/PDF to text
+    ENABLE_LINK_REFRESH: bool = True   # Background refresh of link documents on per-RAG schedules
+    LINK_REFRESH_POLL_SECONDS: int = 60  # How often the scheduler looks for RAGs due a refresh
     
     # Model Types
     SUPPORTED_MODEL_TYPES = ['ChatGPT', 'Ollama', 'GROQ', 'GitHub']
     SUPPORTED_VECTOR_STORES = ['faiss', 'chroma']
     
     # Token Management
-    MAX_CONTEXT_TOKENS = 6000  # Safe limit for most models
+    MAX_CONTEXT_TOKENS = 6000  # Cap on prompt tokens per LLM call, below the model's context window
+    COMPLETION_TOKEN_RESERVE = 1024  # Context window tokens left for the answer
+    OLLAMA_NUM_CTX: int = int(os.getenv("OLLAMA_NUM_CTX", "2048"))  # Context window Ollama models run with
+    WEB_CONTEXT_MAX_TOKENS = 1000  # Web search results packed into a chat prompt
     MAX_RECENT_MESSAGES = 8    # Keep last N messages for context
     MAX_SIMILAR_MESSAGES = 2   # Add N most similar older messages
-    MAX_MESSAGE_LENGTH = 500   # Truncate long messages
     SIMILARITY_THRESHOLD = 0.3 # Minimum similarity for including old messages
     
+    # RAG Session Memory
+    RAG_MEMORY_WINDOW: int = 4         # Recent turns passed verbatim to the condense-question prompt
+    RAG_SUMMARY_INTERVAL: int = 4      # Turns past the window folded into the rolling summary at a time
+    RAG_SUMMARY_MAX_TOKENS: int = 300  # Length cap of a session's rolling summary
+    ENABLE_RAG_SESSION_SUMMARY: bool = True
+    
     # Reranking Settings
     DEFAULT_RERANKER_MODEL: str = "cross-encoder/ms-marco-MiniLM-L-6-v2"
     DEFAULT_TOP_K_RETRIEVAL: int = 20  # Retrieve more docs initially
     DEFAULT_TOP_K_RERANKED: int = 5    # Return fewer after reranking
     ENABLE_RERANKING: bool = True
+    RERANK_BATCH_SIZE: int = 32        # Cross-encoder pairs per forward pass
+    ENABLE_RERANK_EARLY_EXIT: bool = True  # Skip/shorten reranking on decisive dense scores
+    
+    # Hybrid Retrieval Settings
+    ENABLE_HYBRID_RETRIEVAL: bool = True
+    DEFAULT_TOP_K_LEXICAL: int = 20    # BM25 candidates fused with dense results
+    DEFAULT_RERANK_CANDIDATES: int = 12  # Fused candidates sent to the reranker
+    RRF_K: int = 60                    # Reciprocal rank fusion constant
+    CANDIDATE_DEDUP: str = "collapse"  # "off", "collapse" near-duplicates, or "mmr"
+    
+    # Web Search Settings
+    WEB_SEARCH_TIMEOUT: float = float(os.getenv("WEB_SEARCH_TIMEOUT", "15"))  # Seconds per chat turn
+    
+    # Tracing Settings
+    TRACE_SAMPLE_RATE: float = float(os.getenv("TRACE_SAMPLE_RATE", "0"))  # Share of requests traced
+    TRACE_EXPORTER: str = os.getenv("TRACE_EXPORTER", "jsonl")  # "none", "jsonl", "mlflow" or "otel"
+    TRACE_JSONL_PATH: str = os.getenv("TRACE_JSONL_PATH", "traces.jsonl")
 
 
 # Create a singleton instance
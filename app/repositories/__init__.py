@@ -2,5 +2,8 @@
 from app.repositories.database import get_db_connection, init_db
 from app.repositories.rag_repository import RAGRepository
 from app.repositories.chat_repository import ChatRepository
+from app.repositories.chunk_repository import ChunkRepository
+from app.repositories.metrics_repository import MetricsRepository
 
-__all__ = ['get_db_connection', 'init_db', 'RAGRepository', 'ChatRepository']
+__all__ = ['get_db_connection', 'init_db', 'RAGRepository', 'ChatRepository', 'ChunkRepository',
+           'MetricsRepository']
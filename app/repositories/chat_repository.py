@@ -74,7 +74,7 @@ class ChatRepository:
     @staticmethod
     def add_chat_message(chat_id: int, prompt: str, response: str, embedding: str,
                         model_type: str, language_model: str, response_length: int,
-                        execution_time: int, generated_at: str):
+                        execution_time: int, generated_at: str) -> int:
         """Add a chat message"""
         timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         conn = get_db_connection()
@@ -86,8 +86,10 @@ class ChatRepository:
             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         ''', (chat_id, prompt, response, timestamp, embedding, model_type, 
               language_model, response_length, execution_time, generated_at))
+        message_id = cursor.lastrowid
         conn.commit()
         conn.close()
+        return message_id
     
     @staticmethod
     def get_chat_history(chat_id: int) -> List[Dict]:
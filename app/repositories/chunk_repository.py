@@ -0,0 +1,207 @@
+"""Repository for the shared content-addressed chunk store"""
+from typing import Dict, List, Tuple
+from app.repositories.database import get_db_connection
+
+# Stay below SQLite's host-parameter limit in IN (...) lookups
+LOOKUP_BATCH_SIZE = 500
+
+
+class ChunkRepository:
+    """Handle chunk store database operations"""
+
+    @staticmethod
+    def get_chunks_by_hash(chunk_hashes: List[str], embedding_model: str,
+                           lease_seconds: int = 0) -> Dict[str, Tuple[int, bytes]]:
+        """
+        Get stored chunks for the given hashes as {hash: (chunk_id, embedding)}
+
+        Args:
+            lease_seconds: Keep the found chunks from garbage collection this
+                long, so a build can reference them even if the RAG holding
+                them drops them meanwhile. Leased in the same transaction as
+                the lookup, so a concurrent collection deletes a chunk either
+                before it is found or not at all.
+        """
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        found = {}
+        for start in range(0, len(chunk_hashes), LOOKUP_BATCH_SIZE):
+            batch = chunk_hashes[start:start + LOOKUP_BATCH_SIZE]
+            placeholders = ",".join("?" * len(batch))
+            if lease_seconds:
+                cursor.execute(f'''
+                    UPDATE chunks SET leased_until = MAX(COALESCE(leased_until, ''), datetime('now', ?))
+                    WHERE embedding_model = ? AND chunk_hash IN ({placeholders})
+                ''', (f"+{int(lease_seconds)} seconds", embedding_model, *batch))
+            cursor.execute(f'''
+                SELECT id, chunk_hash, embedding FROM chunks
+                WHERE embedding_model = ? AND chunk_hash IN ({placeholders})
+            ''', (embedding_model, *batch))
+            for row in cursor.fetchall():
+                found[row['chunk_hash']] = (row['id'], row['embedding'])
+        conn.commit()
+        conn.close()
+        return found
+
+    @staticmethod
+    def insert_chunks(rows: List[Tuple[str, str, str, bytes]], lease_seconds: int = 0) -> Dict[str, int]:
+        """
+        Insert new chunks
+
+        Args:
+            rows: (chunk_hash, embedding_model, content, embedding) tuples
+            lease_seconds: Keep the chunks from garbage collection this long,
+                until the build that inserted them references them
+
+        Returns:
+            {chunk_hash: chunk_id} for the given rows, including any inserted
+            concurrently by another build
+        """
+        lease = f"+{int(lease_seconds)} seconds"
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.executemany('''
+            INSERT OR IGNORE INTO chunks (chunk_hash, embedding_model, content, embedding)
+            VALUES (?, ?, ?, ?)
+        ''', rows)
+        chunk_ids = {}
+        for chunk_hash, embedding_model, _, _ in rows:
+            if lease_seconds:
+                cursor.execute('''
+                    UPDATE chunks SET leased_until = MAX(COALESCE(leased_until, ''), datetime('now', ?))
+                    WHERE chunk_hash = ? AND embedding_model = ?
+                ''', (lease, chunk_hash, embedding_model))
+            cursor.execute('''
+                SELECT id FROM chunks WHERE chunk_hash = ? AND embedding_model = ?
+            ''', (chunk_hash, embedding_model))
+            chunk_ids[chunk_hash] = cursor.fetchone()['id']
+        conn.commit()
+        conn.close()
+        return chunk_ids
+
+    @staticmethod
+    def _release(cursor, where: str, params: Tuple):
+        """Drop rag_chunks references matching a condition and decrement ref counts"""
+        cursor.execute(f'''
+            UPDATE chunks
+            SET ref_count = ref_count - (
+                SELECT COUNT(*) FROM rag_chunks
+                WHERE rag_chunks.chunk_id = chunks.id AND {where}
+            )
+            WHERE id IN (SELECT chunk_id FROM rag_chunks WHERE {where})
+        ''', params + params)
+        cursor.execute(f'DELETE FROM rag_chunks WHERE {where}', params)
+
+    @staticmethod
+    def replace_rag_chunks(rag_id: int, references: List[Tuple[int, str]]):
+        """
+        Point a RAG's index at a new list of chunks in one transaction
+
+        Args:
+            rag_id: RAG project ID
+            references: (chunk_id, doc_path) per index position
+
+        Raises:
+            LookupError: If a referenced chunk no longer exists (its lease ran
+                out before the build finished); nothing is changed then
+        """
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        ChunkRepository._release(cursor, 'rag_id = ?', (rag_id,))
+        cursor.executemany('''
+            INSERT INTO rag_chunks (rag_id, position, chunk_id, doc_path)
+            VALUES (?, ?, ?, ?)
+        ''', [(rag_id, position, chunk_id, doc_path)
+              for position, (chunk_id, doc_path) in enumerate(references)])
+        missing = set()
+        for chunk_id, _ in references:
+            cursor.execute('''
+                UPDATE chunks SET ref_count = ref_count + 1 WHERE id = ?
+            ''', (chunk_id,))
+            if cursor.rowcount == 0:
+                missing.add(chunk_id)
+        if missing:
+            conn.rollback()
+            conn.close()
+            raise LookupError(f"{len(missing)} chunks referenced by RAG {rag_id} were garbage collected")
+        conn.commit()
+        conn.close()
+
+    @staticmethod
+    def get_rag_chunks(rag_id: int) -> List[Dict]:
+        """Get a RAG's chunks (position, chunk_id, content, embedding) in index order"""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT rag_chunks.position, rag_chunks.chunk_id, chunks.content, chunks.embedding
+            FROM rag_chunks
+            JOIN chunks ON chunks.id = rag_chunks.chunk_id
+            WHERE rag_chunks.rag_id = ?
+            ORDER BY rag_chunks.position
+        ''', (rag_id,))
+        rows = cursor.fetchall()
+        conn.close()
+        return [dict(row) for row in rows]
+
+    @staticmethod
+    def get_rag_references(rag_id: int) -> List[Dict]:
+        """Get a RAG's chunk references (position, chunk_id, doc_path, chunk_hash) without content"""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT rag_chunks.position, rag_chunks.chunk_id, rag_chunks.doc_path, chunks.chunk_hash
+            FROM rag_chunks
+            JOIN chunks ON chunks.id = rag_chunks.chunk_id
+            WHERE rag_chunks.rag_id = ?
+            ORDER BY rag_chunks.position
+        ''', (rag_id,))
+        rows = cursor.fetchall()
+        conn.close()
+        return [dict(row) for row in rows]
+
+    @staticmethod
+    def release_document(rag_id: int, doc_path: str):
+        """Drop a document's chunk references from a RAG"""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        ChunkRepository._release(cursor, 'rag_id = ? AND doc_path = ?', (rag_id, doc_path))
+        conn.commit()
+        conn.close()
+
+    @staticmethod
+    def release_rag(rag_id: int):
+        """Drop all chunk references of a RAG"""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        ChunkRepository._release(cursor, 'rag_id = ?', (rag_id,))
+        conn.commit()
+        conn.close()
+
+    @staticmethod
+    def delete_unreferenced_chunks() -> int:
+        """Delete chunks no RAG references and no build holds a lease on; returns the number deleted"""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            DELETE FROM chunks
+            WHERE ref_count <= 0 AND (leased_until IS NULL OR leased_until <= datetime('now'))
+        ''')
+        deleted = cursor.rowcount
+        conn.commit()
+        conn.close()
+        return deleted
+
+    @staticmethod
+    def get_stats() -> Dict:
+        """Get chunk store totals"""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT COUNT(*) AS unique_chunks,
+                   COALESCE(SUM(ref_count), 0) AS references_total,
+                   COALESCE(SUM(LENGTH(content) + LENGTH(embedding)), 0) AS stored_bytes
+            FROM chunks
+        ''')
+        row = cursor.fetchone()
+        conn.close()
+        return dict(row)
@@ -1,11 +1,41 @@
 """Database connection and initialization"""
 import sqlite3
 from app.config import config
+from app.utils.metrics import stage_seconds
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that records statement execution time in the sqlite stage histogram"""
+    
+    def execute(self, *args, **kwargs):
+        with stage_seconds.time(pipeline='db', stage='sqlite'):
+            return super().execute(*args, **kwargs)
+    
+    def executemany(self, *args, **kwargs):
+        with stage_seconds.time(pipeline='db', stage='sqlite'):
+            return super().executemany(*args, **kwargs)
+    
+    def executescript(self, *args, **kwargs):
+        with stage_seconds.time(pipeline='db', stage='sqlite'):
+            return super().executescript(*args, **kwargs)
+
+
+class TimedConnection(sqlite3.Connection):
+    """Connection whose cursors are TimedCursors"""
+    
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+    
+    def execute(self, *args, **kwargs):
+        return self.cursor().execute(*args, **kwargs)
+    
+    def executemany(self, *args, **kwargs):
+        return self.cursor().executemany(*args, **kwargs)
 
 
 def get_db_connection():
     """Get database connection"""
-    conn = sqlite3.connect(config.DATABASE_PATH)
+    conn = sqlite3.connect(config.DATABASE_PATH, factory=TimedConnection)
     conn.row_factory = sqlite3.Row
     return conn
 
@@ -56,8 +86,11 @@ def init_db():
                 embedding_model VARCHAR(255),
                 vector_db VARCHAR(50),
                 chunk_size INTEGER,
+                index_spec TEXT,
                 prompt_template TEXT,
                 project_purpose TEXT,
+                refresh_interval_minutes INTEGER,
+                last_refreshed_at TIMESTAMP,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         ''')
@@ -72,6 +105,10 @@ def init_db():
                 file_path TEXT,
                 doc_link TEXT,
                 description TEXT,
+                content_hash TEXT,
+                etag TEXT,
+                last_modified TEXT,
+                last_fetched_at TIMESTAMP,
                 added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 FOREIGN KEY (rag_id) REFERENCES rag(id) ON DELETE CASCADE
@@ -83,6 +120,9 @@ def init_db():
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 rag_id INTEGER NOT NULL,
                 session_name VARCHAR(255),
+                summary TEXT,
+                summarized_message_id INTEGER,
+                summary_updated_at TIMESTAMP,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 FOREIGN KEY (rag_id) REFERENCES rag(id) ON DELETE CASCADE
             )
@@ -99,6 +139,89 @@ def init_db():
             )
         ''')
 
+        # Content-addressed chunk store shared by all RAG projects. Each chunk
+        # is stored and embedded once per embedding model; rag_chunks holds the
+        # references that ref_count tracks for garbage collection.
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS chunks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                chunk_hash CHAR(64) NOT NULL,
+                embedding_model VARCHAR(255) NOT NULL,
+                content TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                ref_count INTEGER NOT NULL DEFAULT 0,
+                leased_until TIMESTAMP,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE (chunk_hash, embedding_model)
+            )
+        ''')
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS rag_chunks (
+                rag_id INTEGER NOT NULL,
+                position INTEGER NOT NULL,
+                chunk_id INTEGER NOT NULL,
+                doc_path TEXT,
+                PRIMARY KEY (rag_id, position),
+                FOREIGN KEY (rag_id) REFERENCES rag(id) ON DELETE CASCADE,
+                FOREIGN KEY (chunk_id) REFERENCES chunks(id)
+            )
+        ''')
+
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_rag_chunks_chunk_id ON rag_chunks (chunk_id)
+        ''')
+
+        # Outcome of each scheduled or manual refresh of a RAG's link documents
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS link_refresh_reports (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                rag_id INTEGER NOT NULL,
+                links_checked INTEGER,
+                links_unchanged INTEGER,
+                links_changed INTEGER,
+                links_failed INTEGER,
+                chunks_reused INTEGER,
+                chunks_added INTEGER,
+                chunks_removed INTEGER,
+                seconds FLOAT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (rag_id) REFERENCES rag(id) ON DELETE CASCADE
+            )
+        ''')
+
+        # Per-stage latency and token accounting of every chat and RAG turn
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS chat_turn_stats (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                pipeline VARCHAR(10) NOT NULL,
+                rag_id INTEGER,
+                session_id INTEGER NOT NULL,
+                message_id INTEGER NOT NULL,
+                model_type VARCHAR(50),
+                model_name VARCHAR(255),
+                total_ms FLOAT,
+                ttft_ms FLOAT,
+                index_load_ms FLOAT,
+                embedding_ms FLOAT,
+                retrieval_ms FLOAT,
+                rerank_ms FLOAT,
+                llm_ms FLOAT,
+                web_search_ms FLOAT,
+                prompt_tokens INTEGER,
+                completion_tokens INTEGER,
+                tokens_estimated INTEGER DEFAULT 0,
+                cache_hits INTEGER DEFAULT 0,
+                cache_misses INTEGER DEFAULT 0,
+                trace_id CHAR(32),
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_chat_turn_stats_created_at ON chat_turn_stats (created_at)
+        ''')
+
         conn.commit()
         
         # Run migrations to add missing columns
@@ -118,6 +241,15 @@ def _run_migrations(cursor):
         if 'project_purpose' not in columns:
             cursor.execute('ALTER TABLE rag ADD COLUMN project_purpose TEXT')
         
+        if 'index_spec' not in columns:
+            cursor.execute('ALTER TABLE rag ADD COLUMN index_spec TEXT')
+        
+        if 'refresh_interval_minutes' not in columns:
+            cursor.execute('ALTER TABLE rag ADD COLUMN refresh_interval_minutes INTEGER')
+        
+        if 'last_refreshed_at' not in columns:
+            cursor.execute('ALTER TABLE rag ADD COLUMN last_refreshed_at TIMESTAMP')
+        
         # Check rag_documents table columns
         cursor.execute("PRAGMA table_info(rag_documents)")
         doc_columns = [column[1] for column in cursor.fetchall()]
@@ -137,6 +269,46 @@ def _run_migrations(cursor):
         if 'created_at' not in doc_columns:
             cursor.execute('ALTER TABLE rag_documents ADD COLUMN created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP')
         
+        if 'content_hash' not in doc_columns:
+            cursor.execute('ALTER TABLE rag_documents ADD COLUMN content_hash TEXT')
+        
+        if 'etag' not in doc_columns:
+            cursor.execute('ALTER TABLE rag_documents ADD COLUMN etag TEXT')
+        
+        if 'last_modified' not in doc_columns:
+            cursor.execute('ALTER TABLE rag_documents ADD COLUMN last_modified TEXT')
+        
+        if 'last_fetched_at' not in doc_columns:
+            cursor.execute('ALTER TABLE rag_documents ADD COLUMN last_fetched_at TIMESTAMP')
+        
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_rag_documents_hash ON rag_documents (rag_id, content_hash)
+        ''')
+        
+        # Builds lease the chunks they resolve until they reference them
+        cursor.execute("PRAGMA table_info(chunks)")
+        chunk_columns = [column[1] for column in cursor.fetchall()]
+        
+        if 'leased_until' not in chunk_columns:
+            cursor.execute('ALTER TABLE chunks ADD COLUMN leased_until TIMESTAMP')
+        
+        # Rolling summary of RAG chat sessions
+        cursor.execute("PRAGMA table_info(rag_chat_sessions)")
+        session_columns = [column[1] for column in cursor.fetchall()]
+        
+        if 'summary' not in session_columns:
+            cursor.execute('ALTER TABLE rag_chat_sessions ADD COLUMN summary TEXT')
+        
+        if 'summarized_message_id' not in session_columns:
+            cursor.execute('ALTER TABLE rag_chat_sessions ADD COLUMN summarized_message_id INTEGER')
+        
+        if 'summary_updated_at' not in session_columns:
+            cursor.execute('ALTER TABLE rag_chat_sessions ADD COLUMN summary_updated_at TIMESTAMP')
+        
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_rag_chat_messages_session ON rag_chat_messages (session_id, id)
+        ''')
+    
     except sqlite3.Error as e:
         print(f"Migration error: {e}")
         # Continue with app startup even if migration fails
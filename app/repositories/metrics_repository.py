@@ -0,0 +1,96 @@
+"""Repository for persisted chat turn statistics"""
+from typing import Dict, List, Optional, Sequence
+from app.repositories.database import get_db_connection
+
+TURN_COLUMNS = (
+    'pipeline', 'rag_id', 'session_id', 'message_id', 'model_type', 'model_name',
+    'total_ms', 'ttft_ms', 'index_load_ms', 'embedding_ms', 'retrieval_ms', 'rerank_ms',
+    'llm_ms', 'web_search_ms', 'prompt_tokens', 'completion_tokens', 'tokens_estimated',
+    'cache_hits', 'cache_misses', 'trace_id',
+)
+# Columns a percentile report can be computed over
+TURN_METRICS = (
+    'total_ms', 'ttft_ms', 'index_load_ms', 'embedding_ms', 'retrieval_ms', 'rerank_ms',
+    'llm_ms', 'web_search_ms', 'prompt_tokens', 'completion_tokens',
+)
+# Report grouping -> SQL expression
+TURN_GROUPS = {
+    'rag': 'rag_id',
+    'model': 'model_name',
+    'provider': 'model_type',
+    'pipeline': 'pipeline',
+}
+PERCENTILES = (50, 90, 95, 99)
+
+
+class MetricsRepository:
+    """Handle chat turn statistics database operations"""
+
+    @staticmethod
+    def add_turn_stats(row: Dict) -> int:
+        """Store the statistics of one chat turn (see TurnStats.to_row)"""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            INSERT INTO chat_turn_stats ({", ".join(TURN_COLUMNS)})
+            VALUES ({", ".join("?" * len(TURN_COLUMNS))})
+        ''', tuple(row.get(column) for column in TURN_COLUMNS))
+        stats_id = cursor.lastrowid
+        conn.commit()
+        conn.close()
+        return stats_id
+
+    @staticmethod
+    def get_turn_percentiles(group_by: str = 'rag', hours: float = 24, pipeline: Optional[str] = None,
+                             metrics: Sequence[str] = TURN_METRICS) -> Dict[str, List[Dict]]:
+        """
+        Nearest-rank percentiles of turn statistics per group over a time window
+
+        Args:
+            group_by: 'rag', 'model', 'provider' or 'pipeline'
+            hours: Only turns from the last this many hours
+            pipeline: Only 'chat' or 'rag' turns if given
+
+        Returns:
+            {metric: [{group, count, mean, max, p50, p90, p95, p99}, ...]}
+            with one entry per group that has values for the metric
+        """
+        if group_by not in TURN_GROUPS:
+            raise ValueError(f"Unsupported grouping: {group_by}. Available groupings: {list(TURN_GROUPS)}")
+        unknown = [metric for metric in metrics if metric not in TURN_METRICS]
+        if unknown:
+            raise ValueError(f"Unsupported metrics: {unknown}. Available metrics: {list(TURN_METRICS)}")
+
+        group = TURN_GROUPS[group_by]
+        conditions = ["created_at >= datetime('now', ?)", f"{group} IS NOT NULL"]
+        params = [f"-{float(hours)} hours"]
+        if pipeline:
+            conditions.append("pipeline = ?")
+            params.append(pipeline)
+        # Rank values within each group; the p-th percentile is the smallest
+        # value whose rank reaches p% of the group's count
+        percentile_columns = ",\n".join(
+            f"MIN(CASE WHEN row_rank >= {p / 100} * n THEN value END) AS p{p}" for p in PERCENTILES
+        )
+
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        report = {}
+        for metric in metrics:
+            cursor.execute(f'''
+                WITH ranked AS (
+                    SELECT {group} AS grp, {metric} AS value,
+                           ROW_NUMBER() OVER (PARTITION BY {group} ORDER BY {metric}) AS row_rank,
+                           COUNT(*) OVER (PARTITION BY {group}) AS n
+                    FROM chat_turn_stats
+                    WHERE {" AND ".join(conditions)} AND {metric} IS NOT NULL
+                )
+                SELECT grp AS "group", COUNT(*) AS count, AVG(value) AS mean, MAX(value) AS max,
+                       {percentile_columns}
+                FROM ranked
+                GROUP BY grp
+                ORDER BY grp
+            ''', params)
+            report[metric] = [dict(row) for row in cursor.fetchall()]
+        conn.close()
+        return report
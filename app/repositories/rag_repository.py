@@ -63,6 +63,47 @@ class RAGRepository:
         conn.commit()
         conn.close()
     
+    @staticmethod
+    def update_rag_index_spec(rag_id: int, index_spec: str):
+        """Update RAG FAISS index spec (JSON)"""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE rag 
+            SET index_spec = ?
+            WHERE id = ?
+        ''', (index_spec, rag_id))
+        conn.commit()
+        conn.close()
+    
+    @staticmethod
+    def update_refresh_schedule(rag_id: int, interval_minutes: Optional[int]):
+        """Set how often a RAG's link documents are refreshed (None disables it)"""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE rag 
+            SET refresh_interval_minutes = ?
+            WHERE id = ?
+        ''', (interval_minutes, rag_id))
+        conn.commit()
+        conn.close()
+    
+    @staticmethod
+    def get_rags_due_for_refresh() -> List[Dict]:
+        """Get RAGs with a refresh schedule whose interval has elapsed"""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT * FROM rag 
+            WHERE refresh_interval_minutes > 0
+              AND (last_refreshed_at IS NULL
+                   OR last_refreshed_at <= datetime('now', '-' || refresh_interval_minutes || ' minutes'))
+        ''')
+        rows = cursor.fetchall()
+        conn.close()
+        return [dict(row) for row in rows]
+    
     @staticmethod
     def update_rag_prompt_template(rag_id: int, prompt_template: str):
         """Update RAG prompt template"""
@@ -90,7 +131,8 @@ class RAGRepository:
         conn.close()
     
     @staticmethod
-    def add_document(rag_id: int, doc_type: str, doc_path: str, description: str = ""):
+    def add_document(rag_id: int, doc_type: str, doc_path: str, description: str = "",
+                     content_hash: str = None):
         """Add a document to RAG"""
         conn = get_db_connection()
         cursor = conn.cursor()
@@ -107,9 +149,9 @@ class RAGRepository:
             import os
             doc_name = os.path.basename(doc_path)  # Extract filename
             cursor.execute('''
-                INSERT INTO rag_documents (rag_id, doc_name, doc_type, file_path, description)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (rag_id, doc_name, doc_type, doc_path, description))
+                INSERT INTO rag_documents (rag_id, doc_name, doc_type, file_path, description, content_hash)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (rag_id, doc_name, doc_type, doc_path, description, content_hash))
         
         conn.commit()
         conn.close()
@@ -151,6 +193,94 @@ class RAGRepository:
         conn.close()
         return [dict(row) for row in rows]
     
+    @staticmethod
+    def get_document_by_hash(rag_id: int, content_hash: str) -> Optional[Dict]:
+        """Get a RAG's document with the given content hash"""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT doc_name, doc_type, file_path AS doc_path, content_hash
+            FROM rag_documents
+            WHERE rag_id = ? AND content_hash = ?
+        ''', (rag_id, content_hash))
+        row = cursor.fetchone()
+        conn.close()
+        return dict(row) if row else None
+    
+    @staticmethod
+    def get_document_hash(rag_id: int, doc_path: str) -> Optional[str]:
+        """Get the content hash of a RAG's uploaded document"""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT content_hash FROM rag_documents
+            WHERE rag_id = ? AND file_path = ?
+        ''', (rag_id, doc_path))
+        row = cursor.fetchone()
+        conn.close()
+        return row['content_hash'] if row else None
+    
+    @staticmethod
+    def get_link_documents(rag_id: int) -> List[Dict]:
+        """Get a RAG's link documents with their HTTP validators"""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT doc_link AS url, etag, last_modified, last_fetched_at
+            FROM rag_documents 
+            WHERE rag_id = ? AND doc_type = 'link'
+        ''', (rag_id,))
+        rows = cursor.fetchall()
+        conn.close()
+        return [dict(row) for row in rows]
+    
+    @staticmethod
+    def update_link_validators(rag_id: int, url: str, etag: Optional[str], last_modified: Optional[str]):
+        """Record the ETag and Last-Modified of a link's latest fetch"""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE rag_documents 
+            SET etag = ?, last_modified = ?, last_fetched_at = CURRENT_TIMESTAMP
+            WHERE rag_id = ? AND doc_type = 'link' AND doc_link = ?
+        ''', (etag, last_modified, rag_id, url))
+        conn.commit()
+        conn.close()
+    
+    @staticmethod
+    def add_refresh_report(rag_id: int, report: Dict) -> int:
+        """Store a link refresh report and mark the RAG as refreshed"""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO link_refresh_reports (
+                rag_id, links_checked, links_unchanged, links_changed, links_failed,
+                chunks_reused, chunks_added, chunks_removed, seconds
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (rag_id, report['links_checked'], report['links_unchanged'], report['links_changed'],
+              report['links_failed'], report['chunks_reused'], report['chunks_added'],
+              report['chunks_removed'], report['seconds']))
+        report_id = cursor.lastrowid
+        cursor.execute('UPDATE rag SET last_refreshed_at = CURRENT_TIMESTAMP WHERE id = ?', (rag_id,))
+        conn.commit()
+        conn.close()
+        return report_id
+    
+    @staticmethod
+    def get_refresh_reports(rag_id: int, limit: int = 20) -> List[Dict]:
+        """Get a RAG's most recent link refresh reports"""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT * FROM link_refresh_reports 
+            WHERE rag_id = ?
+            ORDER BY id DESC
+            LIMIT ?
+        ''', (rag_id, limit))
+        rows = cursor.fetchall()
+        conn.close()
+        return [dict(row) for row in rows]
+    
     @staticmethod
     def delete_document(rag_id: int, doc_path: str):
         """Delete a document from RAG"""
@@ -163,6 +293,23 @@ class RAGRepository:
         conn.commit()
         conn.close()
     
+    @staticmethod
+    def delete_rag(rag_id: int):
+        """Delete a RAG with its documents and chat sessions"""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            DELETE FROM rag_chat_messages 
+            WHERE session_id IN (SELECT id FROM rag_chat_sessions WHERE rag_id = ?)
+        ''', (rag_id,))
+        cursor.execute('DELETE FROM rag_chat_sessions WHERE rag_id = ?', (rag_id,))
+        cursor.execute('DELETE FROM chat_turn_stats WHERE rag_id = ?', (rag_id,))
+        cursor.execute('DELETE FROM rag_documents WHERE rag_id = ?', (rag_id,))
+        cursor.execute('DELETE FROM link_refresh_reports WHERE rag_id = ?', (rag_id,))
+        cursor.execute('DELETE FROM rag WHERE id = ?', (rag_id,))
+        conn.commit()
+        conn.close()
+    
     @staticmethod
     def create_chat_session(rag_id: int, session_name: str) -> int:
         """Create a new chat session"""
@@ -192,7 +339,7 @@ class RAGRepository:
         return [dict(row) for row in rows]
     
     @staticmethod
-    def add_chat_message(session_id: int, user_message: str, bot_response: str):
+    def add_chat_message(session_id: int, user_message: str, bot_response: str) -> int:
         """Add a chat message"""
         conn = get_db_connection()
         cursor = conn.cursor()
@@ -200,8 +347,10 @@ class RAGRepository:
             INSERT INTO rag_chat_messages (session_id, user_message, bot_response)
             VALUES (?, ?, ?)
         ''', (session_id, user_message, bot_response))
+        message_id = cursor.lastrowid
         conn.commit()
         conn.close()
+        return message_id
     
     @staticmethod
     def get_chat_history(session_id: int) -> List[Dict]:
@@ -217,6 +366,71 @@ class RAGRepository:
         conn.close()
         return [dict(row) for row in rows]
     
+    @staticmethod
+    def get_session_memory(session_id: int, limit: int = None) -> Tuple[Optional[Dict], List[Dict]]:
+        """
+        Get a session's rolling summary and its messages not yet folded into it
+        
+        Returns:
+            (session row with summary and summarized_message_id, or None if the
+            session does not exist; the last limit (default all) unsummarized
+            messages, oldest first)
+        """
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT id, rag_id, summary, summarized_message_id FROM rag_chat_sessions WHERE id = ?
+        ''', (session_id,))
+        session = cursor.fetchone()
+        if session is None:
+            conn.close()
+            return None, []
+        cursor.execute('''
+            SELECT id, user_message, bot_response FROM rag_chat_messages
+            WHERE session_id = ? AND id > ?
+            ORDER BY id DESC
+            LIMIT ?
+        ''', (session_id, session['summarized_message_id'] or 0, -1 if limit is None else limit))
+        rows = cursor.fetchall()
+        conn.close()
+        return dict(session), [dict(row) for row in reversed(rows)]
+    
+    @staticmethod
+    def count_unsummarized_messages(session_id: int) -> int:
+        """Count a session's messages not yet folded into its rolling summary"""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT COUNT(*) FROM rag_chat_messages m
+            JOIN rag_chat_sessions s ON s.id = m.session_id
+            WHERE m.session_id = ? AND m.id > COALESCE(s.summarized_message_id, 0)
+        ''', (session_id,))
+        count = cursor.fetchone()[0]
+        conn.close()
+        return count
+    
+    @staticmethod
+    def update_session_summary(session_id: int, summary: str, summarized_message_id: int,
+                               previous_message_id: Optional[int]) -> bool:
+        """
+        Store a session's new rolling summary
+        
+        Returns:
+            False, storing nothing, if the summary was updated since
+            previous_message_id was read
+        """
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE rag_chat_sessions
+            SET summary = ?, summarized_message_id = ?, summary_updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND COALESCE(summarized_message_id, 0) = ?
+        ''', (summary, summarized_message_id, session_id, previous_message_id or 0))
+        updated = cursor.rowcount == 1
+        conn.commit()
+        conn.close()
+        return updated
+    
     @staticmethod
     def update_chat_session_name(session_id: int, name: str):
         """Update chat session name"""
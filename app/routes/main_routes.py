@@ -1,6 +1,8 @@
 """Main application routes"""
-from flask import Blueprint, render_template
+from flask import Blueprint, Response, jsonify, render_template, request
+from app.repositories.metrics_repository import TURN_METRICS, MetricsRepository
 from app.services.rag_service import rag_service
+from app.utils.metrics import registry
 
 main_bp = Blueprint('main', __name__)
 
@@ -20,3 +22,34 @@ def panel():
         if rag['status'] != 'ready':
             rag['next_step_url'] = rag_service.get_next_step_url(rag['id'])
     return render_template("panel.html", rags=rags)
+
+
+@main_bp.route("/metrics")
+def metrics():
+    """Prometheus scrape endpoint (text exposition format)"""
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
+@main_bp.route("/metrics/turns")
+def turn_metrics():
+    """
+    Percentiles of persisted chat turn latencies and token counts
+
+    Query parameters: group_by ('rag', 'model', 'provider' or 'pipeline'),
+    hours (window, default 24), pipeline ('chat' or 'rag') and metrics
+    (comma-separated columns, default all).
+    """
+    try:
+        group_by = request.args.get('group_by', 'rag')
+        hours = float(request.args.get('hours', 24))
+        pipeline = request.args.get('pipeline') or None
+        metrics = request.args.get('metrics')
+        metrics = [metric.strip() for metric in metrics.split(',')] if metrics else TURN_METRICS
+        return jsonify({
+            "group_by": group_by,
+            "hours": hours,
+            "pipeline": pipeline,
+            "metrics": MetricsRepository.get_turn_percentiles(group_by, hours, pipeline, metrics)
+        })
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
@@ -1,10 +1,13 @@
 """RAG routes"""
 import os
 from flask import Blueprint, render_template, request, jsonify, redirect, url_for
-from werkzeug.utils import secure_filename
 import requests
+from werkzeug.exceptions import RequestEntityTooLarge
+from app.services.link_refresh_service import link_refresh_service
 from app.services.rag_service import rag_service
 from app.config import config
+from app.utils.file_utils import FileTooLargeError, save_text_document, save_uploaded_file
+from app.utils.index_utils import index_spec_from_form, parse_index_spec
 
 rag_bp = Blueprint('rag_creator', __name__)
 
@@ -60,15 +63,33 @@ def db_embedding_selection(rag_id):
         vector_db = request.form.get("vector_db")
         chunk_size = int(request.form.get("chunk_size", config.DEFAULT_CHUNK_SIZE))
         project_purpose = request.form.get("project_purpose", "")
+        try:
+            index_spec = index_spec_from_form(request.form)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         
-        rag_service.update_vector_db_config(rag_id, embedding_model, vector_db, chunk_size)
+        rag_service.update_vector_db_config(rag_id, embedding_model, vector_db, chunk_size, index_spec)
         if project_purpose:
             rag_service.repo.update_rag_project_purpose(rag_id, project_purpose)
         
         return redirect(url_for('rag_creator.documentation_upload', rag_id=rag_id))
     
     rag = rag_service.get_rag(rag_id)
-    return render_template('db_embedding_selection.html', rag=rag)
+    index_spec = parse_index_spec(rag.get('index_spec')) if rag else parse_index_spec(None)
+    return render_template('db_embedding_selection.html', rag=rag, index_spec=index_spec)
+
+
+@rag_bp.route("/<int:rag_id>/search-params", methods=["POST"])
+def update_search_params(rag_id):
+    """Tune query-time FAISS parameters (ef_search, nprobe) without rebuilding"""
+    try:
+        data = request.get_json() or {}
+        index_spec = rag_service.update_search_params(rag_id, data)
+        return jsonify({"index_spec": index_spec})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
 
 @rag_bp.route("/<int:rag_id>/documentation", methods=["GET", "POST"])
@@ -79,19 +100,21 @@ def documentation_upload(rag_id):
             doc_type = request.form.get('doc_type')
             description = request.form.get('description', '')
             
+            upload_dir = os.path.join(config.UPLOAD_FOLDER, str(rag_id))
+            duplicates = []
+            
             if doc_type == 'pdf':
-                # Handle file upload
+                # Handle file upload: streamed, size-checked and stored by content hash
                 if 'file' in request.files:
                     files = request.files.getlist('file')
                     for file in files:
                         if file and file.filename:
-                            filename = secure_filename(file.filename)
-                            upload_dir = os.path.join(config.UPLOAD_FOLDER, str(rag_id))
-                            os.makedirs(upload_dir, exist_ok=True)
-                            file_path = os.path.join(upload_dir, filename)
-                            file.save(file_path)
-                            
-                            rag_service.add_document(rag_id, 'pdf', file_path, description)
+                            file_path, file_type, content_hash = save_uploaded_file(
+                                file, upload_dir, config.UPLOAD_FOLDER, config.MAX_FILE_SIZE
+                            )
+                            if not rag_service.add_document(rag_id, file_type, file_path, description,
+                                                            content_hash):
+                                duplicates.append(file.filename)
             
             elif doc_type == 'link':
                 # Handle URL
@@ -103,17 +126,11 @@ def documentation_upload(rag_id):
                 # Handle text content
                 text_content = request.form.get('text_content')
                 if text_content and text_content.strip():
-                    # Create text file
-                    upload_dir = os.path.join(config.UPLOAD_FOLDER, str(rag_id))
-                    os.makedirs(upload_dir, exist_ok=True)
-                    from datetime import datetime
-                    filename = f"text_doc_{datetime.now().strftime('%Y%m%d%H%M%S')}.txt"
-                    file_path = os.path.join(upload_dir, filename)
-                    
-                    with open(file_path, 'w', encoding='utf-8') as f:
-                        f.write(text_content)
-                    
-                    rag_service.add_document(rag_id, 'text', file_path, description)
+                    file_path, content_hash = save_text_document(
+                        text_content, upload_dir, config.UPLOAD_FOLDER, config.MAX_FILE_SIZE
+                    )
+                    if not rag_service.add_document(rag_id, 'text', file_path, description, content_hash):
+                        duplicates.append(os.path.basename(file_path))
             
             # Check if this is continue button (finish adding documents)
             if request.form.get('finish'):
@@ -121,11 +138,16 @@ def documentation_upload(rag_id):
             
             # Return success for AJAX requests
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-                return jsonify({"success": True})
+                return jsonify({"success": True, "duplicates": duplicates})
             
             # Otherwise return to same page to add more documents
             return redirect(url_for('rag_creator.documentation_upload', rag_id=rag_id))
             
+        except FileTooLargeError as e:
+            return jsonify({"error": str(e)}), 413
+        except RequestEntityTooLarge:
+            return jsonify({"error": f"Upload exceeds {config.MAX_FILES_PER_UPLOAD} files of "
+                                     f"{config.MAX_FILE_SIZE // (1024 * 1024)}MB"}), 413
         except Exception as e:
             return jsonify({"error": str(e)}), 500
     
@@ -164,17 +186,11 @@ def chat_with_rag(rag_id):
         if not session_id:
             session_id = rag_service.create_chat_session(rag_id, "Chat Session")
         
-        # Get chat history if session exists
-        chat_history = []
-        if session_id:
-            history = rag_service.get_chat_history(session_id)
-            chat_history = [
-                (msg['user_message'], msg['bot_response']) 
-                for msg in history
-            ]
+        # Recent turns and a summary of older ones, not the whole session
+        summary, chat_history = rag_service.get_session_memory(session_id)
         
         # Query RAG
-        result = rag_service.query_rag(rag_id, query, chat_history)
+        result = rag_service.query_rag(rag_id, query, chat_history, history_summary=summary)
         
         # Save message to session (pass rag_id for name generation)
         if session_id:
@@ -182,7 +198,8 @@ def chat_with_rag(rag_id):
                 session_id, 
                 query, 
                 result['answer'],
-                rag_id
+                rag_id,
+                turn_stats=result.get('turn_stats')
             )
         
         return jsonify({
@@ -314,6 +331,57 @@ def delete_document(rag_id):
         return jsonify({"error": str(e)}), 500
 
 
+@rag_bp.route("/<int:rag_id>/delete", methods=["POST"])
+def delete_rag(rag_id):
+    """Delete a RAG project"""
+    try:
+        if not rag_service.get_rag(rag_id):
+            return jsonify({"error": "RAG not found"}), 404
+        
+        rag_service.delete_rag(rag_id)
+        return jsonify({"message": "RAG deleted successfully"})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+
+@rag_bp.route("/<int:rag_id>/refresh-links", methods=["POST"])
+def refresh_links(rag_id):
+    """Refresh a RAG's link documents now and report which chunks changed"""
+    try:
+        report = link_refresh_service.refresh_rag(rag_id)
+        return jsonify(report)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@rag_bp.route("/<int:rag_id>/refresh-schedule", methods=["GET", "POST"])
+def refresh_schedule(rag_id):
+    """Get or set how often a RAG's link documents are refreshed"""
+    try:
+        rag = rag_service.get_rag(rag_id)
+        if not rag:
+            return jsonify({"error": "RAG not found"}), 404
+        
+        if request.method == "POST":
+            data = request.get_json(silent=True) or request.form
+            interval = data.get('interval_minutes')
+            interval = int(interval) if interval not in (None, '') else None
+            link_refresh_service.set_schedule(rag_id, interval)
+            rag = rag_service.get_rag(rag_id)
+        
+        return jsonify({
+            "interval_minutes": rag.get('refresh_interval_minutes'),
+            "last_refreshed_at": rag.get('last_refreshed_at'),
+            "reports": link_refresh_service.get_reports(rag_id)
+        })
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 # Legacy developer assistant routes - consolidated from old developer_routes.py
 @rag_bp.route("/developerassistant", methods=["GET", "POST"])
 @rag_bp.route("/developerassistant/<int:rag_id>", methods=["GET", "POST"])
@@ -338,17 +406,11 @@ def developer_assistant(rag_id=None):
             if not session_id:
                 session_id = rag_service.create_chat_session(rag_id, "New Session")
             
-            # Get chat history if session exists
-            chat_history = []
-            if session_id:
-                history = rag_service.get_chat_history(int(session_id))
-                chat_history = [
-                    (msg['user_message'], msg['bot_response']) 
-                    for msg in history
-                ]
+            # Recent turns and a summary of older ones, not the whole session
+            summary, chat_history = rag_service.get_session_memory(int(session_id))
             
             # Query RAG
-            result = rag_service.query_rag(rag_id, query, chat_history)
+            result = rag_service.query_rag(rag_id, query, chat_history, history_summary=summary)
             
             # Save message to session
             if session_id:
@@ -356,7 +418,8 @@ def developer_assistant(rag_id=None):
                     int(session_id),
                     query,
                     result['answer'],
-                    rag_id
+                    rag_id,
+                    turn_stats=result.get('turn_stats')
                 )
             
             return jsonify({
@@ -3,16 +3,19 @@ import json
 import time
 import numpy as np
 from datetime import datetime
-from typing import List, Tuple, Dict
+from typing import List, Dict
 from app.repositories.chat_repository import ChatRepository
+from app.repositories.metrics_repository import MetricsRepository
 from app.services.embedding_service import embedding_service
 from app.services.llm_service import llm_service
 from app.services.web_search_service import web_search_service
+from app.utils.context_packing import ContextItem, ContextPacker, context_budget
+from app.utils.metrics import stage_seconds
+from app.utils.tracing import current_span, traced
+from app.utils.turn_stats import TurnStats, record_turn
 # Token management constants
-MAX_CONTEXT_TOKENS = 6000
 MAX_RECENT_MESSAGES = 8  
 MAX_SIMILAR_MESSAGES = 2
-MAX_MESSAGE_LENGTH = 500
 SIMILARITY_THRESHOLD = 0.3
 
 class ChatService:
@@ -47,32 +50,37 @@ class ChatService:
             chat_id, language_model, model_type, api_key, temperature
         )
     
-    def _get_optimized_history(self, history: List[Dict], user_input: str) -> List[Tuple[str, str]]:
-        """Get optimized chat history to prevent token overflow"""
+    @staticmethod
+    def _format_turn(prompt: str, response: str) -> str:
+        return f"User: {prompt}\nAssistant: {response}"
+    
+    def _get_history_candidates(self, history: List[Dict], user_input: str) -> List[ContextItem]:
+        """
+        Earlier turns competing for the prompt's token budget
+        
+        The most recent turns come first, newest first, followed by the older
+        turns most similar to the user input. Positions keep the packed turns
+        in conversation order.
+        """
         if not history:
             return []
         
-        # 1. Get recent messages (sliding window)
-        recent_history = history[-MAX_RECENT_MESSAGES:] if len(history) > MAX_RECENT_MESSAGES else history
-        
-        formatted_history = []
+        # 1. Recent messages (sliding window), newest first
+        recent_start = max(len(history) - MAX_RECENT_MESSAGES, 0)
+        candidates = [
+            ContextItem(self._format_turn(history[index]['prompt'], history[index]['chat_response']),
+                        priority=len(history) - index, position=index, truncatable=True)
+            for index in range(len(history) - 1, recent_start - 1, -1)
+        ]
         
-        # 2. Add recent messages with truncation
-        for msg in recent_history:
-            prompt = msg['prompt'][:MAX_MESSAGE_LENGTH]
-            response = msg['chat_response'][:MAX_MESSAGE_LENGTH]
-            formatted_history.append((prompt, response))
-        
-        # 3. Add similar messages only if we have older messages
-        if len(history) > MAX_RECENT_MESSAGES:
+        # 2. Similar messages, only if we have older messages
+        if recent_start > 0:
             try:
                 query_embedding = self.embedding_service.generate_embedding(user_input)
                 similarities = []
                 
                 # Only search in older messages (not recent ones)
-                older_history = history[:-MAX_RECENT_MESSAGES]
-                
-                for msg in older_history:
+                for index, msg in enumerate(history[:recent_start]):
                     if msg.get('embedding'):
                         try:
                             db_embedding = json.loads(msg['embedding'])
@@ -85,26 +93,67 @@ class ChatService:
                             
                             # Only add if similarity is meaningful
                             if similarity > SIMILARITY_THRESHOLD:
-                                similarities.append({
-                                    "prompt": msg['prompt'][:MAX_MESSAGE_LENGTH],
-                                    "response": msg['chat_response'][:MAX_MESSAGE_LENGTH],
-                                    "similarity": similarity
-                                })
+                                similarities.append((similarity, index))
                         except (json.JSONDecodeError, ValueError):
                             continue
                 
-                # Add top similar messages
-                sorted_results = sorted(similarities, key=lambda x: x["similarity"], reverse=True)
-                for item in sorted_results[:MAX_SIMILAR_MESSAGES]:
-                    formatted_history.append((item['prompt'], item['response']))
+                # Add top similar messages after the recent ones
+                similarities.sort(reverse=True)
+                for rank, (_, index) in enumerate(similarities[:MAX_SIMILAR_MESSAGES]):
+                    candidates.append(ContextItem(
+                        self._format_turn(history[index]['prompt'], history[index]['chat_response']),
+                        priority=MAX_RECENT_MESSAGES + 1 + rank, position=index, truncatable=True
+                    ))
                     
             except Exception as e:
                 print(f"Warning: Error in similarity search: {e}")
         
-        return formatted_history
+        return candidates
+    
+    @staticmethod
+    def _build_prompt_template(web_context: str = None, with_history: bool = True) -> str:
+        """Chat prompt template, with web search results and a chat_history variable if given"""
+        if web_context:
+            if with_history:
+                prompt_template = f"""Previous conversation context: {{chat_history}}
+
+                **IMPORTANT: You MUST use the following web search results to answer the user's question. Do not ignore this information:**
+
+                {web_context}
+
+                **Instructions: Base your response primarily on the web search results above. If the web results contain current information, use that instead of your training data.**
+
+                User: {{question}}
+                Assistant:"""
+            else:
+                prompt_template = f"""**IMPORTANT: You MUST use the following web search results to answer the user's question. Do not ignore this information:**
+
+                {web_context}
+
+                **Instructions: Base your response primarily on the web search results above. If the web results contain current information, use that instead of your training data.**
+
+                User: {{question}}
+                Assistant:"""
+        else:
+            if with_history:
+                prompt_template = """Previous conversation context: {chat_history}
+
+                User: {question}
+                Assistant:"""
+            else:
+                prompt_template = """User: {question}
+                Assistant:"""
+        return prompt_template
     
+    @traced("chat.process_message")
     def process_message(self, chat_id: int, user_input: str, web_search_enabled: bool = False) -> Dict:
         """Process a chat message and generate response"""
+        with record_turn('chat') as turn:
+            return self._process_message(chat_id, user_input, web_search_enabled, turn)
+    
+    def _process_message(self, chat_id: int, user_input: str, web_search_enabled: bool,
+                         turn: TurnStats) -> Dict:
+        """Process a chat message, accounting stage latencies and tokens to turn"""
         start_time = time.time()
         
         # Get chat configuration
@@ -114,6 +163,10 @@ class ChatService:
         
         if config['language_model'] == 'pending' or config['api_key'] == 'pending':
             raise ValueError("Please configure the chat model before sending messages")
+        current_span().set_attributes({'chat_id': chat_id, 'web_search_enabled': web_search_enabled,
+                                       'model_type': config['model_type'],
+                                       'model_name': config['language_model']})
+        turn.model_type, turn.model_name = config['model_type'], config['language_model']
         
         # Get chat history
         history = self.repo.get_chat_history(chat_id)
@@ -128,12 +181,14 @@ class ChatService:
             )
             self.repo.update_chat_name(chat_id, suggested_name)
         
-        # Smart history management to prevent token overflow
-        formatted_history = self._get_optimized_history(history, user_input)
+        # Token budget of the model, counted with its tokenizer
+        budget = context_budget(config['model_type'], config['language_model'])
+        packer = ContextPacker(config['language_model'])
         
         # Handle web search if enabled
         web_context = ""
         source_urls = []
+        web_search_info = {}
         if web_search_enabled:
             try:
                 # Enhance query for current events and factual information
@@ -142,52 +197,26 @@ class ChatService:
                     search_query = f"{user_input} 2025 current latest"
                 
                 print(f"Performing web search for: {search_query}")
-                web_context, source_urls = self.web_search_service.search_and_get_context_sync(search_query, num_results=5)
+                with stage_seconds.time(pipeline='chat', stage='web_search'):
+                    web_context, source_urls, web_search_info = self.web_search_service.search_and_get_context_sync(
+                        search_query, num_results=5, max_tokens=budget // 2,
+                        model_name=config['language_model']
+                    )
                 print(f"Web search completed. Found {len(source_urls)} sources.")
             except Exception as e:
                 print(f"Web search failed: {str(e)}")
                 web_context = f"Web search temporarily unavailable: {str(e)}"
         
-        # Create prompt template with optional web search context
-        if web_search_enabled and web_context and "Web search encountered an error" not in web_context:
-            if formatted_history:
-                prompt_template = f"""Previous conversation context: {{chat_history}}
-
-                **IMPORTANT: You MUST use the following web search results to answer the user's question. Do not ignore this information:**
-
-                {web_context}
-
-                **Instructions: Base your response primarily on the web search results above. If the web results contain current information, use that instead of your training data.**
-
-                User: {{question}}
-                Assistant:"""
-            else:
-                prompt_template = f"""**IMPORTANT: You MUST use the following web search results to answer the user's question. Do not ignore this information:**
-
-                {web_context}
-
-                **Instructions: Base your response primarily on the web search results above. If the web results contain current information, use that instead of your training data.**
-
-                User: {{question}}
-                Assistant:"""
-        else:
-            if formatted_history:
-                prompt_template = """Previous conversation context: {chat_history}
-
-                User: {question}
-                Assistant:"""
-            else:
-                prompt_template = """User: {question}
-                Assistant:"""
-        
-        # Check token limit before sending to model
-        estimated_tokens = self._get_total_context_tokens(formatted_history, user_input, prompt_template)
-        max_tokens = MAX_CONTEXT_TOKENS
-        
-        if estimated_tokens > max_tokens:
-            # Further reduce history if still too large
-            formatted_history = formatted_history[-4:] if len(formatted_history) > 4 else formatted_history
-            print(f"Warning: Reduced context due to token limit. Estimated tokens: {estimated_tokens}")
+        # Pack earlier turns into what the prompt and question leave of the budget
+        if not (web_search_enabled and web_context and "Web search encountered an error" not in web_context):
+            web_context = None
+        prompt_template = self._build_prompt_template(web_context, with_history=True)
+        history_budget = budget - packer.count(prompt_template) - packer.count(user_input)
+        packed_history = packer.pack(self._get_history_candidates(history, user_input), history_budget)
+        chat_history = "\n\n".join(item.text for item in packed_history)
+        if not packed_history:
+            prompt_template = self._build_prompt_template(web_context, with_history=False)
+        current_span().set_attributes({'context_budget': budget, 'history_turns': len(packed_history)})
         
         # Get LLM and generate response
         llm = self.llm_service.get_llm(
@@ -200,7 +229,10 @@ class ChatService:
             llm, prompt_template, ["chat_history", "question"]
         )
         
-        response = chat_chain.run(chat_history=formatted_history, question=user_input)
+        response = chat_chain.run(
+            chat_history=chat_history, question=user_input,
+            callbacks=self.llm_service.metrics_callbacks(config['model_type'], 'chat')
+        )
         
         # Add source URLs to response if web search was used
         if web_search_enabled and source_urls:
@@ -219,11 +251,13 @@ class ChatService:
         embedding_json = json.dumps(embedding_vec)
         
         # Save to database
-        self.repo.add_chat_message(
+        turn.finish()
+        message_id = self.repo.add_chat_message(
             chat_id, user_input, response, embedding_json,
             config['model_type'], config['language_model'],
             response_length, execution_time, generated_at
         )
+        MetricsRepository.add_turn_stats({**turn.to_row(), 'session_id': chat_id, 'message_id': message_id})
         
         return {
             "response": response,
@@ -233,20 +267,14 @@ class ChatService:
                 "execution_time": execution_time,
                 "generated_at": generated_at,
                 "web_search_enabled": web_search_enabled,
-                "source_urls": source_urls if web_search_enabled else []
+                "source_urls": source_urls if web_search_enabled else [],
+                "web_search": {
+                    "searched": web_search_info.get("searched", 0),
+                    "crawled_sources": web_search_info.get("crawled_sources", []),
+                    "deadline_reached": web_search_info.get("deadline_reached", False)
+                } if web_search_enabled else None
             }
         }
-    
-    def _estimate_tokens(self, text: str) -> int:
-        """Rough token estimation (1 token ≈ 4 characters for most models)"""
-        return len(text) // 4
-    
-    def _get_total_context_tokens(self, formatted_history: List[Tuple[str, str]], 
-                                user_input: str, prompt_template: str) -> int:
-        """Estimate total tokens that will be sent to the model"""
-        history_text = "\n".join([f"User: {h[0]}\nAssistant: {h[1]}" for h in formatted_history])
-        full_prompt = prompt_template.format(chat_history=history_text, question=user_input)
-        return self._estimate_tokens(full_prompt)
 
 
 # Singleton instance
@@ -0,0 +1,152 @@
+"""Content-addressed chunk store shared across RAG projects"""
+import hashlib
+import threading
+from typing import Callable, Dict, List, Tuple
+import numpy as np
+from app.config import config
+from app.repositories.chunk_repository import ChunkRepository
+from app.utils.metrics import cache_requests
+
+
+class ChunkStoreService:
+    """
+    Store each distinct chunk once per embedding model
+
+    Chunks are keyed by the SHA-256 of their text plus the embedding model, so
+    the same framework docs or PDF indexed by several RAG projects is embedded
+    and stored a single time. RAG indexes reference chunk ids; ref counts drop
+    when projects or documents are removed and unreferenced chunks are deleted.
+
+    Chunks a build resolves are leased for CHUNK_LEASE_SECONDS, so garbage
+    collection triggered by another build, a deletion or a link refresh does
+    not delete them before assign_to_rag references them.
+    """
+
+    def __init__(self):
+        self.repo = ChunkRepository()
+        self._rag_locks: Dict[int, threading.RLock] = {}
+        self._rag_locks_guard = threading.Lock()
+        self._generations: Dict[int, int] = {}
+
+    def rag_lock(self, rag_id: int) -> threading.RLock:
+        """
+        Lock serializing changes to a RAG's chunk references and vector store
+
+        Held by builds, document and RAG deletions and link refreshes, so none
+        of them interleaves its reference and index writes with another's.
+        """
+        with self._rag_locks_guard:
+            return self._rag_locks.setdefault(rag_id, threading.RLock())
+
+    def generation(self, rag_id: int) -> int:
+        """Counter bumped whenever a RAG's chunk references change, for caches of its index"""
+        with self._rag_locks_guard:
+            return self._generations.get(rag_id, 0)
+
+    def _references_changed(self, rag_id: int):
+        with self._rag_locks_guard:
+            self._generations[rag_id] = self._generations.get(rag_id, 0) + 1
+
+    @staticmethod
+    def chunk_hash(text: str) -> str:
+        """Content address of a chunk"""
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def get_or_embed(self, texts: List[str], embedding_model: str,
+                     embed_documents: Callable[[List[str]], List[List[float]]]) -> Tuple[List[int], np.ndarray]:
+        """
+        Resolve chunks to shared ids, embedding only the ones not stored yet
+
+        Args:
+            texts: Chunk texts
+            embedding_model: Name of the embedding model the vectors belong to
+            embed_documents: Embeds a list of texts, e.g. HuggingFaceEmbeddings.embed_documents
+
+        Returns:
+            Tuple of (chunk ids, float32 vectors), both parallel to texts
+        """
+        hashes = [self.chunk_hash(text) for text in texts]
+        stored = self.repo.get_chunks_by_hash(list(set(hashes)), embedding_model, config.CHUNK_LEASE_SECONDS)
+
+        new_texts: Dict[str, str] = {}
+        for chunk_hash, text in zip(hashes, texts):
+            if chunk_hash not in stored:
+                new_texts.setdefault(chunk_hash, text)
+
+        print(f"Chunk store: {len(texts)} chunks, {len(texts) - len(new_texts)} reused, "
+              f"{len(new_texts)} to embed")
+        cache_requests.inc(len(texts) - len(new_texts), cache='chunk_store', result='hit')
+        cache_requests.inc(len(new_texts), cache='chunk_store', result='miss')
+        if new_texts:
+            new_vectors = np.asarray(embed_documents(list(new_texts.values())), dtype=np.float32)
+            rows = [
+                (chunk_hash, embedding_model, text, vector.tobytes())
+                for (chunk_hash, text), vector in zip(new_texts.items(), new_vectors)
+            ]
+            new_ids = self.repo.insert_chunks(rows, config.CHUNK_LEASE_SECONDS)
+            for chunk_hash, _, _, embedding in rows:
+                stored[chunk_hash] = (new_ids[chunk_hash], embedding)
+
+        chunk_ids = [stored[chunk_hash][0] for chunk_hash in hashes]
+        if not hashes:
+            return chunk_ids, np.empty((0, 0), dtype=np.float32)
+        vectors = np.stack([np.frombuffer(stored[chunk_hash][1], dtype=np.float32) for chunk_hash in hashes])
+        return chunk_ids, vectors
+
+    def assign_to_rag(self, rag_id: int, chunk_ids: List[int], doc_paths: List[str]):
+        """
+        Make these chunks, in order, the contents of a RAG's index
+
+        Raises:
+            LookupError: If a chunk from get_or_embed was deleted meanwhile, in
+                which case the RAG keeps its previous references
+        """
+        self.repo.replace_rag_chunks(rag_id, list(zip(chunk_ids, doc_paths)))
+        self._references_changed(rag_id)
+        self.collect_garbage()
+
+    def load_rag_chunks(self, rag_id: int) -> Tuple[List[int], List[int], List[str], np.ndarray]:
+        """
+        Load the chunks a RAG's index references
+
+        Returns:
+            Tuple of (index positions, chunk ids, texts, float32 vectors); empty
+            for RAGs built before the shared store existed
+        """
+        rows = self.repo.get_rag_chunks(rag_id)
+        if not rows:
+            return [], [], [], np.empty((0, 0), dtype=np.float32)
+        vectors = np.stack([np.frombuffer(row['embedding'], dtype=np.float32) for row in rows])
+        return ([row['position'] for row in rows], [row['chunk_id'] for row in rows],
+                [row['content'] for row in rows], vectors)
+
+    def get_rag_references(self, rag_id: int) -> List[Dict]:
+        """A RAG's (position, chunk_id, doc_path, chunk_hash) references in index order"""
+        return self.repo.get_rag_references(rag_id)
+
+    def release_document(self, rag_id: int, doc_path: str) -> int:
+        """Drop a document's chunks from a RAG; returns the number of chunks deleted from the store"""
+        self.repo.release_document(rag_id, doc_path)
+        self._references_changed(rag_id)
+        return self.collect_garbage()
+
+    def release_rag(self, rag_id: int) -> int:
+        """Drop all of a RAG's chunks; returns the number of chunks deleted from the store"""
+        self.repo.release_rag(rag_id)
+        self._references_changed(rag_id)
+        return self.collect_garbage()
+
+    def collect_garbage(self) -> int:
+        """Delete chunks that no RAG references"""
+        deleted = self.repo.delete_unreferenced_chunks()
+        if deleted:
+            print(f"Chunk store: deleted {deleted} unreferenced chunks")
+        return deleted
+
+    def get_stats(self) -> Dict:
+        """Unique chunks, total references and bytes stored"""
+        return self.repo.get_stats()
+
+
+# Singleton instance
+chunk_store_service = ChunkStoreService()
@@ -1,6 +1,7 @@
 """Embedding service for text embeddings"""
 from langchain_huggingface import HuggingFaceEmbeddings
 from app.config import config
+from app.utils.metrics import loaded_models, stage_seconds
 
 
 class EmbeddingService:
@@ -18,14 +19,17 @@ class EmbeddingService:
             )
         return self._embedding_model
     
-    def generate_embedding(self, text: str) -> list:
-        """Generate embedding for text"""
-        return self.embedding_model.embed_query(text)
+    def generate_embedding(self, text: str, pipeline: str = 'chat') -> list:
+        """Generate embedding for text, timed under the caller's pipeline"""
+        with stage_seconds.time(pipeline=pipeline, stage='embedding'):
+            return self.embedding_model.embed_query(text)
     
-    def generate_embeddings(self, texts: list) -> list:
-        """Generate embeddings for multiple texts"""
-        return self.embedding_model.embed_documents(texts)
+    def generate_embeddings(self, texts: list, pipeline: str = 'chat') -> list:
+        """Generate embeddings for multiple texts, timed under the caller's pipeline"""
+        with stage_seconds.time(pipeline=pipeline, stage='embedding'):
+            return self.embedding_model.embed_documents(texts)
 
 
 # Singleton instance
 embedding_service = EmbeddingService()
+loaded_models.set_function(lambda: embedding_service._embedding_model is not None, kind='embedding')
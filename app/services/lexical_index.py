@@ -0,0 +1,142 @@
+"""BM25 lexical index built alongside each RAG vector store"""
+import json
+import math
+import os
+import re
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+BM25_INDEX_FILE = "bm25.json"
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Whole identifiers like os.path.join, get_user_id or ERR-404 are kept as one
+# token, and their parts are indexed too so partial matches still score
+TOKEN_PATTERN = re.compile(r"\w+(?:[.\-:/]\w+)*")
+SUBTOKEN_PATTERN = re.compile(r"[A-Za-z][a-z]+|[A-Z]+(?![a-z])|\d+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase BM25 terms"""
+    tokens = []
+    for match in TOKEN_PATTERN.findall(text):
+        whole = match.lower()
+        tokens.append(whole)
+        for part in re.split(r"[.\-:/_]+", match):
+            for sub_token in SUBTOKEN_PATTERN.findall(part):
+                sub_token = sub_token.lower()
+                if sub_token != whole:
+                    tokens.append(sub_token)
+    return tokens
+
+
+class BM25Index:
+    """Okapi BM25 inverted index over chunk texts"""
+
+    def __init__(self, texts: List[str], doc_lengths: np.ndarray,
+                 postings: Dict[str, Tuple[np.ndarray, np.ndarray]]):
+        self.texts = texts
+        self.doc_lengths = doc_lengths
+        self.postings = postings
+        self.avg_doc_length = float(doc_lengths.mean()) if len(doc_lengths) else 0.0
+
+    @classmethod
+    def build(cls, texts: List[str]) -> "BM25Index":
+        """Build an index over the given chunk texts"""
+        doc_ids = defaultdict(list)
+        term_freqs = defaultdict(list)
+        doc_lengths = np.zeros(len(texts), dtype=np.int32)
+
+        for doc_id, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            doc_lengths[doc_id] = sum(counts.values())
+            for term, count in counts.items():
+                doc_ids[term].append(doc_id)
+                term_freqs[term].append(count)
+
+        postings = {
+            term: (np.asarray(doc_ids[term], dtype=np.int32), np.asarray(term_freqs[term], dtype=np.int32))
+            for term in doc_ids
+        }
+        return cls(list(texts), doc_lengths, postings)
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def search(self, query: str, k: int) -> List[Tuple[int, float]]:
+        """
+        Score chunks against a query
+
+        Returns:
+            Up to k (chunk index, BM25 score) pairs, best first, with score > 0
+        """
+        if not self.texts:
+            return []
+
+        scores = np.zeros(len(self.texts), dtype=np.float32)
+        doc_count = len(self.texts)
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            doc_ids, freqs = posting
+            idf = math.log(1 + (doc_count - len(doc_ids) + 0.5) / (len(doc_ids) + 0.5))
+            length_norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[doc_ids] / self.avg_doc_length)
+            scores[doc_ids] += idf * freqs * (BM25_K1 + 1) / (freqs + length_norm)
+
+        k = min(k, doc_count)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(int(i), float(scores[i])) for i in top if scores[i] > 0]
+
+    def save(self, directory: str):
+        """Write the index next to a vector store"""
+        os.makedirs(directory, exist_ok=True)
+        payload = {
+            "texts": self.texts,
+            "doc_lengths": self.doc_lengths.tolist(),
+            "postings": {
+                term: [doc_ids.tolist(), freqs.tolist()]
+                for term, (doc_ids, freqs) in self.postings.items()
+            }
+        }
+        # Replaced in one step so a concurrent load never reads a partial file
+        path = os.path.join(directory, BM25_INDEX_FILE)
+        with open(path + ".tmp", "w", encoding="utf-8") as file:
+            json.dump(payload, file)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, directory: str) -> Optional["BM25Index"]:
+        """Load the index saved in a vector store directory, or None if it has none"""
+        path = os.path.join(directory, BM25_INDEX_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as file:
+            payload = json.load(file)
+        postings = {
+            term: (np.asarray(doc_ids, dtype=np.int32), np.asarray(freqs, dtype=np.int32))
+            for term, (doc_ids, freqs) in payload["postings"].items()
+        }
+        return cls(payload["texts"], np.asarray(payload["doc_lengths"], dtype=np.int32), postings)
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], rrf_k: int = 60) -> List[str]:
+    """
+    Fuse several rankings of keys by reciprocal rank
+
+    Args:
+        rankings: Lists of keys, best first
+        rrf_k: Damping constant; larger values flatten the rank contribution
+
+    Returns:
+        All keys ordered by fused score, ties kept in first-seen order
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(scores, key=lambda key: scores[key], reverse=True)
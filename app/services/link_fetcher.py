@@ -0,0 +1,191 @@
+"""Concurrent fetching and text extraction for link documents"""
+import atexit
+import multiprocessing
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.utils import get_encoding_from_headers
+from urllib3.util.retry import Retry
+
+from app.config import config
+from app.text_extraction import extract_text
+
+USER_AGENT = "Mozilla/5.0 (compatible; IntelliForge/1.0)"
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+
+def _extraction_context():
+    """
+    Start method for the extraction process pool
+
+    The pool is created lazily in a threaded server, while download threads
+    may hold urllib3 and session locks that a plain fork would copy into the
+    children locked. Forkserver children fork from a single-threaded server
+    that has only app.text_extraction preloaded, not the services and their
+    models; spawn is the fallback.
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(['app.text_extraction'])
+        return context
+    return multiprocessing.get_context('spawn')
+
+
+class LinkFetcher:
+    """
+    Download link documents concurrently and extract their text
+
+    A single requests session keeps pooled keep-alive connections across
+    builds. Downloads run on a thread pool with at most per_host requests to
+    the same host at a time; connection errors, 429 and 5xx responses are
+    retried with backoff. HTML and PDF parsing is CPU-bound, so it runs in a
+    process pool while further downloads continue.
+    """
+
+    def __init__(self, workers: int = None, per_host: int = None, timeout: Tuple[float, float] = None,
+                 retries: int = None, extract_workers: int = None, max_size: int = None):
+        self.workers = workers or config.LINK_FETCH_WORKERS
+        self.per_host = per_host or config.LINK_FETCH_PER_HOST
+        self.timeout = timeout or (config.LINK_CONNECT_TIMEOUT, config.LINK_READ_TIMEOUT)
+        self.retries = config.LINK_FETCH_RETRIES if retries is None else retries
+        self.extract_workers = extract_workers or config.LINK_EXTRACT_WORKERS
+        self.max_size = max_size or config.MAX_FILE_SIZE
+        self.session = self._create_session()
+        self._host_limits: Dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+        self._extractor = None
+
+    def _create_session(self) -> requests.Session:
+        retry = Retry(
+            total=self.retries,
+            backoff_factor=0.5,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset({'GET', 'HEAD'}),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=self.workers, pool_maxsize=self.per_host, max_retries=retry)
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.headers.update({
+            'User-Agent': USER_AGENT,
+            'Accept': 'text/html,application/xhtml+xml,application/pdf,text/plain;q=0.9,*/*;q=0.8',
+        })
+        return session
+
+    def _host_limit(self, url: str) -> threading.BoundedSemaphore:
+        host = urlparse(url).netloc.lower()
+        with self._lock:
+            limit = self._host_limits.get(host)
+            if limit is None:
+                limit = threading.BoundedSemaphore(self.per_host)
+                self._host_limits[host] = limit
+            return limit
+
+    def _get_extractor(self):
+        with self._lock:
+            if self._extractor is None:
+                try:
+                    self._extractor = ProcessPoolExecutor(max_workers=self.extract_workers,
+                                                          mp_context=_extraction_context())
+                except (OSError, NotImplementedError) as e:
+                    # No multiprocessing support (e.g. restricted sandboxes)
+                    print(f"Process pool unavailable, extracting link text in threads: {e}")
+                    self._extractor = ThreadPoolExecutor(max_workers=self.extract_workers)
+            return self._extractor
+
+    def _submit_extraction(self, content_type: str, body: bytes, encoding: Optional[str]) -> Future:
+        try:
+            return self._get_extractor().submit(extract_text, content_type, body, encoding)
+        except BrokenProcessPool:
+            with self._lock:
+                self._extractor = None
+            return self._get_extractor().submit(extract_text, content_type, body, encoding)
+
+    def download(self, url: str, headers: Dict[str, str] = None) -> requests.Response:
+        """
+        GET a URL under its host's concurrency limit
+
+        The body is read in chunks and the request abandoned once it exceeds
+        max_size; the returned response has its content already loaded.
+        """
+        with self._host_limit(url):
+            response = self.session.get(url, headers=headers, timeout=self.timeout, stream=True)
+            try:
+                response.raise_for_status()
+                body = bytearray()
+                for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                    body += chunk
+                    if len(body) > self.max_size:
+                        raise ValueError(f"Response exceeds {self.max_size} bytes")
+                response._content = bytes(body)
+                return response
+            finally:
+                response.close()
+
+    @staticmethod
+    def response_encoding(response: requests.Response) -> Optional[str]:
+        """Charset declared by the response; requests' ISO-8859-1 default for text/* is ignored"""
+        if 'charset' not in response.headers.get('Content-Type', '').lower():
+            return None
+        return get_encoding_from_headers(response.headers)
+
+    def extract(self, response: requests.Response) -> str:
+        """Text of a downloaded response, extracted in the worker pool"""
+        return self._submit_extraction(response.headers.get('Content-Type', ''), response.content,
+                                       self.response_encoding(response)).result()
+
+    def fetch_texts(self, urls: List[str]) -> Iterator[Tuple[str, str]]:
+        """
+        Fetch links and extract their text
+
+        All downloads start immediately, in the background; the returned
+        iterator yields (url, text) in completion order. Links that fail to
+        download or parse are reported and skipped.
+        """
+        if not urls:
+            return iter(())
+        downloads = ThreadPoolExecutor(max_workers=min(self.workers, len(urls)))
+        owners = {downloads.submit(self.download, url): ('download', url) for url in urls}
+        downloads.shutdown(wait=False)
+        return self._collect(owners)
+
+    def _collect(self, owners: Dict[Future, Tuple[str, str]]) -> Iterator[Tuple[str, str]]:
+        """Hand finished downloads to the extraction pool and yield finished extractions"""
+        pending = set(owners)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, url = owners.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"Failed to {stage} link: {url} with error: {e}")
+                    continue
+                if stage == 'download':
+                    extraction = self._submit_extraction(result.headers.get('Content-Type', ''), result.content,
+                                                         self.response_encoding(result))
+                    owners[extraction] = ('extract', url)
+                    pending.add(extraction)
+                elif result.strip():
+                    yield url, result
+
+    def close(self):
+        """Shut down the extraction pool and drop pooled connections"""
+        with self._lock:
+            if self._extractor is not None:
+                self._extractor.shutdown(wait=False)
+                self._extractor = None
+        self.session.close()
+
+
+# Singleton instance
+link_fetcher = LinkFetcher()
+atexit.register(link_fetcher.close)
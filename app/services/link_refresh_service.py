@@ -0,0 +1,244 @@
+"""Scheduled, change-detecting refresh of link documents"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from app.config import config
+from app.repositories.rag_repository import RAGRepository
+from app.services.chunk_store_service import chunk_store_service
+from app.services.link_fetcher import link_fetcher
+from app.services.vector_db_service import LEGACY_FAISS_PICKLE, vector_db_service
+from app.utils.index_utils import parse_index_spec
+
+
+class LinkRefreshService:
+    """
+    Refresh a RAG's link documents without rebuilding its index
+
+    Each URL is revalidated with If-None-Match / If-Modified-Since. A 304, or a
+    page whose chunks hash the same as before, costs nothing further. For pages
+    that did change, the new chunks go through the shared chunk store, so only
+    chunks whose text is new are embedded, and the RAG's chunk references and
+    vector store are updated in place.
+    """
+
+    def __init__(self):
+        self.repo = RAGRepository()
+
+    def _revalidate(self, link: Dict) -> Tuple[str, Optional[Tuple[str, Optional[str], Optional[str]]]]:
+        """
+        Conditionally GET a link
+
+        Returns:
+            ('unchanged', None), ('failed', None) or
+            ('fetched', (text, etag, last_modified))
+        """
+        headers = {}
+        if link.get('etag'):
+            headers['If-None-Match'] = link['etag']
+        if link.get('last_modified'):
+            headers['If-Modified-Since'] = link['last_modified']
+        try:
+            response = link_fetcher.download(link['url'], headers=headers)
+            if response.status_code == 304:
+                return 'unchanged', None
+            text = link_fetcher.extract(response)
+            return 'fetched', (text, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        except Exception as e:
+            print(f"Failed to refresh link: {link['url']} with error: {e}")
+            return 'failed', None
+
+    def refresh_rag(self, rag_id: int) -> Dict:
+        """
+        Refresh a RAG's link documents
+
+        Returns:
+            Report with links_checked, links_unchanged, links_changed,
+            links_failed, chunks_reused, chunks_added, chunks_removed and seconds
+        """
+        # Builds and deletions of the same RAG wait, and are waited for
+        with chunk_store_service.rag_lock(rag_id):
+            rag = self.repo.get_rag(rag_id)
+            if not rag:
+                raise ValueError("RAG not found")
+            index_name = f"rag_{rag_id}"
+            index_path = os.path.join(config.VECTOR_DB_PATH, index_name)
+            if not os.path.isdir(index_path):
+                raise ValueError(f"Vector database for RAG ID {rag_id} has not been created")
+            return self._refresh(rag, index_name, index_path)
+
+    def _refresh(self, rag: Dict, index_name: str, index_path: str) -> Dict:
+        rag_id = rag['id']
+        start = time.perf_counter()
+        links = self.repo.get_link_documents(rag_id)
+        report = {
+            'rag_id': rag_id, 'links_checked': len(links), 'links_unchanged': 0, 'links_changed': 0,
+            'links_failed': 0, 'chunks_reused': 0, 'chunks_added': 0, 'chunks_removed': 0,
+        }
+
+        references = chunk_store_service.get_rag_references(rag_id)
+        if not references or os.path.exists(os.path.join(index_path, LEGACY_FAISS_PICKLE)):
+            # Built before the shared chunk store: no chunk hashes to diff against
+            print(f"RAG {rag_id} has no shared chunk references, rebuilding it once")
+            vector_db_service.create_vectordb(self.repo.get_documents(rag_id), rag['vector_db'],
+                                              rag['chunk_size'], index_name,
+                                              parse_index_spec(rag.get('index_spec')), rag_id=rag_id)
+            report['chunks_added'] = len(chunk_store_service.get_rag_references(rag_id))
+            return self._finish(rag_id, report, start)
+
+        old_chunks: Dict[str, List[Dict]] = {}
+        for reference in references:
+            old_chunks.setdefault(reference['doc_path'], []).append(reference)
+
+        text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=rag['chunk_size'],
+            chunk_overlap=config.DEFAULT_CHUNK_OVERLAP
+        )
+        with ThreadPoolExecutor(max_workers=max(1, min(config.LINK_FETCH_WORKERS, len(links)))) as pool:
+            outcomes = list(pool.map(self._revalidate, links))
+
+        new_chunks: Dict[str, Tuple[List[int], List[str], List[str]]] = {}
+        added_ids, added_texts, added_vectors = [], [], []
+        # Saved once the new content is applied, so a failed update is fetched again next time
+        validators = []
+        for link, (status, fetched) in zip(links, outcomes):
+            url = link['url']
+            if status != 'fetched':
+                report['links_unchanged' if status == 'unchanged' else 'links_failed'] += 1
+                if status == 'unchanged':
+                    report['chunks_reused'] += len(old_chunks.get(url, []))
+                continue
+            text, etag, last_modified = fetched
+            validators.append((url, etag, last_modified))
+
+            texts = text_splitter.split_text(text)
+            hashes = [chunk_store_service.chunk_hash(chunk) for chunk in texts]
+            old_hashes = [reference['chunk_hash'] for reference in old_chunks.get(url, [])]
+            if hashes == old_hashes:
+                report['links_unchanged'] += 1
+                report['chunks_reused'] += len(hashes)
+                continue
+
+            report['links_changed'] += 1
+            old_set, new_set = set(old_hashes), set(hashes)
+            reused = sum(1 for chunk_hash in hashes if chunk_hash in old_set)
+            report['chunks_reused'] += reused
+            report['chunks_added'] += len(hashes) - reused
+            report['chunks_removed'] += sum(1 for chunk_hash in old_hashes if chunk_hash not in new_set)
+
+            chunk_ids, vectors = chunk_store_service.get_or_embed(
+                texts, config.EMBEDDING_MODEL_NAME, vector_db_service.embedding_model.embed_documents
+            )
+            new_chunks[url] = (chunk_ids, texts, hashes)
+            for chunk_id, chunk, chunk_hash, vector in zip(chunk_ids, texts, hashes, vectors):
+                if chunk_hash not in old_set:
+                    added_ids.append(chunk_id)
+                    added_texts.append(chunk)
+                    added_vectors.append(vector)
+
+        if new_chunks:
+            self._apply(rag, index_name, references, new_chunks, added_ids, added_texts, added_vectors)
+        for url, etag, last_modified in validators:
+            self.repo.update_link_validators(rag_id, url, etag, last_modified)
+        return self._finish(rag_id, report, start)
+
+    def _apply(self, rag: Dict, index_name: str, references: List[Dict],
+               new_chunks: Dict[str, Tuple[List[int], List[str], List[str]]],
+               added_ids: List[int], added_texts: List[str], added_vectors: List):
+        """Swap changed documents' chunks into the RAG's references and vector store"""
+        chunk_ids, doc_paths = [], []
+        emitted = set()
+        for reference in references:
+            doc_path = reference['doc_path']
+            if doc_path not in new_chunks:
+                chunk_ids.append(reference['chunk_id'])
+                doc_paths.append(doc_path)
+            elif doc_path not in emitted:
+                # A changed document's new chunks take the place of its old block
+                emitted.add(doc_path)
+                chunk_ids.extend(new_chunks[doc_path][0])
+                doc_paths.extend([doc_path] * len(new_chunks[doc_path][0]))
+        for doc_path, (new_ids, _, _) in new_chunks.items():
+            if doc_path not in emitted:
+                # Link added after the last build
+                chunk_ids.extend(new_ids)
+                doc_paths.extend([doc_path] * len(new_ids))
+
+        kept = set(chunk_ids)
+        removed_ids = sorted({reference['chunk_id'] for reference in references} - kept)
+        chunk_store_service.assign_to_rag(rag['id'], chunk_ids, doc_paths)
+
+        vectors = np.stack(added_vectors) if added_vectors else np.empty((0, 0), dtype=np.float32)
+        vector_db_service.update_shared_index(index_name, rag['vector_db'], parse_index_spec(rag.get('index_spec')),
+                                              rag['id'], removed_ids, added_ids, added_texts, vectors)
+
+    def _finish(self, rag_id: int, report: Dict, start: float) -> Dict:
+        report['seconds'] = time.perf_counter() - start
+        report['id'] = self.repo.add_refresh_report(rag_id, report)
+        print(f"Refreshed links of RAG {rag_id}: {report['links_changed']} changed, "
+              f"{report['links_unchanged']} unchanged, {report['links_failed']} failed; chunks "
+              f"{report['chunks_reused']} reused, {report['chunks_added']} added, "
+              f"{report['chunks_removed']} removed in {report['seconds']:.1f}s")
+        return report
+
+    def set_schedule(self, rag_id: int, interval_minutes: Optional[int]):
+        """Refresh a RAG's links every interval_minutes; None or 0 disables the schedule"""
+        if interval_minutes is not None and interval_minutes < 0:
+            raise ValueError("Refresh interval must be positive")
+        self.repo.update_refresh_schedule(rag_id, interval_minutes or None)
+
+    def get_reports(self, rag_id: int, limit: int = 20) -> List[Dict]:
+        """Most recent refresh reports of a RAG"""
+        return self.repo.get_refresh_reports(rag_id, limit)
+
+
+class LinkRefreshScheduler:
+    """Background thread that refreshes RAGs whose refresh interval has elapsed"""
+
+    def __init__(self, service: LinkRefreshService, poll_seconds: int = None):
+        self.service = service
+        self.poll_seconds = poll_seconds or config.LINK_REFRESH_POLL_SECONDS
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the scheduler thread; later calls are no-ops"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="link-refresh", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the scheduler thread after the current refresh"""
+        self._stop.set()
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join()
+
+    def run_due(self):
+        """Refresh every RAG that is due"""
+        for rag in self.service.repo.get_rags_due_for_refresh():
+            if self._stop.is_set():
+                return
+            if not os.path.isdir(os.path.join(config.VECTOR_DB_PATH, f"rag_{rag['id']}")):
+                continue  # Not built yet
+            try:
+                self.service.refresh_rag(rag['id'])
+            except Exception as e:
+                print(f"Scheduled link refresh of RAG {rag['id']} failed: {e}")
+
+    def _run(self):
+        while not self._stop.wait(self.poll_seconds):
+            self.run_due()
+
+
+# Singleton instances
+link_refresh_service = LinkRefreshService()
+link_refresh_scheduler = LinkRefreshScheduler(link_refresh_service)
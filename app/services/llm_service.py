@@ -1,16 +1,161 @@
 """LLM service for language model operations"""
+import time
+from typing import Any, List, Optional, Tuple
 import ollama
 from groq import Groq
 from openai import OpenAI
 from langchain_groq import ChatGroq
 from langchain_community.chat_models import ChatOllama
 from langchain_openai import ChatOpenAI
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.documents import Document
 from langchain_core.prompts import PromptTemplate
 from langchain_classic.chains import LLMChain, ConversationalRetrievalChain
 from langchain_classic.chains.question_answering import load_qa_chain
 from langchain_classic.chains.conversational_retrieval.prompts import CONDENSE_QUESTION_PROMPT
 from app.config import config
 from app.services.retriever_service import create_reranking_retriever
+from app.utils.context_packing import ContextPacker
+from app.utils.metrics import provider_errors, stage_seconds
+from app.utils.token_utils import count_tokens
+from app.utils.tracing import current_span, tracer
+from app.utils.turn_stats import current_turn
+
+# Tokens of the top retrieved document kept when the prompt leaves less than that
+MIN_CONTEXT_TOKENS = 256
+
+
+class LLMMetricsCallback(BaseCallbackHandler):
+    """
+    Record each LLM call of a chain run in the llm_generation histogram and as
+    a trace span, count failed calls per provider, and add first-token time
+    and token usage to the current chat turn
+    """
+    
+    def __init__(self, provider: str, pipeline: str):
+        self.provider = provider
+        self.pipeline = pipeline
+        self._starts = {}
+        self._first_tokens = {}
+        self._prompts = {}
+    
+    def _start(self, run_id, prompt_text):
+        self._starts[run_id] = (time.perf_counter(), tracer.start_span('llm', provider=self.provider,
+                                                                       pipeline=self.pipeline))
+        if current_turn() is not None:
+            # Only kept for counting prompt tokens when the provider reports no usage
+            self._prompts[run_id] = prompt_text
+    
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start(run_id, lambda: "\n".join(
+            str(message.content) for batch in messages for message in batch
+        ))
+    
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start(run_id, lambda: "\n".join(prompts))
+    
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        self._first_tokens.setdefault(run_id, time.perf_counter())
+    
+    def _end(self, run_id, error: BaseException = None):
+        first_token = self._first_tokens.pop(run_id, None)
+        started = self._starts.pop(run_id, None)
+        if started is None:
+            return
+        start, llm_span = started
+        now = time.perf_counter()
+        stage_seconds.observe(now - start, pipeline=self.pipeline, stage='llm_generation')
+        if error is not None:
+            llm_span.record_error(error)
+        llm_span.end()
+        turn = current_turn()
+        if turn is not None and error is None:
+            # Without streaming the first token arrives with the whole response
+            turn.mark_first_token(first_token or now)
+    
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._end(run_id)
+        prompt_text = self._prompts.pop(run_id, None)
+        turn = current_turn()
+        if turn is None:
+            return
+        usage = _token_usage(response)
+        if usage is not None:
+            turn.add_tokens(*usage)
+        else:
+            completion = "".join(gen.text for gens in response.generations for gen in gens)
+            turn.add_tokens(count_tokens(prompt_text() if prompt_text else ""), count_tokens(completion),
+                            estimated=True)
+    
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._prompts.pop(run_id, None)
+        self._end(run_id, error)
+        provider_errors.inc(provider=self.provider)
+
+
+def _token_usage(response) -> Optional[Tuple[int, int]]:
+    """(prompt, completion) tokens reported by the provider for an LLMResult, if any"""
+    prompt_tokens = completion_tokens = 0
+    found = False
+    for generations in response.generations:
+        for generation in generations:
+            # Chat models: usage_metadata on the message, else Ollama's eval counts
+            usage = getattr(getattr(generation, 'message', None), 'usage_metadata', None)
+            info = generation.generation_info or {}
+            if usage:
+                prompt_tokens += usage.get('input_tokens', 0)
+                completion_tokens += usage.get('output_tokens', 0)
+                found = True
+            elif 'prompt_eval_count' in info or 'eval_count' in info:
+                prompt_tokens += info.get('prompt_eval_count') or 0
+                completion_tokens += info.get('eval_count') or 0
+                found = True
+    if found:
+        return prompt_tokens, completion_tokens
+    # OpenAI-compatible providers also report usage for the whole call
+    token_usage = (response.llm_output or {}).get('token_usage') or {}
+    if 'prompt_tokens' in token_usage or 'completion_tokens' in token_usage:
+        return token_usage.get('prompt_tokens') or 0, token_usage.get('completion_tokens') or 0
+    return None
+
+
+def _summarized_chat_history(summary: str):
+    """get_chat_history for a retrieval chain: the session summary, then the (human, ai) turns"""
+    def get_chat_history(chat_history: List[Tuple[str, str]]) -> str:
+        turns = "".join(f"\nHuman: {human}\nAssistant: {ai}" for human, ai in chat_history)
+        return f"\nSummary of the earlier conversation: {summary}{turns}"
+    return get_chat_history
+
+
+class PackedConversationalRetrievalChain(ConversationalRetrievalChain):
+    """
+    Conversational retrieval chain that packs the retrieved documents, in
+    relevance order, into the tokens the QA prompt and question leave of the
+    model's budget
+    
+    The top document is always kept, cut to MIN_CONTEXT_TOKENS if need be:
+    a long prompt template on a small context window would otherwise leave
+    the model no context, and it could only ever answer "not found".
+    """
+    
+    context_packer: Any = None
+    docs_token_budget: int = 0
+    
+    def _pack_docs(self, question: str, docs: List[Document]) -> List[Document]:
+        budget = self.docs_token_budget - self.context_packer.count(question)
+        packed = self.context_packer.pack_documents(docs, budget)
+        if docs and not packed:
+            print(f"Prompt leaves {budget} tokens for retrieved documents, none fit; "
+                  f"keeping the top one cut to {MIN_CONTEXT_TOKENS} tokens")
+            packed = self.context_packer.pack_documents(docs[:1], max(budget, MIN_CONTEXT_TOKENS))
+        current_span().set_attributes({'docs_retrieved': len(docs), 'docs_packed': len(packed)})
+        return packed
+    
+    def _get_docs(self, question, inputs, *, run_manager):
+        return self._pack_docs(question, super()._get_docs(question, inputs, run_manager=run_manager))
+    
+    async def _aget_docs(self, question, inputs, *, run_manager):
+        return self._pack_docs(question, await super()._aget_docs(question, inputs, run_manager=run_manager))
 
 
 class LLMService:
@@ -32,10 +177,10 @@ class LLMService:
                 model_name=model_name
             )
         elif model_type == "Ollama":
-            return ChatOllama(model=model_name)
+            return ChatOllama(model=model_name, base_url=config.OLLAMA_BASE_URL, num_ctx=config.OLLAMA_NUM_CTX)
         elif model_type == "GitHub":
             return ChatOpenAI(
-                base_url="https://models.github.ai/inference",
+                base_url=config.GITHUB_MODELS_BASE_URL,
                 api_key=api_key or config.GITHUB_TOKEN,
                 model=model_name
             )
@@ -45,6 +190,11 @@ class LLMService:
         else:
             raise ValueError(f"Unsupported model type: {model_type}")
     
+    @staticmethod
+    def metrics_callbacks(model_type: str, pipeline: str) -> list:
+        """Callback handlers that time a chain's LLM calls for the metrics endpoint"""
+        return [LLMMetricsCallback(model_type, pipeline)]
+    
     @staticmethod
     def create_chat_chain(llm, prompt_template: str, 
                          input_variables: list) -> LLMChain:
@@ -58,8 +208,19 @@ class LLMService:
     @staticmethod
     def create_retrieval_chain(llm, vectorstore, prompt_template=None, 
                              use_reranking=True, top_k_retrieval=None, 
-                             top_k_reranked=None):
-        """Create a conversational retrieval chain with custom prompt and reranking"""
+                             top_k_reranked=None, lexical_index=None,
+                             context_budget: int = None, model_name: str = None,
+                             history_summary: str = None):
+        """
+        Create a conversational retrieval chain with custom prompt, hybrid retrieval and reranking
+        
+        Args:
+            context_budget: Prompt tokens per LLM call; retrieved documents are
+                packed into what the QA prompt leaves of it, counted with
+                model_name's tokenizer. No packing without a budget
+            history_summary: Summary of the conversation before the chat
+                history turns, shown to the condense-question step with them
+        """
         question_generator = LLMChain(llm=llm, prompt=CONDENSE_QUESTION_PROMPT)
         
         # Use custom prompt template if provided, otherwise use default with documentation constraint
@@ -109,16 +270,34 @@ class LLMService:
                 vectorstore=vectorstore,
                 top_k_retrieval=top_k_retrieval,
                 top_k_reranked=top_k_reranked,
-                enable_reranking=True
+                enable_reranking=True,
+                lexical_index=lexical_index
             )
         else:
             retriever = vectorstore.as_retriever()
         
-        return ConversationalRetrievalChain(
+        chain_kwargs = {}
+        if history_summary:
+            chain_kwargs['get_chat_history'] = _summarized_chat_history(history_summary)
+        
+        if context_budget is None:
+            return ConversationalRetrievalChain(
+                retriever=retriever,
+                question_generator=question_generator,
+                combine_docs_chain=doc_chain,
+                return_source_documents=True,
+                **chain_kwargs
+            )
+        
+        packer = ContextPacker(model_name)
+        return PackedConversationalRetrievalChain(
             retriever=retriever,
             question_generator=question_generator,
             combine_docs_chain=doc_chain,
-            return_source_documents=True
+            return_source_documents=True,
+            context_packer=packer,
+            docs_token_budget=context_budget - packer.count(qa_prompt_template),
+            **chain_kwargs
         )
     
     @staticmethod
@@ -140,7 +319,7 @@ class LLMService:
                 return completion.choices[0].message.content.strip()
             elif model_type == "GitHub":
                 client = OpenAI(
-                    base_url="https://models.github.ai/inference",
+                    base_url=config.GITHUB_MODELS_BASE_URL,
                     api_key=api_key or config.GITHUB_TOKEN
                 )
                 completion = client.chat.completions.create(
@@ -154,7 +333,7 @@ class LLMService:
                 )
                 return completion.choices[0].message.content.strip()
             elif model_type == "Ollama":
-                response = ollama.chat(
+                response = ollama.Client(host=config.OLLAMA_BASE_URL).chat(
                     model=model_name,
                     messages=[{
                         'role': 'user',
@@ -165,6 +344,7 @@ class LLMService:
             else:
                 return prompt[:50] if len(prompt) > 50 else prompt
         except Exception as e:
+            provider_errors.inc(provider=model_type)
             print(f"Error generating name: {e}")
             return prompt[:50] if len(prompt) > 50 else prompt
 
@@ -1,8 +1,24 @@
 """RAG service for RAG operations"""
-from typing import List, Tuple, Dict
+import json
+import os
+import shutil
+from typing import List, Optional, Tuple, Dict
+import numpy as np
+from langchain_classic.chains.conversational_retrieval.prompts import CONDENSE_QUESTION_PROMPT
+from app.config import config
+from app.repositories.metrics_repository import MetricsRepository
 from app.repositories.rag_repository import RAGRepository
+from app.services.chunk_store_service import chunk_store_service
 from app.services.vector_db_service import vector_db_service
 from app.services.llm_service import llm_service
+from app.services.session_memory_service import session_memory_service
+from app.utils.chroma_utils import close_chroma_client
+from app.utils.context_packing import ContextPacker, context_budget
+from app.utils.file_utils import remove_uploaded_file
+from app.utils.index_utils import SEARCH_PARAMS, parse_index_spec
+from app.utils.metrics import stage_seconds
+from app.utils.tracing import current_span, span, traced
+from app.utils.turn_stats import TurnStats, record_turn
 
 
 class RAGService:
@@ -36,21 +52,101 @@ class RAGService:
         """Update RAG model configuration"""
         self.repo.update_rag_model(rag_id, model_type, model_name, api_key)
     
-    def update_vector_db_config(self, rag_id: int, embedding_model:str, vector_db: str, chunk_size: int):
+    def update_vector_db_config(self, rag_id: int, embedding_model:str, vector_db: str, chunk_size: int,
+                                index_spec: Dict = None):
         """Update vector database configuration"""
         self.repo.update_rag_vector_db(rag_id, embedding_model, vector_db, chunk_size)
+        if index_spec is not None:
+            self.repo.update_rag_index_spec(rag_id, json.dumps(index_spec))
     
-    def add_document(self, rag_id: int, doc_type: str, doc_path: str, description: str = ""):
-        """Add a document to RAG"""
-        self.repo.add_document(rag_id, doc_type, doc_path, description)
+    def update_search_params(self, rag_id: int, search_params: Dict) -> Dict:
+        """
+        Update query-time index parameters (ef_search, nprobe) without a rebuild
+        
+        Returns:
+            The updated index spec
+        """
+        rag = self.repo.get_rag(rag_id)
+        if not rag:
+            raise ValueError("RAG not found")
+        
+        index_spec = parse_index_spec(rag.get('index_spec'))
+        index_spec.update({
+            param: value for param, value in search_params.items()
+            if param in SEARCH_PARAMS and value is not None
+        })
+        index_spec = parse_index_spec(index_spec)
+        self.repo.update_rag_index_spec(rag_id, json.dumps(index_spec))
+        return index_spec
+    
+    def add_document(self, rag_id: int, doc_type: str, doc_path: str, description: str = "",
+                     content_hash: str = None) -> bool:
+        """
+        Add a document to RAG
+        
+        Returns:
+            False if the RAG already has a document with the same content, in
+            which case nothing is added and the content is not ingested twice
+        """
+        existing = self.repo.get_document_by_hash(rag_id, content_hash) if content_hash else None
+        if existing:
+            # Drop the extra link a duplicate upload under another name created
+            if existing['doc_path'] != doc_path and os.path.isfile(doc_path):
+                os.remove(doc_path)
+            return False
+        self.repo.add_document(rag_id, doc_type, doc_path, description, content_hash)
+        return True
     
     def get_documents_with_descriptions(self, rag_id: int) -> List[Dict]:
         """Get all documents with descriptions for a RAG"""
         return self.repo.get_documents_with_descriptions(rag_id)
     
     def delete_document(self, rag_id: int, doc_path: str):
-        """Delete a document from RAG"""
-        self.repo.delete_document(rag_id, doc_path)
+        """
+        Delete a document from RAG, its uploaded file and its chunks
+        
+        The document's chunks are dropped from the shared chunk store
+        references and from the RAG's vector store and BM25 index, so they are
+        no longer retrieved before the next rebuild.
+        """
+        with chunk_store_service.rag_lock(rag_id):
+            content_hash = self.repo.get_document_hash(rag_id, doc_path)
+            self.repo.delete_document(rag_id, doc_path)
+            self._drop_document_chunks(rag_id, doc_path)
+        if content_hash:
+            remove_uploaded_file(doc_path, content_hash, config.UPLOAD_FOLDER)
+    
+    def _drop_document_chunks(self, rag_id: int, doc_path: str):
+        """Remove a document's chunks from a RAG's chunk references and built vector store"""
+        references = chunk_store_service.get_rag_references(rag_id)
+        kept = [reference for reference in references if reference['doc_path'] != doc_path]
+        if len(kept) == len(references):
+            # Not built yet, built before the shared chunk store, or no chunks of this document
+            chunk_store_service.release_document(rag_id, doc_path)
+            return
+        
+        # Reassigned rather than released so index positions stay contiguous
+        kept_ids = [reference['chunk_id'] for reference in kept]
+        removed_ids = sorted({reference['chunk_id'] for reference in references} - set(kept_ids))
+        chunk_store_service.assign_to_rag(rag_id, kept_ids, [reference['doc_path'] for reference in kept])
+        
+        rag = self.repo.get_rag(rag_id)
+        if os.path.isdir(os.path.join(config.VECTOR_DB_PATH, f"rag_{rag_id}")):
+            self.vector_db_service.update_shared_index(
+                f"rag_{rag_id}", rag['vector_db'], parse_index_spec(rag.get('index_spec')), rag_id,
+                removed_ids, [], [], np.empty((0, 0), dtype=np.float32)
+            )
+    
+    def delete_rag(self, rag_id: int):
+        """Delete a RAG project, its vector store and its references into the shared chunk store"""
+        with chunk_store_service.rag_lock(rag_id):
+            chunk_store_service.release_rag(rag_id)
+            index_path = os.path.join(config.VECTOR_DB_PATH, f"rag_{rag_id}")
+            close_chroma_client(index_path)
+            self.vector_db_service.forget_indexes(f"rag_{rag_id}", rag_id)
+            if os.path.isdir(index_path):
+                shutil.rmtree(index_path)
+            self.repo.delete_rag(rag_id)
     
     def update_prompt_template(self, rag_id: int, prompt_template: str):
         """Update RAG prompt template"""
@@ -106,34 +202,67 @@ class RAGService:
     
     def create_vector_database(self, rag_id: int):
         """Create vector database from RAG documents"""
-        rag = self.repo.get_rag(rag_id)
-        if not rag:
-            raise ValueError("RAG not found")
+        # A link refresh or document deletion of this RAG waits for the build
+        with chunk_store_service.rag_lock(rag_id):
+            rag = self.repo.get_rag(rag_id)
+            if not rag:
+                raise ValueError("RAG not found")
+            
+            documents = self.repo.get_documents(rag_id)
+            if not documents:
+                raise ValueError(f"No documents found for RAG ID {rag_id}")
+            
+            vectorstore = self.vector_db_service.create_vectordb(
+                documents,
+                rag['vector_db'],
+                rag['chunk_size'],
+                f"rag_{rag_id}",
+                parse_index_spec(rag.get('index_spec')),
+                rag_id=rag_id
+            )
         
-        documents = self.repo.get_documents(rag_id)
-        if not documents:
-            raise ValueError(f"No documents found for RAG ID {rag_id}")
+        return vectorstore
+    
+    @traced("rag.query")
+    def query_rag(self, rag_id: int, query: str, chat_history: List[Tuple] = None, callbacks: List = None,
+                  history_summary: str = None):
+        """
+        Query RAG with conversational context
         
-        vectorstore = self.vector_db_service.create_vectordb(
-            documents,
-            rag['vector_db'],
-            rag['chunk_size'],
-            f"rag_{rag_id}"
-        )
+        Args:
+            callbacks: Optional LangChain callback handlers for the chain run,
+                e.g. to time its condense, retrieval and generation steps
+            history_summary: Rolling summary of the session before chat_history
+                (see get_session_memory)
         
-        return vectorstore
+        Returns:
+            The chain result, with the turn's latency and token accounting
+            under 'turn_stats' for add_chat_message to persist
+        """
+        with record_turn('rag') as turn:
+            result = self._query_rag(rag_id, query, chat_history, callbacks, history_summary, turn)
+        result['turn_stats'] = turn
+        return result
     
-    def query_rag(self, rag_id: int, query: str, chat_history: List[Tuple] = None):
-        """Query RAG with conversational context"""
+    def _query_rag(self, rag_id: int, query: str, chat_history: List[Tuple], callbacks: List,
+                   history_summary: str, turn: TurnStats):
+        """Run the retrieval chain, accounting stage latencies and tokens to turn"""
         rag = self.repo.get_rag(rag_id)
         if not rag:
             raise ValueError("RAG not found")
+        current_span().set_attributes({'rag_id': rag_id, 'vector_db': rag['vector_db'],
+                                       'model_type': rag['model_type'], 'model_name': rag['model_name']})
+        turn.rag_id, turn.model_type, turn.model_name = rag_id, rag['model_type'], rag['model_name']
         
         # Load vector database
-        vectorstore = self.vector_db_service.load_vectordb(
-            f"rag_{rag_id}",
-            rag['vector_db']
-        )
+        with stage_seconds.time(pipeline='rag', stage='index_load'), span('rag.index_load'):
+            vectorstore = self.vector_db_service.load_vectordb(
+                f"rag_{rag_id}",
+                rag['vector_db'],
+                parse_index_spec(rag.get('index_spec')),
+                rag_id=rag_id
+            )
+            lexical_index = self.vector_db_service.load_lexical_index(f"rag_{rag_id}")
         
         # Get LLM
         llm = self.llm_service.get_llm(
@@ -142,21 +271,35 @@ class RAGService:
             rag['model_type']
         )
         
-        # Create retrieval chain with custom prompt template and reranking
+        # Create retrieval chain with custom prompt template and reranking;
+        # retrieved chunks are packed into the model's token budget
+        budget = context_budget(rag['model_type'], rag['model_name'])
         chain = self.llm_service.create_retrieval_chain(
             llm, 
             vectorstore, 
             rag.get('prompt_template'),
             use_reranking=True,  # Enable reranking for better results
             top_k_retrieval=20,  # Retrieve more documents initially
-            top_k_reranked=5     # Return top 5 after reranking
+            top_k_reranked=5,    # Return top 5 after reranking
+            lexical_index=lexical_index,
+            context_budget=budget,
+            model_name=rag['model_name'],
+            history_summary=history_summary
         )
         
+        # Only the most recent turns that fit the condense prompt's budget
+        packer = ContextPacker(rag['model_name'])
+        history_budget = (budget - packer.count(CONDENSE_QUESTION_PROMPT.template) - packer.count(query)
+                          - packer.count(history_summary))
+        chat_history = packer.pack_turns(chat_history or [], history_budget, config.MAX_RECENT_MESSAGES)
+        current_span().set_attributes({'context_budget': budget, 'history_turns': len(chat_history)})
+        
         # Query
+        callbacks = list(callbacks or []) + self.llm_service.metrics_callbacks(rag['model_type'], 'rag')
         result = chain({
             "question": query,
-            "chat_history": chat_history or []
-        })
+            "chat_history": chat_history
+        }, callbacks=callbacks)
         
         return result
     
@@ -168,8 +311,15 @@ class RAGService:
         """Get all chat sessions for RAG"""
         return self.repo.get_chat_sessions(rag_id)
     
-    def add_chat_message(self, session_id: int, user_message: str, bot_response: str, rag_id: int = None):
-        """Add a message to chat session and generate name if first message"""
+    def add_chat_message(self, session_id: int, user_message: str, bot_response: str, rag_id: int = None,
+                         turn_stats: TurnStats = None):
+        """
+        Add a message to chat session and generate name if first message
+        
+        Args:
+            turn_stats: Latency and token accounting of the turn from query_rag,
+                stored alongside the message
+        """
         # Check if this is the first message in the session
         history = self.repo.get_chat_history(session_id)
         
@@ -186,11 +336,26 @@ class RAGService:
                 # Update the session name in database
                 RAGRepository.update_chat_session_name(session_id, suggested_name)
         
-        self.repo.add_chat_message(session_id, user_message, bot_response)
+        message_id = self.repo.add_chat_message(session_id, user_message, bot_response)
+        session_memory_service.schedule_summary(session_id)
+        if turn_stats is not None:
+            MetricsRepository.add_turn_stats({**turn_stats.to_row(), 'session_id': session_id,
+                                              'message_id': message_id})
     
     def get_chat_history(self, session_id: int) -> List[Dict]:
         """Get chat history for session"""
         return self.repo.get_chat_history(session_id)
+    
+    def get_session_memory(self, session_id: int) -> Tuple[Optional[str], List[Tuple[str, str]]]:
+        """
+        Get the bounded conversation memory to query a session's RAG with
+        
+        Returns:
+            (rolling summary of older turns or None, recent (user message,
+            answer) turns); pass them to query_rag as history_summary and
+            chat_history
+        """
+        return session_memory_service.get_memory(session_id)
 
 
 # Singleton instance
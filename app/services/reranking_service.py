@@ -4,6 +4,9 @@ from typing import List, Tuple, Dict, Any
 from sentence_transformers import CrossEncoder
 from langchain_core.documents import Document
 from app.config import config
+from app.services.searchtool.rerank_cascade import RerankCascade
+from app.utils.metrics import loaded_models, provider_errors, stage_seconds
+from app.utils.tracing import span
 
 
 class RerankingService:
@@ -12,6 +15,13 @@ class RerankingService:
     def __init__(self):
         self._reranker = None
         self.model_name = config.DEFAULT_RERANKER_MODEL
+        self.cascade = self._create_cascade()
+    
+    def _create_cascade(self):
+        """Early-exit cascade calibrated for the current embedding and reranker models"""
+        if not config.ENABLE_RERANK_EARLY_EXIT:
+            return None
+        return RerankCascade.for_models(config.EMBEDDING_MODEL_NAME, self.model_name)
     
     @property
     def reranker(self):
@@ -22,13 +32,14 @@ class RerankingService:
                 self._reranker = CrossEncoder(self.model_name)
                 print("Reranker model loaded successfully")
             except Exception as e:
+                provider_errors.inc(provider='reranker')
                 print(f"Failed to load reranker model: {e}")
                 print("Reranking will be disabled")
                 self._reranker = None
         return self._reranker
     
     def rerank_documents(self, query: str, documents: List[Document], 
-                        top_k: int = None) -> List[Document]:
+                        top_k: int = None, dense_scores: List[float] = None) -> List[Document]:
         """
         Rerank documents based on relevance to query
         
@@ -36,53 +47,128 @@ class RerankingService:
             query: The search query
             documents: List of retrieved documents
             top_k: Number of top documents to return (default from config)
+            dense_scores: Cosine similarities of the documents, for early exit
             
         Returns:
             List of reranked documents
         """
-        if not config.ENABLE_RERANKING or not self.reranker or not documents:
-            return documents[:top_k] if top_k else documents
+        return self.rerank_documents_many([query], [documents], top_k, [dense_scores])[0]
+    
+    def rerank_documents_many(self, queries: List[str], documents_per_query: List[List[Document]],
+                              top_k: int = None,
+                              dense_scores_per_query: List[List[float]] = None) -> List[List[Document]]:
+        """
+        Rerank the documents of several queries in combined cross-encoder batches
         
-        try:
-            # Prepare query-document pairs for reranking
-            pairs = [[query, doc.page_content] for doc in documents]
-            
-            # Get relevance scores
-            scores = self.reranker.predict(pairs)
-            
-            # Create document-score pairs and sort by score (descending)
-            doc_scores = list(zip(documents, scores))
-            doc_scores.sort(key=lambda x: x[1], reverse=True)
+        With early exit enabled, queries whose dense scores are decisive keep
+        their dense order and the rest are reranked progressively.
+        
+        Args:
+            queries: The search queries
+            documents_per_query: Retrieved documents for each query, in dense order
+            top_k: Number of top documents to return per query
+            dense_scores_per_query: Cosine similarities parallel to each query's
+                documents, or None where unknown
             
-            # Extract reranked documents
-            reranked_docs = [doc for doc, score in doc_scores]
+        Returns:
+            List of reranked document lists, one per query, each identical to
+            what rerank_documents returns for that query
+        """
+        if not config.ENABLE_RERANKING or not self.reranker:
+            return [documents[:top_k] if top_k else documents for documents in documents_per_query]
+        
+        with stage_seconds.time(pipeline='rag', stage='rerank'), \
+                span('rerank', model=self.model_name, queries=len(queries),
+                     candidates=sum(len(documents) for documents in documents_per_query)):
+            return self._rerank_many(queries, documents_per_query, top_k, dense_scores_per_query)
+    
+    def _rerank_many(self, queries: List[str], documents_per_query: List[List[Document]],
+                     top_k: int = None, dense_scores_per_query: List[List[float]] = None) -> List[List[Document]]:
+        """Score and order candidates for rerank_documents_many, keeping the original order on errors"""
+        try:
+            def score_pairs(positions):
+                # Prepare query-document pairs for reranking
+                pairs = [[queries[q], documents_per_query[q][i].page_content] for q, i in positions]
+                return self.reranker.predict(pairs, batch_size=config.RERANK_BATCH_SIZE)
             
-            # Apply top_k limit
-            if top_k:
-                reranked_docs = reranked_docs[:top_k]
+            if self.cascade is not None:
+                outcomes = self.cascade.run(
+                    [len(documents) for documents in documents_per_query], top_k,
+                    score_pairs, dense_scores_per_query
+                )
+                return [
+                    self._order_by_scores([documents[i] for i in outcome.order], outcome.scores,
+                                          rerank_applied=outcome.stage != "skipped")
+                    for outcome, documents in zip(outcomes, documents_per_query)
+                ]
             
-            # Add reranking scores to metadata for debugging
-            for i, (doc, score) in enumerate(zip(reranked_docs, [s for _, s in doc_scores[:len(reranked_docs)]])):
-                if not hasattr(doc, 'metadata') or doc.metadata is None:
-                    doc.metadata = {}
-                doc.metadata['rerank_score'] = float(score)
-                doc.metadata['rerank_position'] = i + 1
+            # Get relevance scores
+            all_scores = score_pairs([
+                (q, i) for q, documents in enumerate(documents_per_query) for i in range(len(documents))
+            ])
             
-            print(f"Reranked {len(documents)} documents, returning top {len(reranked_docs)}")
-            return reranked_docs
+            reranked = []
+            offset = 0
+            for documents in documents_per_query:
+                scores = all_scores[offset:offset + len(documents)]
+                offset += len(documents)
+                reranked.append(self._order_by_scores(documents, scores, top_k))
+            return reranked
             
         except Exception as e:
+            provider_errors.inc(provider='reranker')
             print(f"Error during reranking: {e}")
             print("Falling back to original document order")
-            return documents[:top_k] if top_k else documents
+            return [documents[:top_k] if top_k else documents for documents in documents_per_query]
+    
+    @staticmethod
+    def _order_by_scores(documents: List[Document], scores, top_k: int = None,
+                         rerank_applied: bool = True) -> List[Document]:
+        """Sort documents by rerank score and record the score on copies of them"""
+        if not documents:
+            return documents
+        
+        # Create document-score pairs and sort by score (descending)
+        doc_scores = list(zip(documents, scores))
+        doc_scores.sort(key=lambda x: x[1], reverse=True)
+        
+        # Apply top_k limit
+        if top_k:
+            doc_scores = doc_scores[:top_k]
+        
+        # Add reranking scores to metadata for debugging. Copies keep the scores
+        # of one query off documents shared with other queries or the docstore
+        reranked_docs = []
+        for i, (doc, score) in enumerate(doc_scores):
+            metadata = dict(getattr(doc, 'metadata', None) or {})
+            if rerank_applied:
+                metadata['rerank_score'] = float(score)
+            else:
+                # Early exit kept the dense order
+                metadata['dense_score'] = float(score)
+            metadata['rerank_position'] = i + 1
+            reranked_docs.append(Document(page_content=doc.page_content, metadata=metadata,
+                                          id=getattr(doc, 'id', None)))
+        
+        print(f"Reranked {len(documents)} documents, returning top {len(reranked_docs)}")
+        return reranked_docs
     
     def set_reranker_model(self, model_name: str):
         """Change the reranker model"""
         if model_name != self.model_name:
             self.model_name = model_name
             self._reranker = None  # Force reload on next access
+            self.cascade = self._create_cascade()
             print(f"Reranker model changed to: {model_name}")
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Early-exit skip rate and estimated latency saved"""
+        return {
+            'model_name': self.model_name,
+            'early_exit': self.cascade.get_stats() if self.cascade is not None else None
+        }
 
 
 # Singleton instance
 reranking_service = RerankingService()
+loaded_models.set_function(lambda: reranking_service._reranker is not None, kind='reranker')
@@ -1,11 +1,16 @@
 """Custom retriever with reranking capabilities"""
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
 from langchain_core.retrievers import BaseRetriever
 from langchain_core.documents import Document
 from langchain_core.callbacks import CallbackManagerForRetrieverRun
 from pydantic import Field
 from app.services.reranking_service import reranking_service
+from app.services.lexical_index import reciprocal_rank_fusion
+from app.services.searchtool.candidate_dedup import select_candidates
 from app.config import config
+from app.utils.metrics import stage_seconds
+from app.utils.tracing import span
 
 
 class RerankingRetriever(BaseRetriever):
@@ -15,9 +20,17 @@ class RerankingRetriever(BaseRetriever):
     top_k_retrieval: int = Field(default_factory=lambda: config.DEFAULT_TOP_K_RETRIEVAL)
     top_k_reranked: int = Field(default_factory=lambda: config.DEFAULT_TOP_K_RERANKED)
     enable_reranking: bool = Field(default_factory=lambda: config.ENABLE_RERANKING)
+    lexical_index: Any = Field(default=None)
+    top_k_lexical: int = Field(default_factory=lambda: config.DEFAULT_TOP_K_LEXICAL)
+    rerank_candidates: int = Field(default_factory=lambda: config.DEFAULT_RERANK_CANDIDATES)
+    rrf_k: int = Field(default_factory=lambda: config.RRF_K)
+    candidate_dedup: str = Field(default_factory=lambda: config.CANDIDATE_DEDUP)
+    pipeline: str = Field(default='rag')
     
     def __init__(self, base_retriever, top_k_retrieval: int = None, 
-                 top_k_reranked: int = None, enable_reranking: bool = True, **kwargs):
+                 top_k_reranked: int = None, enable_reranking: bool = True,
+                 lexical_index=None, top_k_lexical: int = None,
+                 rerank_candidates: int = None, pipeline: str = 'rag', **kwargs):
         """
         Initialize the reranking retriever
         
@@ -26,12 +39,21 @@ class RerankingRetriever(BaseRetriever):
             top_k_retrieval: Number of documents to retrieve initially
             top_k_reranked: Number of documents to return after reranking
             enable_reranking: Whether to enable reranking
+            lexical_index: Optional BM25Index; when set, dense and lexical results
+                are fused by reciprocal rank before reranking
+            top_k_lexical: Number of documents to take from the lexical index
+            rerank_candidates: Number of fused candidates passed to the reranker
+            pipeline: Pipeline label the embedding and retrieval stages are timed under
         """
         super().__init__(
             base_retriever=base_retriever,
             top_k_retrieval=top_k_retrieval or config.DEFAULT_TOP_K_RETRIEVAL,
             top_k_reranked=top_k_reranked or config.DEFAULT_TOP_K_RERANKED,
             enable_reranking=enable_reranking and config.ENABLE_RERANKING,
+            lexical_index=lexical_index if config.ENABLE_HYBRID_RETRIEVAL else None,
+            top_k_lexical=top_k_lexical or config.DEFAULT_TOP_K_LEXICAL,
+            rerank_candidates=rerank_candidates or config.DEFAULT_RERANK_CANDIDATES,
+            pipeline=pipeline,
             **kwargs
         )
         
@@ -46,19 +68,31 @@ class RerankingRetriever(BaseRetriever):
     ) -> List[Document]:
         """Get relevant documents with reranking"""
         # Step 1: Retrieve initial set of documents
-        try:
-            # Try the new method first
-            initial_docs = self.base_retriever._get_relevant_documents(
-                query, run_manager=run_manager
+        query_matrix = self._embed_queries([query])
+        with stage_seconds.time(pipeline=self.pipeline, stage='retrieval'), span('retrieval') as retrieval_span:
+            dense_results = self._dense_search_many([query], query_matrix)
+            if dense_results is not None:
+                initial_docs, dense_scores, vectors, query_vector = dense_results[0]
+            else:
+                dense_scores = vectors = query_vector = None
+                try:
+                    # Try the new method first
+                    initial_docs = self.base_retriever._get_relevant_documents(
+                        query, run_manager=run_manager
+                    )
+                except AttributeError:
+                    # Fall back to the old method if available
+                    try:
+                        initial_docs = self.base_retriever.get_relevant_documents(query)
+                    except AttributeError:
+                        # Last resort: use invoke method
+                        initial_docs = self.base_retriever.invoke(query)
+            
+            initial_docs, dense_scores = self._prepare_candidates(
+                query, initial_docs, dense_scores, vectors, query_vector
             )
-        except AttributeError:
-            # Fall back to the old method if available
-            try:
-                initial_docs = self.base_retriever.get_relevant_documents(query)
-            except AttributeError:
-                # Last resort: use invoke method
-                initial_docs = self.base_retriever.invoke(query)
-        
+            retrieval_span.set_attributes({'candidates': len(initial_docs),
+                                           'hybrid': self.lexical_index is not None})
         if not initial_docs:
             return []
         
@@ -67,7 +101,7 @@ class RerankingRetriever(BaseRetriever):
         # Step 2: Apply reranking if enabled
         if self.enable_reranking:
             reranked_docs = reranking_service.rerank_documents(
-                query, initial_docs, self.top_k_reranked
+                query, initial_docs, self.top_k_reranked, dense_scores
             )
             print(f"After reranking: {len(reranked_docs)} documents")
             return reranked_docs
@@ -75,6 +109,206 @@ class RerankingRetriever(BaseRetriever):
             # Just apply top_k limit without reranking
             return initial_docs[:self.top_k_reranked]
     
+    def get_relevant_documents_many(self, queries: List[str]) -> List[List[Document]]:
+        """
+        Retrieve and rerank documents for several queries at once
+        
+        For FAISS stores the queries are searched with a single index call over
+        the query matrix; all (query, passage) pairs are then reranked in
+        combined cross-encoder batches. Each result matches what invoke()
+        returns for that query.
+        
+        Args:
+            queries: Search queries
+            
+        Returns:
+            List of document lists, one per query
+        """
+        if not queries:
+            return []
+        
+        query_matrix = self._embed_queries(queries)
+        with stage_seconds.time(pipeline=self.pipeline, stage='retrieval'), span('retrieval', queries=len(queries)):
+            prepared = [
+                self._prepare_candidates(query, *retrieved)
+                for query, retrieved in zip(queries, self._retrieve_many(queries, query_matrix))
+            ]
+        initial_docs = [docs for docs, _ in prepared]
+        print(f"Initial retrieval: {sum(len(docs) for docs in initial_docs)} documents for {len(queries)} queries")
+        
+        if self.enable_reranking:
+            return reranking_service.rerank_documents_many(
+                queries, initial_docs, self.top_k_reranked,
+                [dense_scores for _, dense_scores in prepared]
+            )
+        return [docs[:self.top_k_reranked] for docs in initial_docs]
+    
+    def _prepare_candidates(self, query: str, docs: List[Document],
+                            dense_scores: Optional[List[float]] = None,
+                            vectors: Optional[np.ndarray] = None,
+                            query_vector: Optional[np.ndarray] = None) -> Tuple[List[Document], Optional[List[float]]]:
+        """
+        Turn retrieval results into rerank candidates: lexical fusion, then
+        near-duplicate collapse (or MMR selection)
+        
+        Returns:
+            (candidates, dense scores); the scores are None when fusion or MMR
+            changed the dense order
+        """
+        if self.lexical_index is not None:
+            # Fused lists mix in chunks that have no embedding at hand
+            docs, dense_scores = self._fuse_lexical(query, docs, dense_scores)
+            vectors = None
+        
+        if self.candidate_dedup == "off" or len(docs) <= 1:
+            return docs, dense_scores
+        
+        keep, dense_order = select_candidates(
+            [doc.page_content for doc in docs], self.candidate_dedup,
+            vectors=vectors, query_vector=query_vector,
+            mmr_k=self.rerank_candidates
+        )
+        if len(keep) < len(docs):
+            print(f"Candidate dedup kept {len(keep)} of {len(docs)} documents")
+        docs = [docs[i] for i in keep]
+        if dense_scores is not None:
+            dense_scores = [dense_scores[i] for i in keep] if dense_order else None
+        return docs, dense_scores
+    
+    def _fuse_lexical(self, query: str, dense_docs: List[Document],
+                      dense_scores: Optional[List[float]] = None) -> Tuple[List[Document], Optional[List[float]]]:
+        """
+        Fuse dense results with BM25 results by reciprocal rank
+        
+        Without a lexical index the dense results and scores pass through
+        unchanged. With one, only the best rerank_candidates fused documents are
+        kept, so exact identifier matches reach the reranker while its workload
+        shrinks; fused lists have no dense scores, so early exit cannot skip them.
+        """
+        if self.lexical_index is None:
+            return dense_docs, dense_scores
+        
+        lexical_hits = self.lexical_index.search(query, self.top_k_lexical)
+        docs_by_text = {doc.page_content: doc for doc in dense_docs}
+        for chunk_id, _ in lexical_hits:
+            text = self.lexical_index.texts[chunk_id]
+            docs_by_text.setdefault(text, Document(page_content=text, metadata={'retrieval': 'lexical'}))
+        
+        fused = reciprocal_rank_fusion([
+            [doc.page_content for doc in dense_docs],
+            [self.lexical_index.texts[chunk_id] for chunk_id, _ in lexical_hits]
+        ], self.rrf_k)
+        
+        limit = self.rerank_candidates if self.enable_reranking else self.top_k_reranked
+        print(f"Hybrid retrieval: {len(dense_docs)} dense + {len(lexical_hits)} lexical "
+              f"-> {min(limit, len(fused))} candidates")
+        return [docs_by_text[text] for text in fused[:limit]], None
+    
+    def _retrieve_many(self, queries: List[str], query_matrix: Optional[np.ndarray] = None) -> List[Tuple]:
+        """
+        Run the base similarity search for several queries
+        
+        Returns:
+            (documents, dense scores, document vectors, query vector) per query;
+            all but the documents are None where the store cannot provide them
+        """
+        dense_results = self._dense_search_many(queries, query_matrix)
+        if dense_results is not None:
+            return dense_results
+        
+        # Other stores: one search per query
+        return [(self.base_retriever.invoke(query), None, None, None) for query in queries]
+    
+    def _dense_store(self):
+        """
+        The base retriever's FAISS store, or None when the base retriever is not
+        a plain similarity search over FAISS (including one with a filter,
+        fetch_k or other search_kwargs only the store's own search applies)
+        """
+        vectorstore = getattr(self.base_retriever, 'vectorstore', None)
+        search_type = getattr(self.base_retriever, 'search_type', 'similarity')
+        search_kwargs = getattr(self.base_retriever, 'search_kwargs', None) or {}
+        if (getattr(vectorstore, 'embeddings', None) is None or search_type != 'similarity'
+                or not hasattr(vectorstore, 'index_to_docstore_id')
+                or set(search_kwargs) - {'k'}):
+            return None
+        return vectorstore
+    
+    def _embed_queries(self, queries: List[str]) -> Optional[np.ndarray]:
+        """
+        Query matrix for a batched FAISS search, None when the store searches itself
+        
+        Queries are embedded with embed_query, as the store's own search does:
+        instruction-prefixed models embed queries differently from passages.
+        Timed as the embedding stage of the retriever's pipeline, apart from
+        retrieval, so turn statistics report it under embedding_ms.
+        """
+        vectorstore = self._dense_store()
+        if vectorstore is None:
+            return None
+        
+        with stage_seconds.time(pipeline=self.pipeline, stage='embedding'), span('embedding', queries=len(queries)):
+            query_matrix = np.array([vectorstore.embeddings.embed_query(query) for query in queries],
+                                    dtype=np.float32)
+        if getattr(vectorstore, '_normalize_L2', False):
+            import faiss
+            faiss.normalize_L2(query_matrix)
+        return query_matrix
+    
+    def _dense_search_many(self, queries: List[str],
+                           query_matrix: Optional[np.ndarray] = None) -> Optional[List[Tuple]]:
+        """
+        Batched similarity search over a LangChain FAISS store
+        
+        Args:
+            queries: Search queries
+            query_matrix: Their embeddings from _embed_queries, computed here if not given
+        
+        Returns:
+            (documents, cosine similarities, document vectors, query vector) per
+            query, or None when the store searches itself (see _dense_store).
+            Document vectors are None for indexes that cannot reconstruct them (IVF)
+        """
+        vectorstore = self._dense_store()
+        if vectorstore is None:
+            return None
+        if query_matrix is None:
+            query_matrix = self._embed_queries(queries)
+        
+        distances, indices = vectorstore.index.search(query_matrix, self.top_k_retrieval)
+        # Squared L2 between unit vectors is 2 - 2 * cosine; inner-product
+        # stores already return similarities
+        strategy = getattr(getattr(vectorstore, 'distance_strategy', None), 'value', None)
+        similarities = distances if strategy == 'MAX_INNER_PRODUCT' else 1 - distances / 2
+        
+        results = []
+        for query_vector, row_similarities, row in zip(query_matrix, similarities, indices):
+            docs = []
+            scores = []
+            ids = []
+            for similarity, idx in zip(row_similarities, row):
+                # Positions of documents removed since the index was built have no docstore id
+                doc_id = vectorstore.index_to_docstore_id.get(int(idx))
+                if doc_id is None:
+                    continue
+                doc = vectorstore.docstore.search(doc_id)
+                if isinstance(doc, Document):
+                    docs.append(doc)
+                    scores.append(float(similarity))
+                    ids.append(idx)
+            results.append((docs, scores, self._reconstruct(vectorstore.index, ids), query_vector))
+        return results
+    
+    @staticmethod
+    def _reconstruct(index, ids: List[int]) -> Optional[np.ndarray]:
+        """Stored vectors of the given index positions, or None if the index keeps none"""
+        if not ids:
+            return None
+        try:
+            return index.reconstruct_batch(np.asarray(ids, dtype=np.int64))
+        except RuntimeError:
+            return None
+    
     def configure_retrieval(self, top_k_retrieval: int = None, 
                           top_k_reranked: int = None):
         """Update retrieval configuration"""
@@ -91,12 +325,18 @@ class RerankingRetriever(BaseRetriever):
 
 def create_reranking_retriever(vectorstore, top_k_retrieval: int = None,
                               top_k_reranked: int = None, 
-                              enable_reranking: bool = True) -> RerankingRetriever:
+                              enable_reranking: bool = True,
+                              lexical_index=None,
+                              rerank_candidates: int = None,
+                              pipeline: str = 'rag') -> RerankingRetriever:
     """Create a reranking retriever from a vector store"""
     base_retriever = vectorstore.as_retriever()
     return RerankingRetriever(
         base_retriever=base_retriever,
         top_k_retrieval=top_k_retrieval,
         top_k_reranked=top_k_reranked,
-        enable_reranking=enable_reranking
+        enable_reranking=enable_reranking,
+        lexical_index=lexical_index,
+        rerank_candidates=rerank_candidates,
+        pipeline=pipeline
     )
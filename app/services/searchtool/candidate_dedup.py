@@ -0,0 +1,141 @@
+"""Near-duplicate collapse and MMR selection of retrieval candidates"""
+import zlib
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+DEDUP_MODES = ("off", "collapse", "mmr")
+DEDUP_COSINE_THRESHOLD = 0.95   # Embedding cosine at or above which two chunks are duplicates
+DEDUP_JACCARD_THRESHOLD = 0.8   # Estimated shingle Jaccard at or above which two chunks are duplicates
+MMR_LAMBDA = 0.7                # 1.0 is pure relevance, 0.0 pure diversity
+
+MINHASH_PERMUTATIONS = 64
+SHINGLE_SIZE = 5                # Words per shingle
+# Smallest prime above 2**32, so a * crc32 + b stays within uint64
+_MINHASH_PRIME = 4294967311
+
+
+def minhash_signatures(texts: Sequence[str], num_perm: int = MINHASH_PERMUTATIONS,
+                       shingle_size: int = SHINGLE_SIZE, seed: int = 1) -> np.ndarray:
+    """
+    MinHash signatures over word shingles
+
+    Returns:
+        uint64 matrix with one row per text; the fraction of equal columns
+        between two rows estimates the Jaccard similarity of their shingle sets
+    """
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, 1 << 32, num_perm, dtype=np.uint64)
+    b = rng.integers(0, 1 << 32, num_perm, dtype=np.uint64)
+
+    signatures = np.empty((len(texts), num_perm), dtype=np.uint64)
+    for row, text in enumerate(texts):
+        words = text.lower().split()
+        shingles = {
+            " ".join(words[i:i + shingle_size])
+            for i in range(max(1, len(words) - shingle_size + 1))
+        }
+        hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles),
+                             dtype=np.uint64, count=len(shingles))
+        signatures[row] = ((a[:, None] * hashes[None, :] + b[:, None]) % _MINHASH_PRIME).min(axis=1)
+    return signatures
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def collapse_near_duplicates(
+    texts: Sequence[str],
+    vectors: Optional[np.ndarray] = None,
+    cosine_threshold: float = DEDUP_COSINE_THRESHOLD,
+    jaccard_threshold: float = DEDUP_JACCARD_THRESHOLD
+) -> List[int]:
+    """
+    Drop candidates that nearly duplicate a better-ranked one
+
+    Candidates are compared by embedding cosine when vectors are given and by
+    MinHash Jaccard always, so texts without embeddings still collapse.
+
+    Args:
+        texts: Candidate texts, best first
+        vectors: Optional embeddings parallel to texts
+
+    Returns:
+        Positions of the kept candidates, in their original order
+    """
+    if len(texts) <= 1:
+        return list(range(len(texts)))
+
+    signatures = minhash_signatures(texts)
+    normalized = _normalize(vectors) if vectors is not None else None
+
+    keep: List[int] = []
+    for i in range(len(texts)):
+        if keep:
+            if normalized is not None and (normalized[keep] @ normalized[i]).max() >= cosine_threshold:
+                continue
+            if (signatures[keep] == signatures[i]).mean(axis=1).max() >= jaccard_threshold:
+                continue
+        keep.append(i)
+    return keep
+
+
+def mmr_select(query_vector: np.ndarray, vectors: np.ndarray, k: int,
+               lambda_mult: float = MMR_LAMBDA) -> List[int]:
+    """
+    Maximal marginal relevance selection
+
+    Returns:
+        Positions of up to k candidates, in selection order
+    """
+    vectors = _normalize(vectors)
+    relevance = vectors @ _normalize(query_vector)
+    redundancy = np.zeros(len(vectors), dtype=np.float32)
+    available = np.ones(len(vectors), dtype=bool)
+
+    selected: List[int] = []
+    for _ in range(min(k, len(vectors))):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        redundancy = np.maximum(redundancy, vectors @ vectors[best])
+    return selected
+
+
+def select_candidates(
+    texts: Sequence[str],
+    mode: str = "collapse",
+    vectors: Optional[np.ndarray] = None,
+    query_vector: Optional[np.ndarray] = None,
+    mmr_k: Optional[int] = None
+) -> Tuple[List[int], bool]:
+    """
+    Run the dedup stage between retrieval and reranking
+
+    Args:
+        texts: Candidate texts, best first
+        mode: "off", "collapse", or "mmr" (collapse, then MMR down to mmr_k;
+            falls back to collapse when embeddings are missing)
+        vectors: Optional candidate embeddings parallel to texts
+        query_vector: Query embedding, needed for MMR
+        mmr_k: Number of candidates MMR keeps
+
+    Returns:
+        (kept positions, whether they are still in the input order)
+    """
+    if mode not in DEDUP_MODES:
+        raise ValueError(f"Invalid dedup mode: {mode}. Available modes: {list(DEDUP_MODES)}")
+    if mode == "off":
+        return list(range(len(texts))), True
+
+    keep = collapse_near_duplicates(texts, vectors)
+    if mode == "mmr" and vectors is not None and query_vector is not None:
+        kept_vectors = np.asarray(vectors)[keep]
+        selected = mmr_select(query_vector, kept_vectors, mmr_k or len(keep))
+        return [keep[i] for i in selected], False
+    return keep, True
@@ -0,0 +1,144 @@
+import json
+from array import array
+from collections.abc import Sequence
+from typing import Any, Dict, Hashable, List
+
+
+class _InternedColumn:
+    """One metadata field stored as distinct values plus a per-chunk code array"""
+
+    MISSING = -1
+
+    def __init__(self, size: int = 0):
+        self.values: List[Any] = []
+        self._codes_by_key: Dict[Hashable, int] = {}
+        self.codes = array('i', [self.MISSING]) * size
+
+    @staticmethod
+    def _key(value: Any) -> Hashable:
+        # Keyed by type too, so 1, 1.0 and True stay distinct values
+        try:
+            hash(value)
+            return type(value), value
+        except TypeError:
+            return type(value), json.dumps(value, sort_keys=True, default=str)
+
+    def append(self, value: Any):
+        key = self._key(value)
+        code = self._codes_by_key.get(key)
+        if code is None:
+            code = len(self.values)
+            self._codes_by_key[key] = code
+            self.values.append(value)
+        self.codes.append(code)
+
+    def append_missing(self):
+        self.codes.append(self.MISSING)
+
+
+class _TextView(Sequence):
+    """Read-only list-like view of a ChunkStore's texts"""
+
+    def __init__(self, store: "ChunkStore"):
+        self._store = store
+
+    def __len__(self) -> int:
+        return len(self._store)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self._store.text(i) for i in range(*position.indices(len(self)))]
+        return self._store.text(position)
+
+
+class _MetadataView(_TextView):
+    """Read-only list-like view of a ChunkStore's metadata, materialized per access"""
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self._store.metadata(i) for i in range(*position.indices(len(self)))]
+        return self._store.metadata(position)
+
+
+class ChunkStore:
+    """
+    Compact storage for chunk texts and metadata
+
+    Texts live in one contiguous UTF-8 buffer indexed by an offsets array, and
+    metadata fields live in interned columns, so values repeated across chunks
+    (source, title, timestamp, document preview) are stored once. Metadata dicts
+    are only built when a chunk is read.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._offsets = array('q', [0])
+        self._columns: Dict[str, _InternedColumn] = {}
+        self.texts = _TextView(self)
+        self.metadatas = _MetadataView(self)
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def append(self, text: str, metadata: Dict = None, **fields):
+        """
+        Add one chunk
+
+        Args:
+            text: Chunk text
+            metadata: Metadata shared with the source document (not copied)
+            **fields: Extra per-chunk fields, e.g. chunk_id
+        """
+        position = len(self)
+        self._buffer.extend(text.encode('utf-8'))
+        self._offsets.append(len(self._buffer))
+
+        seen = set()
+        for source in (metadata or {}, fields):
+            for key, value in source.items():
+                column = self._columns.get(key)
+                if column is None:
+                    column = self._columns[key] = _InternedColumn(position)
+                if key in seen:
+                    # Per-chunk fields override document metadata
+                    column.codes.pop()
+                column.append(value)
+                seen.add(key)
+
+        for key, column in self._columns.items():
+            if key not in seen:
+                column.append_missing()
+
+    def extend(self, texts: List[str], metadatas: List[Dict]):
+        """Add chunks with one metadata dict each"""
+        for text, metadata in zip(texts, metadatas):
+            self.append(text, metadata)
+
+    def _check_position(self, position: int) -> int:
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError("chunk index out of range")
+        return position
+
+    def text(self, position: int) -> str:
+        """Decode one chunk's text"""
+        position = self._check_position(position)
+        start, end = self._offsets[position], self._offsets[position + 1]
+        return self._buffer[start:end].decode('utf-8')
+
+    def metadata(self, position: int) -> Dict:
+        """Materialize one chunk's metadata dict"""
+        position = self._check_position(position)
+        return {
+            key: column.values[column.codes[position]]
+            for key, column in self._columns.items()
+            if column.codes[position] != _InternedColumn.MISSING
+        }
+
+    def nbytes(self) -> int:
+        """Approximate memory held by the text buffer and column arrays"""
+        column_bytes = sum(
+            column.codes.itemsize * len(column.codes) for column in self._columns.values()
+        )
+        return len(self._buffer) + self._offsets.itemsize * len(self._offsets) + column_bytes
@@ -1,4 +1,6 @@
+import asyncio
 import logging
+import time
 from typing import List, Dict, Set, Tuple
 
 from ddgs import DDGS
@@ -31,7 +33,8 @@ class LinkSearch:
                      page: int = 1, 
                      before: str = None, 
                      after: str = None,
-                     backend: str = "mullvad_google"):
+                     backend: str = "mullvad_google",
+                     deadline: float = None):
         """
         Search web and return URLs
         
@@ -42,6 +45,7 @@ class LinkSearch:
             before: Optional date string to filter results before this date (YYYY-MM-DD)
             after: Optional date string to filter results after this date (YYYY-MM-DD)
             backend: Search Engine to use (default: "google")
+            deadline: Optional time.monotonic() timestamp after which the search is abandoned
 
         Returns:
             List of URLs
@@ -59,10 +63,16 @@ class LinkSearch:
             
 
             print(f"DDGS search: '{search_query}' (max_results={num_results}, page={page}) - (before: {before}, after: {after})")
-            results = DDGS().text(search_query, 
-                                  max_results=num_results, 
-                                  page=page, 
-                                  backend=backend)
+            # DDGS is blocking; run it off the event loop so the deadline can be enforced
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            results = await asyncio.wait_for(
+                asyncio.to_thread(DDGS().text,
+                                  search_query,
+                                  max_results=num_results,
+                                  page=page,
+                                  backend=backend),
+                timeout=timeout
+            )
 
             if results:
                 # urls = [result["href"] for result in results]
@@ -72,6 +82,9 @@ class LinkSearch:
             print("No search results found")
             return []
             
+        except asyncio.TimeoutError:
+            print("Web search timed out before the deadline")
+            return []
         except Exception as e:
             print(f"Web search failed: {str(e)}")
             return []
@@ -0,0 +1,214 @@
+"""Confidence-based early exit for cross-encoder reranking"""
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Dense cosine margin between the top hit and the k-th hit above which the
+# dense order is trusted without reranking. Per embedding model, since score
+# spreads differ widely; re-derive with benchmarks/calibrate_rerank_cascade.py
+SKIP_MARGINS = {
+    "google/embeddinggemma-300m": 0.30,
+    "sentence-transformers/all-MiniLM-L6-v2": 0.35,
+    "BAAI/bge-base-en-v1.5": 0.20,
+}
+DEFAULT_SKIP_MARGIN = 0.35
+
+# Cross-encoder score of the k-th hit of the first batch above which the
+# remaining candidates are not scored. Per rerank model (raw logits)
+ACCEPT_SCORES = {
+    "cross-encoder/ms-marco-MiniLM-L-6-v2": 2.0,
+}
+DEFAULT_ACCEPT_SCORE = 2.0
+
+# The first batch is this many times k, in dense order
+FIRST_BATCH_FACTOR = 2
+
+STAGES = ("skipped", "first_batch", "full")
+
+
+@dataclass
+class CascadeResult:
+    """Outcome of the cascade for one query"""
+    order: List[int]     # Candidate positions, best first, at most top_k
+    scores: List[float]  # Rerank scores, or dense scores when skipped
+    stage: str           # One of STAGES
+
+
+class RerankCascade:
+    """
+    Adaptive reranking cascade
+
+    For each query the dense margin (top hit minus k-th hit) is checked first;
+    a decisive margin returns the dense order without calling the cross-encoder.
+    Otherwise the first FIRST_BATCH_FACTOR * k candidates are reranked, and the
+    rest only when the k-th score of that batch is below the accept score.
+    Stages run over all queries together so batched callers keep one
+    cross-encoder call per stage.
+    """
+
+    def __init__(self, skip_margin: float = DEFAULT_SKIP_MARGIN,
+                 accept_score: float = DEFAULT_ACCEPT_SCORE,
+                 first_batch_factor: int = FIRST_BATCH_FACTOR):
+        self.skip_margin = skip_margin
+        self.accept_score = accept_score
+        self.first_batch_factor = first_batch_factor
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    @classmethod
+    def for_models(cls, embedding_model_name: str, rerank_model_name: str) -> "RerankCascade":
+        """Create a cascade with the calibrated thresholds of a model pair"""
+        return cls(
+            skip_margin=SKIP_MARGINS.get(embedding_model_name, DEFAULT_SKIP_MARGIN),
+            accept_score=ACCEPT_SCORES.get(rerank_model_name, DEFAULT_ACCEPT_SCORE)
+        )
+
+    def reset_stats(self):
+        """Zero the skip-rate and latency counters"""
+        with self._lock:
+            self._stage_counts = dict.fromkeys(STAGES, 0)
+            self._pairs_scored = 0
+            self._pairs_saved = 0
+            self._predict_seconds = 0.0
+
+    def should_skip(self, dense_scores: Optional[Sequence[float]], top_k: int) -> bool:
+        """Whether the dense margin alone is decisive for this query"""
+        if dense_scores is None:
+            return False
+        if len(dense_scores) <= 1:
+            return True
+        margin = dense_scores[0] - dense_scores[min(top_k, len(dense_scores)) - 1]
+        return margin >= self.skip_margin
+
+    def run(
+        self,
+        candidate_counts: List[int],
+        top_k: int,
+        score_pairs: Callable[[List[Tuple[int, int]]], np.ndarray],
+        dense_scores_per_query: Optional[List[Optional[Sequence[float]]]] = None
+    ) -> List[CascadeResult]:
+        """
+        Rerank the candidates of several queries through the cascade
+
+        Args:
+            candidate_counts: Number of candidates per query, each list in dense order
+            top_k: Number of results to keep per query
+            score_pairs: Scores a list of (query position, candidate position)
+                pairs with the cross-encoder, returning one score per pair
+            dense_scores_per_query: Dense similarities (higher is better) per
+                query, or None where they are unknown; queries without them are
+                never skipped
+
+        Returns:
+            One CascadeResult per query
+        """
+        dense_scores_per_query = dense_scores_per_query or [None] * len(candidate_counts)
+        top_k = top_k or max(candidate_counts, default=0)
+        results: List[Optional[CascadeResult]] = [None] * len(candidate_counts)
+        scores: Dict[int, Dict[int, float]] = {}
+
+        # Stage 0: decisive dense margin
+        pending = []
+        for query_pos, (count, dense_scores) in enumerate(zip(candidate_counts, dense_scores_per_query)):
+            if count == 0:
+                results[query_pos] = CascadeResult([], [], "skipped")
+            elif self.should_skip(dense_scores, top_k):
+                order = list(range(min(count, top_k)))
+                results[query_pos] = CascadeResult(order, [float(dense_scores[i]) for i in order], "skipped")
+            else:
+                pending.append(query_pos)
+                scores[query_pos] = {}
+
+        # Stage 1: first batch in dense order
+        first_batch = max(top_k, self.first_batch_factor * top_k)
+        self._score(score_pairs, scores, [
+            (query_pos, i) for query_pos in pending for i in range(min(candidate_counts[query_pos], first_batch))
+        ])
+
+        # Stage 2: the rest, only for queries whose first batch is ambiguous
+        remaining = []
+        for query_pos in pending:
+            if candidate_counts[query_pos] <= first_batch:
+                continue
+            batch_scores = sorted(scores[query_pos].values(), reverse=True)
+            if batch_scores[top_k - 1] < self.accept_score:
+                remaining.extend((query_pos, i) for i in range(first_batch, candidate_counts[query_pos]))
+        self._score(score_pairs, scores, remaining)
+
+        for query_pos in pending:
+            query_scores = scores[query_pos]
+            order = sorted(query_scores, key=lambda i: query_scores[i], reverse=True)[:top_k]
+            stage = "full" if len(query_scores) == candidate_counts[query_pos] else "first_batch"
+            results[query_pos] = CascadeResult(order, [query_scores[i] for i in order], stage)
+
+        self._record(results, candidate_counts, first_batch)
+        return results
+
+    def _score(self, score_pairs, scores: Dict[int, Dict[int, float]], pairs: List[Tuple[int, int]]):
+        if not pairs:
+            return
+        start = time.perf_counter()
+        pair_scores = np.asarray(score_pairs(pairs), dtype=np.float64)
+        elapsed = time.perf_counter() - start
+        for (query_pos, candidate_pos), score in zip(pairs, pair_scores):
+            scores[query_pos][candidate_pos] = float(score)
+        with self._lock:
+            self._pairs_scored += len(pairs)
+            self._predict_seconds += elapsed
+
+    def _record(self, results: List[CascadeResult], candidate_counts: List[int], first_batch: int):
+        with self._lock:
+            for result, count in zip(results, candidate_counts):
+                if count == 0:
+                    continue
+                self._stage_counts[result.stage] += 1
+                if result.stage == "skipped":
+                    self._pairs_saved += count
+                elif result.stage == "first_batch":
+                    self._pairs_saved += count - first_batch
+
+    def get_stats(self) -> Dict:
+        """Skip rate and estimated cross-encoder time saved since the last reset"""
+        with self._lock:
+            queries = sum(self._stage_counts.values())
+            seconds_per_pair = self._predict_seconds / self._pairs_scored if self._pairs_scored else 0.0
+            return {
+                'queries': queries,
+                'skipped': self._stage_counts['skipped'],
+                'first_batch_only': self._stage_counts['first_batch'],
+                'full_rerank': self._stage_counts['full'],
+                'skip_rate': self._stage_counts['skipped'] / queries if queries else 0.0,
+                'pairs_scored': self._pairs_scored,
+                'pairs_saved': self._pairs_saved,
+                'rerank_seconds': self._predict_seconds,
+                'estimated_seconds_saved': self._pairs_saved * seconds_per_pair,
+                'skip_margin': self.skip_margin,
+                'accept_score': self.accept_score,
+            }
+
+
+def calibrate_skip_margin(margins: Sequence[float], agreements: Sequence[bool],
+                          target_agreement: float = 0.95) -> Optional[float]:
+    """
+    Pick the smallest dense margin whose skipped queries agree with the reranker
+
+    Args:
+        margins: Dense margin (top hit minus k-th hit) per calibration query
+        agreements: Whether the dense top-k matched the reranked top-k for that query
+        target_agreement: Required agreement rate among queries that would be skipped
+
+    Returns:
+        The margin threshold, or None if no threshold reaches the target
+    """
+    margins = np.asarray(margins, dtype=np.float64)
+    agreements = np.asarray(agreements, dtype=bool)
+    order = np.argsort(-margins)
+    # Agreement rate of the queries skipped when the threshold is each margin
+    agreement_rates = np.cumsum(agreements[order]) / np.arange(1, len(order) + 1)
+    passing = np.nonzero(agreement_rates >= target_agreement)[0]
+    if not len(passing):
+        return None
+    return float(margins[order][passing[-1]])
@@ -1,5 +1,7 @@
+import asyncio
 import logging
-from typing import List
+import time
+from typing import AsyncIterator, List, Optional, Tuple
 
 from crawl4ai import AsyncWebCrawler, BrowserConfig, CacheMode, CrawlerRunConfig
 from crawl4ai.content_filter_strategy import BM25ContentFilter
@@ -10,6 +12,16 @@ from urllib.parse import urlparse
 
 logger = logging.getLogger(__name__)
 
+PAGE_TIMEOUT_MS = 20000
+
+
+def remaining_time(deadline: Optional[float]) -> Optional[float]:
+    """Seconds left until a time.monotonic() deadline, or None if there is no deadline"""
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
+
+
 def extract_urls(text):
     """Extract and clean URLs from text input"""
     if not text:
@@ -65,21 +77,19 @@ class Scraper:
             "Cache-Control": "max-age=0"
         }
     
-    async def crawl(self, urls: List[str], query: str = None) -> List[CrawlResult]:
+    def _build_configs(self, query: str = None, stream: bool = False,
+                       deadline: float = None) -> Tuple[BrowserConfig, CrawlerRunConfig]:
         """
-        Crawl web pages with optimized settings
+        Build browser and crawler configuration
         
         Args:
-            urls: List of URLs to crawl
             query: Optional query for content filtering
+            stream: Whether arun_many should yield results as they complete
+            deadline: Optional time.monotonic() deadline; page timeouts never run past it
             
         Returns:
-            List of successful crawl results
+            Tuple of (browser_config, crawler_config)
         """
-        if not urls:
-            logger.warning("No URLs to crawl")
-            return []
-        
         # Setup content filter if query provided
         bm25_filter = None
         if query:
@@ -87,6 +97,11 @@ class Scraper:
         
         md_generator = DefaultMarkdownGenerator(content_filter=bm25_filter)
         
+        page_timeout = PAGE_TIMEOUT_MS
+        remaining = remaining_time(deadline)
+        if remaining is not None:
+            page_timeout = max(1000, min(page_timeout, int(remaining * 1000)))
+        
         # Browser configuration
         browser_config = BrowserConfig(
             headless=True,
@@ -105,8 +120,32 @@ class Scraper:
             keep_data_attributes=False,
             cache_mode=CacheMode.BYPASS,
             remove_overlay_elements=True,
-            page_timeout=20000,  # 5 seconds timeout in milliseconds
+            page_timeout=page_timeout,
+            stream=stream,
         )
+        return browser_config, crawler_config
+    
+    async def crawl(self, urls: List[str], query: str = None, deadline: float = None) -> List[CrawlResult]:
+        """
+        Crawl web pages with optimized settings
+        
+        Args:
+            urls: List of URLs to crawl
+            query: Optional query for content filtering
+            deadline: Optional time.monotonic() deadline; pages still outstanding
+                when it expires are cancelled and only finished pages are returned
+            
+        Returns:
+            List of successful crawl results
+        """
+        if not urls:
+            logger.warning("No URLs to crawl")
+            return []
+        
+        if deadline is not None:
+            return [result async for result in self.crawl_stream(urls, query, deadline)]
+        
+        browser_config, crawler_config = self._build_configs(query)
         
         try:
             async with AsyncWebCrawler(config=browser_config) as crawler:
@@ -118,3 +157,46 @@ class Scraper:
         except Exception as e:
             logger.error(f"Crawling failed: {str(e)}")
             return []
+    
+    async def crawl_stream(self, urls: List[str], query: str = None,
+                           deadline: float = None) -> AsyncIterator[CrawlResult]:
+        """
+        Crawl web pages, yielding each successful result as soon as it completes
+        
+        Args:
+            urls: List of URLs to crawl
+            query: Optional query for content filtering
+            deadline: Optional time.monotonic() deadline; when it expires the
+                crawler is shut down, cancelling any outstanding fetches
+            
+        Yields:
+            Successful crawl results in completion order
+        """
+        if not urls:
+            logger.warning("No URLs to crawl")
+            return
+        
+        browser_config, crawler_config = self._build_configs(query, stream=True, deadline=deadline)
+        successful = 0
+        
+        try:
+            async with AsyncWebCrawler(config=browser_config) as crawler:
+                results = await asyncio.wait_for(
+                    crawler.arun_many(urls, config=crawler_config),
+                    timeout=remaining_time(deadline)
+                )
+                while True:
+                    try:
+                        result = await asyncio.wait_for(anext(results), timeout=remaining_time(deadline))
+                    except StopAsyncIteration:
+                        break
+                    if result.success and result.markdown:
+                        successful += 1
+                        yield result
+                        
+        except asyncio.TimeoutError:
+            logger.warning(f"Crawl deadline reached after {successful}/{len(urls)} pages, cancelling the rest")
+        except Exception as e:
+            logger.error(f"Crawling failed: {str(e)}")
+        
+        logger.info(f"Successfully crawled {successful}/{len(urls)} pages")
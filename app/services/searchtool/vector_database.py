@@ -1,11 +1,21 @@
+import json
 import logging
+import mmap as mmap_module
+import os
+import threading
+from collections.abc import Sequence
 from pathlib import Path
-from typing import List, Tuple, Optional, Dict, Union
+from typing import Callable, Iterable, List, Tuple, Optional, Dict, Union
 
 import numpy as np
 import faiss
 from sentence_transformers import SentenceTransformer, CrossEncoder
 
+from .candidate_dedup import DEDUP_MODES, select_candidates
+from .chunk_store import ChunkStore
+from .rerank_cascade import RerankCascade
+from app.utils.tracing import span
+
 logger = logging.getLogger(__name__)
 
 # Constants
@@ -36,6 +46,84 @@ DEFAULT_RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
 DEFAULT_TOP_K = 10
 DEFAULT_CHUNK_OVERLAP = 50
 
+# Index selection
+# Per-query web corpora are a few dozen chunks, where building an ANN graph costs
+# far more than an exact matrix product. See benchmarks/bench_vector_index.py.
+INDEX_TYPES = ("auto", "exact", "hnsw", "ivf")
+EXACT_SEARCH_MAX_VECTORS = 20000  # Above this, "auto" promotes to HNSW
+IVF_MIN_VECTORS = 200000          # Above this, "auto" promotes to IVF
+# Vectors buffered (and searched exactly) before IVF centroids are trained on
+# them, as StreamingIndexBuilder does; centroids from one small first batch of
+# a streamed corpus would be kept for every later batch
+IVF_TRAINING_VECTORS = 65536
+HNSW_M = 32
+HNSW_EF_SEARCH = 64
+RERANK_BATCH_SIZE = 32
+
+# On-disk layout written by VectorDatabase.save()
+STORE_FORMAT_VERSION = 1
+MANIFEST_FILE = "store.json"
+INDEX_FILE = "index.faiss"
+VECTORS_FILE = "vectors.npy"
+DOCUMENTS_FILE = "documents.bin"
+DOCUMENT_OFFSETS_FILE = "documents.offsets.npy"
+METADATA_FILE = "metadata.jsonl"
+METADATA_OFFSETS_FILE = "metadata.offsets.npy"
+
+
+def _temp_path(path: Path) -> Path:
+    """Sibling path a file is written to before being moved over path"""
+    return path.with_name(path.name + ".tmp")
+
+
+def _write_records(records: Iterable[str], data_path: Path, offsets_path: Path):
+    """
+    Write strings back to back as UTF-8 with an int64 offsets array (n + 1 entries)
+    
+    Both files are written aside and then moved into place, so records may be
+    read from a mapping of the files being replaced (a store saved over the
+    directory it was loaded from).
+    """
+    offsets = [0]
+    with open(_temp_path(data_path), "wb") as data_file:
+        for record in records:
+            encoded = record.encode("utf-8")
+            data_file.write(encoded)
+            offsets.append(offsets[-1] + len(encoded))
+    with open(_temp_path(offsets_path), "wb") as offsets_file:
+        np.save(offsets_file, np.asarray(offsets, dtype=np.int64))
+    os.replace(_temp_path(data_path), data_path)
+    os.replace(_temp_path(offsets_path), offsets_path)
+
+
+class _MappedRecords(Sequence):
+    """Read-only sequence of records decoded on access from a memory-mapped UTF-8 file"""
+    
+    def __init__(self, data_path: Path, offsets_path: Path, decode: Callable[[str], object] = None,
+                 use_mmap: bool = True):
+        self._offsets = np.load(offsets_path, mmap_mode="r" if use_mmap else None)
+        self._decode = decode
+        if use_mmap and data_path.stat().st_size > 0:
+            with open(data_path, "rb") as data_file:
+                # The mapping stays valid after the file handle is closed
+                self._buffer = mmap_module.mmap(data_file.fileno(), 0, access=mmap_module.ACCESS_READ)
+        else:
+            self._buffer = data_path.read_bytes()
+    
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+    
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(len(self)))]
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError("record index out of range")
+        start, end = int(self._offsets[position]), int(self._offsets[position + 1])
+        record = self._buffer[start:end].decode("utf-8")
+        return self._decode(record) if self._decode else record
+
 
 class VectorDatabase:
     """Manages FAISS vector store with reranking and configurable chunking"""
@@ -47,12 +135,24 @@ class VectorDatabase:
         chunk_size: int = None,
         chunk_overlap: int = DEFAULT_CHUNK_OVERLAP,
         enable_rerank: bool = True,
-        rerank_model_name: str = DEFAULT_RERANK_MODEL
+        rerank_model_name: str = DEFAULT_RERANK_MODEL,
+        index_type: str = "auto",
+        exact_search_max_vectors: int = EXACT_SEARCH_MAX_VECTORS,
+        ivf_min_vectors: int = IVF_MIN_VECTORS,
+        ivf_training_vectors: int = IVF_TRAINING_VECTORS,
+        rerank_early_exit: bool = True,
+        candidate_dedup: str = "collapse"
     ):
         # Validate and set embedding model configuration
         if embedding_model_key not in EMBEDDING_MODELS:
             raise ValueError(f"Invalid embedding model key: {embedding_model_key}. "
                            f"Available models: {list(EMBEDDING_MODELS.keys())}")
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Invalid index type: {index_type}. "
+                           f"Available types: {list(INDEX_TYPES)}")
+        if candidate_dedup not in DEDUP_MODES:
+            raise ValueError(f"Invalid dedup mode: {candidate_dedup}. "
+                           f"Available modes: {list(DEDUP_MODES)}")
         
         self.embedding_model_key = embedding_model_key
         self.model_config = EMBEDDING_MODELS[embedding_model_key]
@@ -63,41 +163,241 @@ class VectorDatabase:
         self.chunk_overlap = chunk_overlap
         self.enable_rerank = enable_rerank
         self.rerank_model_name = rerank_model_name
-        
+        self.index_type = index_type
+        self.exact_search_max_vectors = exact_search_max_vectors
+        self.ivf_min_vectors = ivf_min_vectors
+        self.ivf_training_vectors = ivf_training_vectors
+        # Skips or shortens reranking when dense scores are decisive
+        self.rerank_cascade: Optional[RerankCascade] = (
+            RerankCascade.for_models(self.model_config["model_name"], rerank_model_name)
+            if rerank_early_exit else None
+        )
+        # Near-duplicate collapse ("collapse") or MMR ("mmr") before reranking
+        self.candidate_dedup = candidate_dedup
+        
+        # Small corpora are searched exactly against the raw embedding matrix;
+        # self.index is only built once the corpus outgrows that.
         self.index: Optional[faiss.Index] = None
-        self.documents: List[str] = []
-        self.metadata: List[Dict] = []
+        self.vectors: Optional[np.ndarray] = None
+        # Preallocated rows self.vectors is a leading view of while it grows
+        self._vector_buffer: Optional[np.ndarray] = None
+        self.active_index_type: Optional[str] = None
+        # documents/metadata are list-like views; chunk_store is None for read-only mapped stores
+        self.chunk_store: Optional[ChunkStore] = None
+        self.documents: Sequence = []
+        self.metadata: Sequence = []
+        self._reset_chunks()
         self.embedding_model: Optional[SentenceTransformer] = None
         self.rerank_model: Optional[CrossEncoder] = None
         self.is_embedding_gemma: bool = False
+        # Shared with stores created by new_store() so models are loaded once
+        self._model_lock = threading.Lock()
         
     def initialize(self):
-        """Initialize or reset the FAISS index"""
-        print("Initializing FAISS index")
-        # self.index = faiss.IndexFlatIP(self.dimension)
-        self.index = faiss.IndexHNSWFlat(self.dimension, 32, faiss.METRIC_INNER_PRODUCT)
-        self.documents = []
-        self.metadata = []
+        """Initialize or reset the vector index"""
+        print(f"Initializing vector index (type={self.index_type})")
+        self.index = None
+        self.vectors = np.empty((0, self.dimension), dtype='float32')
+        self._vector_buffer = None
+        self.active_index_type = "exact"
+        if self.index_type in ("hnsw", "ivf"):
+            # Forced ANN types are built up front (IVF waits for ivf_training_vectors)
+            self._build_ann_index(self.vectors, self.index_type)
+        self._reset_chunks()
+    
+    def _reset_chunks(self):
+        """Start a new, empty chunk store"""
+        self.chunk_store = ChunkStore()
+        self.documents = self.chunk_store.texts
+        self.metadata = self.chunk_store.metadatas
+    
+    def _choose_index_type(self, total_vectors: int) -> str:
+        """Pick the index structure for a corpus of the given size"""
+        if self.index_type != "auto":
+            return self.index_type
+        if total_vectors <= self.exact_search_max_vectors:
+            return "exact"
+        if total_vectors < self.ivf_min_vectors:
+            return "hnsw"
+        return "ivf"
+    
+    def _build_ann_index(self, vectors: np.ndarray, index_type: str):
+        """Build an HNSW or IVF index over the given vectors"""
+        if index_type == "hnsw":
+            index = faiss.IndexHNSWFlat(self.dimension, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efSearch = HNSW_EF_SEARCH
+        elif len(vectors) == 0:
+            # IVF needs training data; stay exact until _add_vectors has enough
+            return
+        else:
+            nlist = max(1, min(int(4 * np.sqrt(len(vectors))), len(vectors) // 39 or 1))
+            quantizer = faiss.IndexFlatIP(self.dimension)
+            index = faiss.IndexIVFFlat(quantizer, self.dimension, nlist, faiss.METRIC_INNER_PRODUCT)
+            index.train(vectors)
+            index.nprobe = max(1, nlist // 16)
+        
+        if len(vectors):
+            index.add(vectors)
+        print(f"Built {index_type} index over {len(vectors)} vectors")
+        self.index = index
+        self.vectors = None
+        self._vector_buffer = None
+        self.active_index_type = index_type
+    
+    def _add_vectors(self, embeddings: np.ndarray):
+        """
+        Add embeddings, promoting the exact matrix to an ANN index when it grows too large
+        
+        The exact matrix is a view of a buffer that grows geometrically, so a
+        corpus streamed in many small batches is copied O(log n) times rather
+        than once per batch. An IVF index is only trained once
+        ivf_training_vectors have arrived; until then batches are searched exactly.
+        """
+        if self.index is not None:
+            self.index.add(embeddings)
+            return
+        
+        count = len(self.vectors)
+        total = count + len(embeddings)
+        target_type = self._choose_index_type(total)
+        if target_type == "ivf" and total < self.ivf_training_vectors:
+            # Centroids are trained once; keep the batches until there are enough to train on
+            target_type = "exact"
+        if target_type != "exact":
+            vectors = np.concatenate([self.vectors, embeddings]) if count else embeddings
+            self._build_ann_index(vectors, target_type)
+            return
+        
+        buffer = self._vector_buffer
+        # Loaded or externally assigned matrices are not views of the buffer
+        if buffer is None or self.vectors.base is not buffer or len(buffer) < total:
+            capacity = max(total, 2 * count)
+            # Past this many rows they move into an ANN index
+            limit = {"auto": self.exact_search_max_vectors, "ivf": self.ivf_training_vectors}.get(self.index_type)
+            if limit is not None:
+                capacity = min(capacity, max(total, limit))
+            buffer = np.empty((capacity, self.dimension), dtype='float32')
+            buffer[:count] = self.vectors
+            self._vector_buffer = buffer
+        buffer[count:total] = embeddings
+        self.vectors = buffer[:total]
+    
+    def _search_vectors(self, query_embeddings: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Search the active index
+        
+        Returns:
+            Tuple of (scores, indices) with one row per query, as faiss.Index.search does
+        """
+        if self.index is not None:
+            return self.index.search(query_embeddings, k)
+        
+        # Exact inner-product search against the embedding matrix
+        similarities = query_embeddings @ self.vectors.T
+        k = min(k, similarities.shape[1])
+        if k < similarities.shape[1]:
+            top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        else:
+            top = np.tile(np.arange(similarities.shape[1]), (len(similarities), 1))
+        top_scores = np.take_along_axis(similarities, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        return np.take_along_axis(top_scores, order, axis=1), np.take_along_axis(top, order, axis=1)
+    
+    def _get_vectors(self, ids: List[int]) -> Optional[np.ndarray]:
+        """Stored embeddings of the given chunks, or None if the index cannot reconstruct them"""
+        if self.index is None:
+            return np.asarray(self.vectors[ids])
+        try:
+            return self.index.reconstruct_batch(np.asarray(ids, dtype='int64'))
+        except RuntimeError:
+            # IVF indexes keep no direct map back to their vectors
+            return None
+    
+    def _dedup_candidates(self, query_embedding: np.ndarray, results: List[str], result_ids: List[int],
+                          initial_scores: List[float], k: int) -> Tuple[List[str], List[int], Optional[List[float]]]:
+        """
+        Collapse near-duplicate candidates (or select them by MMR) before reranking
+        
+        Returns:
+            (results, result_ids, dense scores); the scores are None once MMR has
+            reordered the candidates, since early exit expects dense order
+        """
+        if self.candidate_dedup == "off" or len(results) <= 1:
+            return results, result_ids, initial_scores
+        
+        keep, dense_order = select_candidates(
+            results, self.candidate_dedup,
+            vectors=self._get_vectors(result_ids),
+            query_vector=query_embedding,
+            mmr_k=max(k, len(results) // 2)
+        )
+        if len(keep) < len(results):
+            print(f"Candidate dedup kept {len(keep)} of {len(results)} candidates")
+        return (
+            [results[i] for i in keep],
+            [result_ids[i] for i in keep],
+            [initial_scores[i] for i in keep] if dense_order else None
+        )
         
     def load_embedding_model(self, model_name: str = None):
         """Load embedding model with caching"""
-        if self.embedding_model is None:
-            # Use configured model if no model_name provided
-            model_to_load = model_name or self.model_config["model_name"]
-            print(f"Loading embedding model: {model_to_load} ({self.model_config['description']})")
-            self.embedding_model = SentenceTransformer(model_to_load, trust_remote_code=True)
-            # Check if this is EmbeddingGemma which has special methods
-            self.is_embedding_gemma = "embeddinggemma" in model_to_load.lower()
-            print(f"EmbeddingGemma model detected: {self.is_embedding_gemma}")
+        with self._model_lock:
+            if self.embedding_model is None:
+                # Use configured model if no model_name provided
+                model_to_load = model_name or self.model_config["model_name"]
+                print(f"Loading embedding model: {model_to_load} ({self.model_config['description']})")
+                self.embedding_model = SentenceTransformer(model_to_load, trust_remote_code=True)
+                # Check if this is EmbeddingGemma which has special methods
+                self.is_embedding_gemma = "embeddinggemma" in model_to_load.lower()
+                print(f"EmbeddingGemma model detected: {self.is_embedding_gemma}")
         return self.embedding_model
     
     def load_rerank_model(self):
         """Load reranking model (CrossEncoder)"""
-        if self.rerank_model is None and self.enable_rerank:
-            print(f"Loading rerank model: {self.rerank_model_name}")
-            self.rerank_model = CrossEncoder(self.rerank_model_name)
+        with self._model_lock:
+            if self.rerank_model is None and self.enable_rerank:
+                print(f"Loading rerank model: {self.rerank_model_name}")
+                self.rerank_model = CrossEncoder(self.rerank_model_name)
         return self.rerank_model
     
+    def new_store(self) -> "VectorDatabase":
+        """
+        Create an empty store with the same configuration that shares this
+        instance's loaded models
+        
+        Each store owns its own index, documents and metadata, so stores created
+        here can be filled and searched from different threads without seeing
+        each other's data, while the embedding and rerank models stay loaded once.
+        
+        Returns:
+            A new, initialized VectorDatabase
+        """
+        self.load_embedding_model()
+        self.load_rerank_model()
+        
+        store = VectorDatabase(
+            embedding_model_key=self.embedding_model_key,
+            dimension=self.dimension,
+            chunk_size=self.chunk_size,
+            chunk_overlap=self.chunk_overlap,
+            enable_rerank=self.enable_rerank,
+            rerank_model_name=self.rerank_model_name,
+            index_type=self.index_type,
+            exact_search_max_vectors=self.exact_search_max_vectors,
+            ivf_min_vectors=self.ivf_min_vectors,
+            ivf_training_vectors=self.ivf_training_vectors,
+            rerank_early_exit=self.rerank_cascade is not None,
+            candidate_dedup=self.candidate_dedup
+        )
+        # Shared so skip-rate stats cover every request-scoped store
+        store.rerank_cascade = self.rerank_cascade
+        store.embedding_model = self.embedding_model
+        store.is_embedding_gemma = self.is_embedding_gemma
+        store.rerank_model = self.rerank_model
+        store._model_lock = self._model_lock
+        store.initialize()
+        return store
+    
     def chunk_text(self, text: str) -> List[str]:
         """
         Split text into overlapping chunks
@@ -154,10 +454,14 @@ class VectorDatabase:
         if self.embedding_model is None:
             self.load_embedding_model()
             
-        if self.index is None:
+        if self.index is None and self.vectors is None:
             self.initialize()
         
-        # Chunk documents if enabled
+        if self.chunk_store is None:
+            raise ValueError("This store was loaded read-only; load it with mmap=False to add documents")
+        
+        # Chunk documents if enabled. Chunk metadata is kept as (document metadata,
+        # per-chunk fields) so the chunk store can intern it without per-chunk copies
         chunked_docs = []
         chunked_metadata = []
         
@@ -167,17 +471,16 @@ class VectorDatabase:
                 chunked_docs.extend(chunks)
                 
                 # Add chunk information to metadata
-                for i, chunk in enumerate(chunks):
-                    chunk_meta = meta.copy()
-                    chunk_meta.update({
+                preview = doc[:100] + '...' if len(doc) > 100 else doc
+                for i in range(len(chunks)):
+                    chunked_metadata.append((meta, {
                         'chunk_id': i,
                         'total_chunks': len(chunks),
-                        'original_doc': doc[:100] + '...' if len(doc) > 100 else doc
-                    })
-                    chunked_metadata.append(chunk_meta)
+                        'original_doc': preview
+                    }))
         else:
             chunked_docs = documents
-            chunked_metadata = metadatas
+            chunked_metadata = [(meta, {}) for meta in metadatas]
         
         # Batch encode for better performance
         print(f"Encoding {len(chunked_docs)} documents/chunks")
@@ -213,9 +516,9 @@ class VectorDatabase:
         embeddings = np.array(embeddings).astype('float32')
         
         # Add to index
-        self.index.add(embeddings)
-        self.documents.extend(chunked_docs)
-        self.metadata.extend(chunked_metadata)
+        self._add_vectors(embeddings)
+        for chunk, (meta, chunk_fields) in zip(chunked_docs, chunked_metadata):
+            self.chunk_store.append(chunk, meta, **chunk_fields)
         
         print(f"Added {len(chunked_docs)} documents. Total: {len(self.documents)}")
     
@@ -224,7 +527,8 @@ class VectorDatabase:
         query: str, 
         documents: List[str], 
         metadatas: List[Dict],
-        top_k: int
+        top_k: int,
+        dense_scores: Optional[List[float]] = None
     ) -> Tuple[List[str], List[Dict], List[float]]:
         """
         Rerank search results using CrossEncoder
@@ -234,33 +538,115 @@ class VectorDatabase:
             documents: List of candidate documents
             metadatas: List of metadata for documents
             top_k: Number of top results to return
+            dense_scores: Dense similarities of the documents, for early exit
             
         Returns:
             Tuple of (reranked_docs, reranked_metadata, rerank_scores)
         """
-        if not documents:
-            return [], [], []
+        return self.rerank_results_many([query], [documents], [metadatas], top_k, [dense_scores])[0]
+    
+    def rerank_results_many(
+        self,
+        queries: List[str],
+        documents_per_query: List[List[str]],
+        metadatas_per_query: List[List],
+        top_k: int,
+        dense_scores_per_query: Optional[List[Optional[List[float]]]] = None
+    ) -> List[Tuple[List[str], List, List[float]]]:
+        """
+        Rerank the candidates of several queries with one CrossEncoder pass
+        
+        All (query, candidate) pairs are scored together in cross-encoder batches,
+        then split back per query and ordered exactly as rerank_results would.
+        With early exit enabled the pairs go through the rerank cascade instead,
+        which skips or shortens reranking for queries with confident dense scores.
+        
+        Args:
+            queries: Search queries
+            documents_per_query: Candidate documents for each query, in dense order
+            metadatas_per_query: Any list parallel to each query's documents
+            top_k: Number of top results to return per query
+            dense_scores_per_query: Dense similarities parallel to each query's
+                documents, used by the cascade's early exit
+            
+        Returns:
+            List of (reranked_docs, reranked_metadata, rerank_scores), one per query
+        """
+        if not any(documents_per_query):
+            return [([], [], []) for _ in queries]
         
         # Load rerank model if needed
         if self.rerank_model is None:
             self.load_rerank_model()
         
-        # Create query-document pairs
-        pairs = [[query, doc] for doc in documents]
-        
-        # Get rerank scores
-        print(f"Reranking {len(documents)} documents")
-        scores = self.rerank_model.predict(pairs)
-        
-        # Sort by score
-        sorted_indices = np.argsort(scores)[::-1][:top_k]
+        def score_pairs(positions: List[Tuple[int, int]]) -> np.ndarray:
+            pairs = [[queries[q], documents_per_query[q][i]] for q, i in positions]
+            print(f"Reranking {len(pairs)} documents for {len(queries)} queries")
+            return np.asarray(self.rerank_model.predict(pairs, batch_size=RERANK_BATCH_SIZE))
         
-        reranked_docs = [documents[i] for i in sorted_indices]
-        reranked_metadata = [metadatas[i] for i in sorted_indices]
-        rerank_scores = [float(scores[i]) for i in sorted_indices]
-        
-        print(f"Reranking complete. Top score: {rerank_scores[0]:.4f}")
-        return reranked_docs, reranked_metadata, rerank_scores
+        if self.rerank_cascade is not None:
+            outcomes = self.rerank_cascade.run(
+                [len(documents) for documents in documents_per_query], top_k,
+                score_pairs, dense_scores_per_query
+            )
+            reranked = [
+                ([documents[i] for i in outcome.order],
+                 [metadatas[i] for i in outcome.order],
+                 outcome.scores)
+                for outcome, documents, metadatas
+                in zip(outcomes, documents_per_query, metadatas_per_query)
+            ]
+        else:
+            all_scores = score_pairs([
+                (q, i) for q, documents in enumerate(documents_per_query) for i in range(len(documents))
+            ])
+            reranked = []
+            offset = 0
+            for documents, metadatas in zip(documents_per_query, metadatas_per_query):
+                scores = all_scores[offset:offset + len(documents)]
+                offset += len(documents)
+                
+                # Sort by score
+                sorted_indices = np.argsort(scores)[::-1][:top_k]
+                reranked.append((
+                    [documents[i] for i in sorted_indices],
+                    [metadatas[i] for i in sorted_indices],
+                    [float(scores[i]) for i in sorted_indices]
+                ))
+        
+        top_scores = [scores[0] for _, _, scores in reranked if scores]
+        if top_scores:
+            print(f"Reranking complete. Top score: {max(top_scores):.4f}")
+        return reranked
+    
+    def _encode_queries(self, queries: List[str]) -> np.ndarray:
+        """Encode queries in one batch into a float32 matrix with one row per query"""
+        if self.is_embedding_gemma:
+            # Use EmbeddingGemma's specialized query encoding
+            try:
+                query_embeddings = self.embedding_model.encode_query(
+                    queries,
+                    convert_to_tensor=False,
+                    normalize_embeddings=True
+                )
+            except Exception as e:
+                logger.warning(f"EmbeddingGemma encode_query failed: {e}, falling back to standard encode")
+                query_embeddings = self.embedding_model.encode(
+                    queries,
+                    convert_to_tensor=False,
+                    normalize_embeddings=True
+                )
+        else:
+            # Standard sentence transformers encoding
+            query_embeddings = self.embedding_model.encode(
+                queries,
+                convert_to_tensor=False,
+                normalize_embeddings=True
+            )
+        query_embeddings = np.array(query_embeddings).astype('float32')
+        if query_embeddings.ndim == 1:
+            query_embeddings = query_embeddings[None, :]  # Add batch dimension
+        return query_embeddings
     
     def search(
         self, 
@@ -283,15 +669,60 @@ class VectorDatabase:
         Returns:
             Tuple of (documents, metadata, scores)
         """
-        try:
-            import mlflow
-            use_mlflow = True
-        except ImportError:
-            use_mlflow = False
-        
-        if self.index is None or not self.documents:
+        if not self.documents:
             logger.warning("Index is empty")
             return [], [], []
+        
+        # Determine if reranking should be used
+        use_rerank = rerank if rerank is not None else self.enable_rerank
+        
+        with span("vector_db.search", k=k, use_rerank=use_rerank,
+                  embedding_model=self.embedding_model_key) as search_span:
+            results, result_metadata, scores = self.search_many(
+                [query], k, use_rerank, initial_k_multiplier, score_threshold
+            )[0]
+            
+            if search_span.is_recording:
+                search_span.set_attributes({
+                    "reranking_applied": use_rerank and bool(results),
+                    "result_count": len(results),
+                    "top_score": scores[0] if scores else None,
+                    "avg_score": sum(scores) / len(scores) if scores else 0,
+                })
+            
+            return results, result_metadata, scores
+    
+    def search_many(
+        self,
+        queries: List[str],
+        k: int = DEFAULT_TOP_K,
+        rerank: Optional[bool] = None,
+        initial_k_multiplier: int = 3,
+        score_threshold: float = 0.3
+    ) -> List[Tuple[List[str], List[Dict], List[float]]]:
+        """
+        Search for several queries at once
+        
+        Queries are encoded in one batch, searched with one index call over the
+        query matrix, and their candidates reranked in combined cross-encoder
+        batches. Each result is what search() returns for that query.
+        
+        Args:
+            queries: Search queries
+            k: Number of results to return per query
+            rerank: Whether to rerank results (None = use default)
+            initial_k_multiplier: Multiplier for initial retrieval before reranking
+            score_threshold: Minimum similarity score threshold
+            
+        Returns:
+            List of (documents, metadata, scores), one per query
+        """
+        if not queries:
+            return []
+        
+        if not self.documents:
+            logger.warning("Index is empty")
+            return [([], [], []) for _ in queries]
             
         if self.embedding_model is None:
             self.load_embedding_model()
@@ -299,127 +730,153 @@ class VectorDatabase:
         # Determine if reranking should be used
         use_rerank = rerank if rerank is not None else self.enable_rerank
         
-        # Use context manager properly for MLflow span
-        if use_mlflow:
-            span_context = mlflow.start_span("vector_db_search")
-        else:
-            span_context = None
-        
-        # If using MLflow, enter the context
-        if span_context:
-            span = span_context.__enter__()
-            span.set_inputs({
-                "query": query,
-                "k": k,
-                "use_rerank": use_rerank,
-                "embedding_model": self.embedding_model_key
-            })
+        query_embeddings = self._encode_queries(queries)
         
-        try:
-            # Encode query
-            if self.is_embedding_gemma:
-                # Use EmbeddingGemma's specialized query encoding
-                try:
-                    query_embedding = self.embedding_model.encode_query(
-                        query,
-                        convert_to_tensor=False,
-                        normalize_embeddings=True
-                    )
-                    # EmbeddingGemma returns single vector, not list
-                    if len(query_embedding.shape) == 1:
-                        query_embedding = query_embedding[None, :]  # Add batch dimension
-                except Exception as e:
-                    logger.warning(f"EmbeddingGemma encode_query failed: {e}, falling back to standard encode")
-                    query_embedding = self.embedding_model.encode(
-                        [query],
-                        convert_to_tensor=False,
-                        normalize_embeddings=True
-                    )
-            else:
-                # Standard sentence transformers encoding
-                query_embedding = self.embedding_model.encode(
-                    [query],
-                    convert_to_tensor=False,
-                    normalize_embeddings=True
-                )
-            query_embedding = np.array(query_embedding).astype('float32')
-            
-            # Retrieve more candidates if reranking
-            retrieval_k = k * initial_k_multiplier if use_rerank else k
-            retrieval_k = min(retrieval_k, len(self.documents))
-            
-            # Search
-            scores, indices = self.index.search(query_embedding, retrieval_k)
-            
-            # Filter results by relevance score
+        # Retrieve more candidates if reranking
+        retrieval_k = k * initial_k_multiplier if use_rerank else k
+        retrieval_k = min(retrieval_k, len(self.documents))
+        
+        # Search
+        scores, indices = self._search_vectors(query_embeddings, retrieval_k)
+        
+        # Filter results by relevance score. Metadata is materialized only for
+        # the final hits, so candidates are carried as chunk ids until then
+        candidates = []
+        for row_scores, row_indices in zip(scores, indices):
             results = []
-            result_metadata = []
+            result_ids = []
             initial_scores = []
-            
-            for score, idx in zip(scores[0], indices[0]):
-                if idx < len(self.documents) and score > score_threshold:
+            for score, idx in zip(row_scores, row_indices):
+                if 0 <= idx < len(self.documents) and score > score_threshold:
                     results.append(self.documents[idx])
-                    result_metadata.append(self.metadata[idx])
+                    result_ids.append(int(idx))
                     initial_scores.append(float(score))
-            
-            print(f"Initial retrieval found {len(results)} relevant documents")
-            
-            # Log initial retrieval results
-            if use_mlflow and span_context:
-                span.set_attribute("initial_retrieval_count", len(results))
-                span.set_attribute("initial_retrieval_avg_score", 
-                                 sum(initial_scores) / len(initial_scores) if initial_scores else 0)
-                # Log top initial results
-                for i, (doc, meta, score) in enumerate(zip(results[:5], result_metadata[:5], initial_scores[:5])):
-                    span.set_attribute(f"initial_doc_{i}_score", score)
-                    span.set_attribute(f"initial_doc_{i}_source", meta.get("source", "unknown"))
-            
-            # Rerank if enabled
-            if use_rerank and results:
-                results, result_metadata, rerank_scores = self.rerank_results(
-                    query, results, result_metadata, k
-                )
-                
-                # Log reranking results
-                if use_mlflow and span_context:
-                    span.set_attribute("reranking_applied", True)
-                    span.set_attribute("reranked_count", len(results))
-                    span.set_attribute("reranked_avg_score", 
-                                     sum(rerank_scores) / len(rerank_scores) if rerank_scores else 0)
-                    # Log top reranked results
-                    for i, (doc, meta, score) in enumerate(zip(results, result_metadata, rerank_scores)):
-                        span.set_attribute(f"reranked_doc_{i}_score", score)
-                        span.set_attribute(f"reranked_doc_{i}_source", meta.get("source", "unknown"))
-                        span.set_attribute(f"reranked_doc_{i}_preview", doc[:150] + "...")
-                    
-                    span.set_outputs({
-                        "documents": results,
-                        "metadata": result_metadata,
-                        "scores": rerank_scores,
-                        "reranking_applied": True
-                    })
-                
-                return results, result_metadata, rerank_scores
-            else:
-                # Return top k without reranking
-                results = results[:k]
-                result_metadata = result_metadata[:k]
-                initial_scores = initial_scores[:k]
-                
-                if use_mlflow and span_context:
-                    span.set_attribute("reranking_applied", False)
-                    span.set_outputs({
-                        "documents": results,
-                        "metadata": result_metadata,
-                        "scores": initial_scores,
-                        "reranking_applied": False
-                    })
-                
-                return results, result_metadata, initial_scores
-        finally:
-            # Clean up span context if it exists
-            if span_context:
-                span_context.__exit__(None, None, None)
+            candidates.append((results, result_ids, initial_scores))
+        
+        print(f"Initial retrieval found {sum(len(c[0]) for c in candidates)} relevant documents "
+              f"for {len(queries)} queries")
+        
+        # Rerank if enabled
+        if use_rerank:
+            candidates = [
+                self._dedup_candidates(query_embedding, *candidate, k)
+                for query_embedding, candidate in zip(query_embeddings, candidates)
+            ]
+            reranked = self.rerank_results_many(
+                queries,
+                [results for results, _, _ in candidates],
+                [result_ids for _, result_ids, _ in candidates],
+                k,
+                [initial_scores for _, _, initial_scores in candidates]
+            )
+            return [
+                (results, [self.metadata[idx] for idx in result_ids], rerank_scores)
+                for results, result_ids, rerank_scores in reranked
+            ]
+        
+        # Return top k without reranking
+        return [
+            (results[:k], [self.metadata[idx] for idx in result_ids[:k]], initial_scores[:k])
+            for results, result_ids, initial_scores in candidates
+        ]
+    
+    def save(self, path: Union[str, Path]):
+        """
+        Save the index, documents and metadata to a directory
+        
+        Documents and metadata are written as UTF-8 records with offset arrays so
+        load(mmap=True) can serve them straight from the OS page cache. Every
+        file is written aside and moved into place, so a store loaded with
+        mmap=True can be saved back to its own directory: its mappings keep
+        the replaced files' contents.
+        
+        Args:
+            path: Directory to write (created if missing, existing files replaced)
+        """
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        
+        if self.index is not None:
+            faiss.write_index(self.index, str(_temp_path(path / INDEX_FILE)))
+            os.replace(_temp_path(path / INDEX_FILE), path / INDEX_FILE)
+            (path / VECTORS_FILE).unlink(missing_ok=True)
+        else:
+            vectors = self.vectors if self.vectors is not None else np.empty((0, self.dimension), dtype='float32')
+            with open(_temp_path(path / VECTORS_FILE), "wb") as vectors_file:
+                np.save(vectors_file, np.asarray(vectors, dtype='float32'))
+            os.replace(_temp_path(path / VECTORS_FILE), path / VECTORS_FILE)
+            (path / INDEX_FILE).unlink(missing_ok=True)
+        
+        _write_records(self.documents, path / DOCUMENTS_FILE, path / DOCUMENT_OFFSETS_FILE)
+        _write_records(
+            (json.dumps(meta, default=str) for meta in self.metadata),
+            path / METADATA_FILE, path / METADATA_OFFSETS_FILE
+        )
+        
+        manifest = {
+            "format_version": STORE_FORMAT_VERSION,
+            "embedding_model_key": self.embedding_model_key,
+            "dimension": self.dimension,
+            "chunk_size": self.chunk_size,
+            "chunk_overlap": self.chunk_overlap,
+            "index_type": self.index_type,
+            "active_index_type": self.active_index_type or "exact",
+            "total_documents": len(self.documents)
+        }
+        _temp_path(path / MANIFEST_FILE).write_text(json.dumps(manifest, indent=2))
+        os.replace(_temp_path(path / MANIFEST_FILE), path / MANIFEST_FILE)
+        print(f"Saved {len(self.documents)} documents to {path}")
+    
+    def load(self, path: Union[str, Path], mmap: bool = True):
+        """
+        Load a store written by save(), replacing the current contents
+        
+        Args:
+            path: Directory written by save()
+            mmap: Memory-map the index, documents and metadata instead of reading
+                them into memory. Mapped stores are read-only.
+        """
+        path = Path(path)
+        manifest = json.loads((path / MANIFEST_FILE).read_text())
+        if manifest.get("format_version") != STORE_FORMAT_VERSION:
+            raise ValueError(f"Unsupported vector store format: {manifest.get('format_version')}")
+        
+        # Stored embeddings only make sense with the model that produced them
+        self.switch_embedding_model(manifest["embedding_model_key"])
+        self.dimension = manifest["dimension"]
+        self.chunk_size = manifest["chunk_size"]
+        self.chunk_overlap = manifest["chunk_overlap"]
+        self.index_type = manifest["index_type"]
+        self.active_index_type = manifest["active_index_type"]
+        
+        self._vector_buffer = None
+        if self.active_index_type == "exact":
+            self.index = None
+            self.vectors = np.load(path / VECTORS_FILE, mmap_mode="r" if mmap else None)
+        else:
+            self.vectors = None
+            self.index = None
+            if mmap:
+                try:
+                    self.index = faiss.read_index(str(path / INDEX_FILE), faiss.IO_FLAG_MMAP)
+                except RuntimeError as e:
+                    logger.warning(f"Index type does not support mmap ({e}), reading into memory")
+            if self.index is None:
+                self.index = faiss.read_index(str(path / INDEX_FILE))
+            if self.active_index_type == "hnsw":
+                self.index.hnsw.efSearch = HNSW_EF_SEARCH
+        
+        documents = _MappedRecords(path / DOCUMENTS_FILE, path / DOCUMENT_OFFSETS_FILE, use_mmap=mmap)
+        metadata = _MappedRecords(path / METADATA_FILE, path / METADATA_OFFSETS_FILE,
+                                  decode=json.loads, use_mmap=mmap)
+        if mmap:
+            self.chunk_store = None
+            self.documents = documents
+            self.metadata = metadata
+        else:
+            self._reset_chunks()
+            self.chunk_store.extend(documents, metadata)
+        print(f"Loaded {len(self.documents)} documents from {path} (mmap={mmap})")
     
     def update_chunk_size(self, chunk_size: int, chunk_overlap: int = None):
         """
@@ -438,16 +895,21 @@ class VectorDatabase:
         """Get statistics about the vector database"""
         return {
             'total_documents': len(self.documents),
+            'chunk_store_bytes': self.chunk_store.nbytes() if self.chunk_store is not None else None,
             'embedding_model_key': self.embedding_model_key,
             'embedding_model_name': self.model_config["model_name"],
             'embedding_model_description': self.model_config["description"],
             'dimension': self.dimension,
             'chunk_size': self.chunk_size,
             'chunk_overlap': self.chunk_overlap,
+            'index_type': self.index_type,
+            'active_index_type': self.active_index_type,
             'rerank_enabled': self.enable_rerank,
             'rerank_model': self.rerank_model_name if self.enable_rerank else None,
+            'candidate_dedup': self.candidate_dedup,
             'embedding_model_loaded': self.embedding_model is not None,
-            'rerank_model_loaded': self.rerank_model is not None
+            'rerank_model_loaded': self.rerank_model is not None,
+            'rerank_cascade': self.rerank_cascade.get_stats() if self.rerank_cascade is not None else None
         }
     
     @staticmethod
@@ -479,6 +941,9 @@ class VectorDatabase:
             self.model_config = EMBEDDING_MODELS[new_model_key]
             self.dimension = self.model_config["dimension"]
             self.chunk_size = self.model_config["chunk_size"]
+            if self.rerank_cascade is not None:
+                self.rerank_cascade = RerankCascade.for_models(self.model_config["model_name"],
+                                                               self.rerank_model_name)
             
             # Clear loaded models to force reload
             self.embedding_model = None
@@ -489,6 +954,8 @@ class VectorDatabase:
     def clear(self):
         """Clear the vector store"""
         self.index = None
-        self.documents = []
-        self.metadata = []
+        self.vectors = None
+        self._vector_buffer = None
+        self.active_index_type = None
+        self._reset_chunks()
         print("Cleared vector store")
\ No newline at end of file
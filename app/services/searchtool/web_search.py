@@ -1,10 +1,12 @@
 import logging
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
 import asyncio
 from .link_search import LinkSearch
 from .scraper import Scraper
 from .vector_database import VectorDatabase
+from app.utils.metrics import provider_errors, resident_indexes, stage_seconds
+from app.utils.tracing import current_span, traced
 import time
 
 logger = logging.getLogger(__name__)
@@ -29,44 +31,65 @@ class WebSearch:
         #     chunk_overlap=CHUNK_OVERLAP,
         #     enable_rerank=enable_rerank
         # )
+        # Holds the shared models; each search_tool call fills its own store
+        # from self.vector_db.new_store() so concurrent searches never share an index
         self.vector_db = VectorDatabase(embedding_model_key=embedding_model)
 
+    async def _search_urls(self,
+                           query: str,
+                           num_results: int,
+                           page: int,
+                           before: str,
+                           after: str,
+                           backend: str,
+                           deadline: float = None) -> List[str]:
+        """Run the link search and return result URLs"""
+        with stage_seconds.time(pipeline='web', stage='web_search'):
+            search_results = await self.link_search.search(query = query, 
+                                                 num_results = num_results, 
+                                                 page = page, 
+                                                 before = before, 
+                                                 after = after, 
+                                                 backend = backend,
+                                                 deadline = deadline)
+        urls = []
+        if search_results:
+            urls = [result["href"] for result in search_results]
+            print(f"DDGS returned {len(urls)} URLs")
+        
+        if not urls:
+            logger.warning("No URLs found from search")
+        return urls
+    
+    @traced("web_search.search_and_crawl")
     async def search_and_crawl(self, 
                                query: str, 
                                num_results: int = 10, 
                                page: int = 1, 
                                before: str = None, 
                                after: str = None, 
-                               backend: str = "mullvad_google"):
+                               backend: str = "mullvad_google",
+                               deadline: float = None):
         """
         Search for URLs and crawl them
         
         Args:
             query: Search query
             num_results: Number of search results to crawl
+            deadline: Optional time.monotonic() deadline for the search and crawl
             
         Returns:
             List of crawl results
             List of searched results
         """
         # Step 1: Search for URLs
-        search_results = await self.link_search.search(query = query, 
-                                             num_results = num_results, 
-                                             page = page, 
-                                             before = before, 
-                                             after = after, 
-                                             backend = backend)
-        urls = []
-        if search_results:
-            urls = [result["href"] for result in search_results]
-            print(f"DDGS returned {len(urls)} URLs")
-        
+        urls = await self._search_urls(query, num_results, page, before, after, backend, deadline)
         if not urls:
-            logger.warning("No URLs found from search")
             return [], []
         
         # Step 2: Crawl the URLs
-        results = await self.scraper.crawl(urls, query)
+        with stage_seconds.time(pipeline='web', stage='crawl'):
+            results = await self.scraper.crawl(urls, query, deadline)
         
         if not results:
             logger.warning("No successful crawls")
@@ -75,55 +98,88 @@ class WebSearch:
         logger.info(f"Successfully crawled {len(results)} pages")
         return results, urls
     
-    def process_and_store(self, crawl_results: List) -> int:
+    def _reset_store(self, vector_db: VectorDatabase = None):
         """
-        Process crawl results and store in vector database
+        Prepare a vector database for a new corpus
         
         Args:
-            crawl_results: List of CrawlResult objects
+            vector_db: Request-scoped store to fill; if omitted, the shared
+                self.vector_db is cleared and reused
             
         Returns:
-            Number of documents stored
+            The store to fill
         """
-        # Clear existing data and initialize
+        if vector_db is not None:
+            return vector_db
         self.vector_db.clear()
         self.vector_db.initialize()
         self.vector_db.load_embedding_model()
+        return self.vector_db
+    
+    def new_store(self) -> VectorDatabase:
+        """Create a request-scoped vector store that shares the loaded models"""
+        return self.vector_db.new_store()
+    
+    def _prepare_document(self, result) -> Optional[Tuple[str, dict]]:
+        """
+        Extract content and metadata from a crawl result
+        
+        Returns:
+            Tuple of (content, metadata), or None if the page should be skipped
+        """
+        if not result.markdown or not result.markdown.fit_markdown:
+            return None
+        
+        try:
+            # Extract content directly from markdown - let vector_db handle chunking
+            content = result.markdown.strip()
+            
+            if len(content) > 100:  # Filter out very short content
+                return content, {
+                    "source": result.url,
+                    "title": getattr(result, 'title', 'Unknown'),
+                    "content_length": len(content),
+                    "timestamp": getattr(result, 'timestamp', None)
+                }
+                    
+        except Exception as e:
+            logger.error(f"Error processing {result.url}: {str(e)}")
+        return None
+    
+    @traced("web_search.process_and_store")
+    def process_and_store(self, crawl_results: List, vector_db: VectorDatabase = None) -> int:
+        """
+        Process crawl results and store in vector database
+        
+        Args:
+            crawl_results: List of CrawlResult objects
+            vector_db: Request-scoped store from new_store() (default: the shared store)
+            
+        Returns:
+            Number of documents stored
+        """
+        vector_db = self._reset_store(vector_db)
         
         all_documents = []
         all_metadata = []
         
         for result in crawl_results:
-            if not result.markdown or not result.markdown.fit_markdown:
-                continue
-            
-            try:
-                # Extract content directly from markdown - let vector_db handle chunking
-                content = result.markdown.strip()
-                
-                if len(content) > 100:  # Filter out very short content
-                    all_documents.append(content)
-                    all_metadata.append({
-                        "source": result.url,
-                        "title": getattr(result, 'title', 'Unknown'),
-                        "content_length": len(content),
-                        "timestamp": getattr(result, 'timestamp', None)
-                    })
-                        
-            except Exception as e:
-                logger.error(f"Error processing {result.url}: {str(e)}")
-                continue
+            prepared = self._prepare_document(result)
+            if prepared:
+                all_documents.append(prepared[0])
+                all_metadata.append(prepared[1])
         
         if all_documents:
             # Let vector database handle chunking automatically
-            self.vector_db.add_documents(
-                all_documents, 
-                all_metadata,
-                auto_chunk=True  # Use vector_db's smart chunking
-            )
+            with stage_seconds.time(pipeline='web', stage='embedding'):
+                vector_db.add_documents(
+                    all_documents, 
+                    all_metadata,
+                    auto_chunk=True  # Use vector_db's smart chunking
+                )
             
             # Get actual number of chunks stored
-            stats = self.vector_db.get_stats()
+            stats = vector_db.get_stats()
             num_chunks = stats['total_documents']
             
             logger.info(f"Processed {len(all_documents)} documents into {num_chunks} chunks")
@@ -131,24 +187,109 @@ class WebSearch:
         
         return 0
     
-    def search_context(self, query: str, k: int = 10) -> Tuple[List[str], List[dict], List[float]]:
+    @traced("web_search.search_crawl_and_store")
+    async def search_crawl_and_store(self,
+                                     query: str,
+                                     num_results: int = 10,
+                                     page: int = 1,
+                                     before: str = None,
+                                     after: str = None,
+                                     backend: str = "mullvad_google",
+                                     deadline: float = None,
+                                     vector_db: VectorDatabase = None) -> Tuple[int, List[str], List[str], bool]:
+        """
+        Search for URLs, then chunk and embed each page as soon as its crawl completes
+        
+        Crawling runs on the event loop while embedding runs in a worker thread, so
+        the index is already populated when the last page arrives. Pages that arrive
+        while a batch is being embedded are embedded together in the next batch.
+        
+        Args:
+            query: Search query
+            num_results: Number of search results to crawl
+            deadline: Optional time.monotonic() deadline; pages not crawled by then are
+                dropped, and so are crawled pages whose embedding would start after it
+            vector_db: Request-scoped store from new_store() (default: the shared store)
+            
+        Returns:
+            Tuple of (number of chunks stored, searched URLs, URLs of pages stored,
+            whether the deadline cut the crawl or embedding short)
+        """
+        urls = await self._search_urls(query, num_results, page, before, after, backend, deadline)
+        if not urls:
+            return 0, [], [], False
+        
+        vector_db = self._reset_store(vector_db)
+        pending: asyncio.Queue = asyncio.Queue()
+        stored_sources = []
+        dropped = 0
+        
+        async def embed_worker():
+            nonlocal dropped
+            finished = False
+            while not finished:
+                batch = [await pending.get()]
+                while not pending.empty():
+                    batch.append(pending.get_nowait())
+                if batch[-1] is None:
+                    finished = True
+                    batch.pop()
+                if batch and deadline is not None and time.monotonic() >= deadline:
+                    # Embedding it would overrun the turn's budget
+                    dropped += len(batch)
+                    continue
+                if batch:
+                    documents, metadatas = zip(*batch)
+                    with stage_seconds.time(pipeline='web', stage='embedding'):
+                        await asyncio.to_thread(
+                            vector_db.add_documents, list(documents), list(metadatas), True
+                        )
+                    stored_sources.extend(metadata["source"] for metadata in metadatas)
+        
+        deadline_reached = False
+        worker = asyncio.create_task(embed_worker())
+        try:
+            with stage_seconds.time(pipeline='web', stage='crawl'):
+                async for result in self.scraper.crawl_stream(urls, query, deadline):
+                    prepared = self._prepare_document(result)
+                    if prepared:
+                        await pending.put(prepared)
+            # The crawl stops at the deadline, or earlier once every page is in
+            deadline_reached = deadline is not None and time.monotonic() >= deadline
+        finally:
+            await pending.put(None)
+            await worker
+        
+        num_chunks = vector_db.get_stats()['total_documents']
+        logger.info(f"Streamed {len(stored_sources)} pages into {num_chunks} chunks"
+                    + (f", dropped {dropped} pages crawled too late to embed" if dropped else ""))
+        return num_chunks, urls, stored_sources, deadline_reached or dropped > 0
+    
+    def search_context(self, query: str, k: int = 10, vector_db: VectorDatabase = None,
+                       rerank: bool = True) -> Tuple[List[str], List[dict], List[float]]:
         """
         Search for relevant context from stored documents with enhanced results
         
         Args:
             query: Search query
             k: Number of top results to return
+            vector_db: Request-scoped store to search (default: the shared store)
+            rerank: Rerank the candidates with the cross-encoder; otherwise rank
+                them by embedding similarity only
             
         Returns:
             Tuple of (documents, metadata, scores)
         """
-        documents, metadata, scores = self.vector_db.search(
-            query, 
-            k=k,
-            rerank=True,  # Enable reranking for better results
-            initial_k_multiplier=3,  # Get more candidates for reranking
-            score_threshold=0.3  # Lower threshold for more results
-        )
+        vector_db = vector_db or self.vector_db
+        # Includes the cross-encoder rerank of the candidates
+        with stage_seconds.time(pipeline='web', stage='retrieval'):
+            documents, metadata, scores = vector_db.search(
+                query, 
+                k=k,
+                rerank=rerank,
+                initial_k_multiplier=3,  # Get more candidates for reranking
+                score_threshold=0.3  # Lower threshold for more results
+            )
         
         # Log search quality for debugging
         if scores:
@@ -173,6 +314,7 @@ class WebSearch:
         stats = self.vector_db.get_stats()
         return stats.get('total_documents', 0)
 
+    @traced("web_search.search_tool")
     async def search_tool(self,
                           query: str, 
                           num_results: int = 10, 
@@ -180,7 +322,9 @@ class WebSearch:
                           before: str = None, 
                           after: str = None, 
                           backend: str = "google",
-                          advanced: bool = True):
+                          advanced: bool = True,
+                          stream: bool = True,
+                          deadline: float = None):
         """
         Complete search tool: search -> crawl -> process -> store
         
@@ -192,57 +336,102 @@ class WebSearch:
             after: Optional date string to filter results after this date (YYYY-MM-DD)
             backend: Search Engine to use (default: "google")
             advanced: Whether to use advanced processing with vector DB
+            stream: Whether to embed pages as they are crawled instead of after the whole crawl
+            deadline: Optional time.monotonic() deadline. Fetches still outstanding when
+                it expires are cancelled and results come from the pages already processed
             
         Returns:
-            Tuple of (relevant documents, urls)
+            Tuple of (relevant documents, urls, search_info). search_info holds
+            'sources' (the source URL of each returned document), 'crawled_sources',
+            'searched' and 'deadline_reached'
         """
-        import mlflow
+        current_span().set_attributes({"num_results": num_results, "advanced": advanced, "stream": stream})
+        search_info = {
+            "searched": 0,
+            "crawled_sources": [],
+            "sources": [],
+            "deadline_reached": False
+        }
         
         if not advanced:
-            search_results = await self.link_search.search(query = query, 
-                                             num_results = num_results, 
-                                             page = page, 
-                                             before = before, 
-                                             after = after, 
-                                             backend = backend)
+            with stage_seconds.time(pipeline='web', stage='web_search'):
+                search_results = await self.link_search.search(query = query, 
+                                                 num_results = num_results, 
+                                                 page = page, 
+                                                 before = before, 
+                                                 after = after, 
+                                                 backend = backend,
+                                                 deadline = deadline)
             if search_results:
+                results_with_body = [result for result in search_results if "body" in result]
                 urls = [result["href"] for result in search_results]
-                body = [result["body"] for result in search_results if "body" in result]
-                return body, urls
+                body = [result["body"] for result in results_with_body]
+                search_info["searched"] = len(urls)
+                search_info["sources"] = [result["href"] for result in results_with_body]
+                return body, urls, search_info
+            return [], [], search_info
         else:
-            # Advanced search without MLflow tracking for simplicity
             relavent_docs = []
             urls = []
             
+            resident_indexes.inc(kind='web_search')
             try:
-                # Step 1 & 2: Search and Crawl
-                crawl_results, urls = await self.search_and_crawl(query, num_results, page, before, after, backend)
+                # Request-scoped store so concurrent searches never clobber each other
+                vector_db = self.new_store()
                 
-                if not crawl_results:
-                    logger.warning("No crawl results to process")
-                    return [], []
+                if stream:
+                    # Steps 1-3: Search, then crawl and store pages as they arrive
+                    store_start = time.time()
+                    num_stored, urls, crawled_sources, deadline_reached = await self.search_crawl_and_store(
+                        query, num_results, page, before, after, backend, deadline, vector_db
+                    )
+                    store_time = time.time() - store_start
+                    print(f"Crawling and storing {num_stored} documents took {store_time:.2f} seconds")
+                else:
+                    # Step 1 & 2: Search and Crawl
+                    crawl_results, urls = await self.search_and_crawl(query, num_results, page, before, after, backend, deadline)
+                    crawled_sources = [result.url for result in crawl_results]
+                    deadline_reached = deadline is not None and time.monotonic() >= deadline
+                    
+                    print(f"Found {len(urls)} URLs to process")
+                    
+                    # Step 3: Process and Store
+                    store_start = time.time()
+                    num_stored = self.process_and_store(crawl_results, vector_db) if crawl_results else 0
+                    store_end = time.time()
+                    store_time = store_end - store_start
+                    print(f"Storing {num_stored} documents took {store_time:.2f} seconds")
                 
-                print(f"Found {len(urls)} URLs to process")
+                search_info["searched"] = len(urls)
+                search_info["crawled_sources"] = crawled_sources
+                search_info["deadline_reached"] = deadline_reached
+                if deadline_reached:
+                    print(f"Web search deadline reached, using {len(crawled_sources)}/{len(urls)} pages")
                 
-                # Step 3: Process and Store
-                store_start = time.time()
-                num_stored = self.process_and_store(crawl_results)
-                store_end = time.time()
-                store_time = store_end - store_start
-                print(f"Storing {num_stored} documents took {store_time:.2f} seconds")
+                if not num_stored:
+                    logger.warning("No crawl results to process")
+                    return [], urls, search_info
                 
-                # Step 4: search_context (retrieval + reranking)
+                # Step 4: search_context (retrieval + reranking); past the deadline
+                # the cross-encoder is skipped rather than overrunning the turn further
                 search_start = time.time()
-                relavent_docs, relavent_metadata, scores = self.search_context(query, k=5)
+                rerank = deadline is None or time.monotonic() < deadline
+                relavent_docs, relavent_metadata, scores = self.search_context(query, k=5, vector_db=vector_db,
+                                                                                rerank=rerank)
                 search_end = time.time()
                 search_time = search_end - search_start
                 print(f"Searching context took {search_time:.2f} seconds")
                 
+                search_info["sources"] = [meta.get("source") for meta in relavent_metadata]
                 print(f"Retrieved {len(relavent_docs)} relevant documents")
                     
             except Exception as e:
+                provider_errors.inc(provider='web_search')
+                current_span().record_error(e)
                 logger.error(f"Error in search tool: {str(e)}")
                 import traceback
                 traceback.print_exc()
+            finally:
+                resident_indexes.dec(kind='web_search')
             
-            return relavent_docs, urls
\ No newline at end of file
+            return relavent_docs, urls, search_info
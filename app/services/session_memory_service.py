@@ -0,0 +1,120 @@
+"""Bounded conversation memory for RAG chat sessions"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
+from app.config import config
+from app.repositories.rag_repository import RAGRepository
+from app.services.llm_service import llm_service
+from app.utils.context_packing import ContextItem, ContextPacker, context_budget
+
+SUMMARY_PROMPT = """Progressively summarize the conversation between a user and a documentation assistant, \
+adding onto the previous summary. Keep the facts, names, decisions and open questions the user may refer \
+back to. Reply with the new summary only, in at most {max_words} words.
+
+Previous summary:
+{summary}
+
+New lines of conversation:
+{turns}
+
+New summary:"""
+
+
+class SessionMemoryService:
+    """
+    Memory of a RAG chat session: a rolling summary plus the turns since
+
+    Once RAG_SUMMARY_INTERVAL turns have fallen out of the RAG_MEMORY_WINDOW
+    most recent ones, a background job folds them into the session's summary.
+    The history handed to the retrieval chain is therefore at most
+    RAG_MEMORY_WINDOW + RAG_SUMMARY_INTERVAL turns and a summary of at most
+    RAG_SUMMARY_MAX_TOKENS, however long the session gets.
+    """
+
+    def __init__(self):
+        self.repo = RAGRepository()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='session-summary')
+        self._pending: Set[int] = set()
+        self._lock = threading.Lock()
+
+    def get_memory(self, session_id: int) -> Tuple[Optional[str], List[Tuple[str, str]]]:
+        """(rolling summary or None, recent (user message, answer) turns, oldest first)"""
+        limit = config.RAG_MEMORY_WINDOW
+        if config.ENABLE_RAG_SESSION_SUMMARY:
+            limit += config.RAG_SUMMARY_INTERVAL
+        session, messages = self.repo.get_session_memory(session_id, limit)
+        if session is None:
+            return None, []
+        turns = [(message['user_message'], message['bot_response']) for message in messages]
+        return session['summary'], turns
+
+    def schedule_summary(self, session_id: int):
+        """Fold turns past the window into the session's summary in the background, once due"""
+        if not config.ENABLE_RAG_SESSION_SUMMARY:
+            return
+        due = config.RAG_MEMORY_WINDOW + config.RAG_SUMMARY_INTERVAL
+        if self.repo.count_unsummarized_messages(session_id) < due:
+            return
+        with self._lock:
+            if session_id in self._pending:
+                return
+            self._pending.add(session_id)
+        self._executor.submit(self._update_summary, session_id)
+
+    def _update_summary(self, session_id: int):
+        try:
+            session, messages = self.repo.get_session_memory(session_id)
+            if session is None or len(messages) <= config.RAG_MEMORY_WINDOW:
+                return
+            folded = messages[:len(messages) - config.RAG_MEMORY_WINDOW]
+            rag = self.repo.get_rag(session['rag_id'])
+            summary, count = self.summarize(rag, session['summary'], folded)
+            if not count:
+                print(f"Summary prompt of RAG chat session {session_id} leaves no room for its turns")
+                return
+            # Turns that did not fit are folded by a later update
+            if not self.repo.update_session_summary(session_id, summary, folded[count - 1]['id'],
+                                                    session['summarized_message_id']):
+                print(f"Summary of RAG chat session {session_id} changed meanwhile, discarding update")
+        except Exception as e:
+            print(f"Updating summary of RAG chat session {session_id} failed: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(session_id)
+
+    def summarize(self, rag: Dict, summary: Optional[str], messages: List[Dict]) -> Tuple[Optional[str], int]:
+        """
+        Previous summary extended with the oldest messages that fit the RAG's model
+
+        Returns:
+            (new summary, number of leading messages folded into it); (None, 0)
+            if the prompt leaves no room for any of them
+        """
+        packer = ContextPacker(rag['model_name'])
+        prompt = SUMMARY_PROMPT.format(
+            summary=summary or "(none)", turns="{turns}",
+            max_words=int(config.RAG_SUMMARY_MAX_TOKENS * 0.75)
+        )
+        # Oldest first and contiguous, so a turn is never marked summarized
+        # without being in the summary; only an oversized first turn is cut,
+        # so a single long turn cannot stall the summary
+        items = [
+            ContextItem(f"Human: {message['user_message']}\nAssistant: {message['bot_response']}",
+                        priority=index, position=index, truncatable=index == 0)
+            for index, message in enumerate(messages)
+        ]
+        budget = context_budget(rag['model_type'], rag['model_name']) - packer.count(prompt)
+        turns = packer.pack(items, budget, separator="\n", skip=False)
+        if not turns:
+            return None, 0
+        prompt = prompt.replace("{turns}", "\n".join(item.text for item in turns))
+
+        llm = llm_service.get_llm(rag['model_name'], rag['api_key'], rag['model_type'])
+        response = llm.invoke(prompt, config={
+            'callbacks': llm_service.metrics_callbacks(rag['model_type'], 'summary')
+        })
+        return packer.truncate(response.content.strip(), config.RAG_SUMMARY_MAX_TOKENS), len(turns)
+
+
+# Singleton instance
+session_memory_service = SessionMemoryService()
@@ -1,12 +1,61 @@
 """Vector database service"""
 import os
-from typing import List, Tuple
-from langchain_community.document_loaders import PyPDFLoader, UnstructuredURLLoader
-from langchain_community.vectorstores import FAISS, Chroma
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+import numpy as np
+import faiss
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.document_loaders import PyPDFLoader
+from langchain_community.vectorstores import FAISS
 from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from app.config import config
+from app.services.chunk_store_service import chunk_store_service
 from app.services.embedding_service import embedding_service
+from app.services.lexical_index import BM25_INDEX_FILE, BM25Index
+from app.services.link_fetcher import link_fetcher
+from app.utils.chroma_utils import get_chroma_store, max_batch_size
+from app.utils.index_utils import (StreamingIndexBuilder, apply_search_params, build_faiss_index,
+                                   parse_index_spec)
+from app.utils.memory_utils import PeakRSSMonitor
+from app.utils.metrics import cache_requests, resident_indexes, stage_seconds
+
+# Written by FAISS.save_local for stores that keep a private copy of their chunks
+LEGACY_FAISS_INDEX = "index.faiss"
+LEGACY_FAISS_PICKLE = "index.pkl"
+# Non-flat index structure of a store built from the shared chunk store
+SHARED_INDEX_FILE = "shared_index.faiss"
+
+
+def _read_text_blocks(path: str, block_size: int) -> Iterator[str]:
+    """
+    Read a text file block by block
+    
+    Blocks are cut at the last paragraph (or line) break and the remainder is
+    carried into the next block, so few chunks straddle a block boundary.
+    """
+    with open(path, "r", encoding="utf-8") as file:
+        carry = ""
+        while True:
+            block = file.read(block_size)
+            if len(block) < block_size:
+                # End of file
+                if (carry + block).strip():
+                    yield carry + block
+                return
+            block = carry + block
+            cut = block.rfind("\n\n")
+            if cut <= 0:
+                cut = block.rfind("\n")
+            if cut <= 0:
+                carry = ""
+                yield block
+            else:
+                carry = block[cut:]
+                yield block[:cut]
 
 
 class VectorDBService:
@@ -14,90 +63,364 @@ class VectorDBService:
     
     def __init__(self):
         self.embedding_model = embedding_service.embedding_model
+        self.last_build_stats: Dict = {}
+        # Loaded indexes kept across queries: shared FAISS stores by RAG as
+        # (chunk reference generation, stored index mtime, store), BM25
+        # indexes by directory as (file mtime and size, index)
+        self._shared_stores: Dict[int, Tuple] = {}
+        self._lexical_indexes: Dict[str, Tuple] = {}
+        self._cache_lock = threading.Lock()
+        resident_indexes.set_function(lambda: len(self._shared_stores), kind='faiss')
     
     def create_vectordb(self, documents: List[Tuple[str, str]], 
                        vector_store_type: str, chunk_size: int, 
-                       index_name: str):
+                       index_name: str, index_spec: Dict = None, rag_id: int = None):
         """
         Create a vector database from documents
         
+        Documents stream through page -> chunk -> embedding batch -> index add,
+        so only one page and one batch of embeddings are in flight at a time;
+        what grows with the corpus is the index itself and the chunk texts kept
+        for the docstore and BM25 index. The index add of one batch overlaps
+        with embedding the next. Peak RSS of the build is printed and kept in
+        last_build_stats.
+        
         Args:
             documents: List of (doc_type, path) tuples
             vector_store_type: 'faiss' or 'chroma'
             chunk_size: Size of text chunks
             index_name: Name for the vector store
+            index_spec: FAISS index family and parameters (see app.utils.index_utils);
+                defaults to an exact flat index. Ignored for Chroma.
+            rag_id: RAG project whose chunks go through the shared chunk store, so
+                chunks already stored for any project are not embedded again.
+                Without it the store keeps a private copy of every chunk.
         """
+        if vector_store_type not in ("faiss", "chroma"):
+            raise ValueError(f"Unsupported vector store type: {vector_store_type}")
+        
         index_path = os.path.join(config.VECTOR_DB_PATH, index_name)
+        index_spec = parse_index_spec(index_spec)
+        os.makedirs(index_path, exist_ok=True)
+        if rag_id is not None:
+            # Shared stores keep no private copy; drop one left by an earlier build
+            for stale_file in (LEGACY_FAISS_INDEX, LEGACY_FAISS_PICKLE, SHARED_INDEX_FILE):
+                if os.path.exists(os.path.join(index_path, stale_file)):
+                    os.remove(os.path.join(index_path, stale_file))
+        
+        text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size, 
+            chunk_overlap=config.DEFAULT_CHUNK_OVERLAP
+        )
+        builder = StreamingIndexBuilder(index_spec) if vector_store_type == "faiss" else None
+        chroma_store = get_chroma_store(index_path, self.embedding_model) if vector_store_type == "chroma" else None
+        batch_size = config.INGEST_BATCH_SIZE
+        if chroma_store is not None:
+            batch_size = min(batch_size, max_batch_size(chroma_store._client))
+        
+        counts = {'pages': 0}
+        ids, texts, doc_paths = [], [], []
+        start = time.perf_counter()
+        with PeakRSSMonitor() as monitor, ThreadPoolExecutor(max_workers=1) as writer:
+            pending = None
+            for batch_paths, batch_texts in self._iter_chunk_batches(documents, text_splitter,
+                                                                     batch_size, counts):
+                batch_ids, vectors = self._embed_batch(batch_texts, rag_id)
+                if pending is not None:
+                    pending.result()
+                pending = writer.submit(self._write_batch, builder, chroma_store,
+                                        batch_ids, batch_texts, vectors)
+                ids.extend(batch_ids)
+                texts.extend(batch_texts)
+                doc_paths.extend(batch_paths)
+                monitor.sample()
+            if pending is not None:
+                pending.result()
+            
+            if rag_id is not None:
+                chunk_store_service.assign_to_rag(rag_id, [int(chunk_id) for chunk_id in ids], doc_paths)
+            
+            if chroma_store is not None:
+                # The collection persists across builds; drop chunks this build no longer has
+                kept = set(ids)
+                existing = chroma_store._collection.get(include=[])['ids']
+                self._delete_chroma_ids(chroma_store, [doc_id for doc_id in existing if doc_id not in kept],
+                                        batch_size)
+            
+            if builder is not None:
+                index = builder.finish()
+                vectorstore = self._wrap_faiss(index, ids, texts)
+                if rag_id is None:
+                    vectorstore.save_local(index_path)
+                elif index_spec['type'] != 'flat':
+                    # Flat indexes are rebuilt from the shared vectors on load
+                    faiss.write_index(index, os.path.join(index_path, SHARED_INDEX_FILE))
+            else:
+                vectorstore = chroma_store
+            
+            # Lexical index persisted alongside the vector store for hybrid retrieval
+            BM25Index.build(texts).save(index_path)
+            self._forget_lexical_index(index_path)
+        
+        self.last_build_stats = {
+            'index_name': index_name,
+            'documents': len(documents),
+            'pages': counts['pages'],
+            'chunks': len(texts),
+            'seconds': time.perf_counter() - start,
+            **monitor.stats(),
+        }
+        print(f"Built {index_name}: {len(texts)} chunks from {counts['pages']} pages in "
+              f"{self.last_build_stats['seconds']:.1f}s, peak RSS "
+              f"{self.last_build_stats['peak_rss_mb']:.0f} MB "
+              f"(+{self.last_build_stats['peak_rss_delta_mb']:.0f} MB)")
+        return vectorstore
+    
+    def _iter_pages(self, documents: List[Tuple[str, str]]) -> Iterator[Tuple[str, str]]:
+        """
+        Yield (doc_path, text) one PDF page, text file block or web page at a time
         
-        # Load all documents
-        all_documents = []
+        Links are downloaded concurrently in the background while files are
+        read, then yielded as their text extraction finishes.
+        """
+        links = link_fetcher.fetch_texts([path for doc_type, path in documents if doc_type == "link"])
         for doc_type, path in documents:
             try:
                 if doc_type == "link":
-                    loader = UnstructuredURLLoader(urls=[path])
-                    docs = loader.load()
+                    continue
                 elif doc_type == "pdf":
-                    loader = PyPDFLoader(path)
-                    docs = loader.load()
+                    pages = (doc.page_content for doc in PyPDFLoader(path).lazy_load())
                 elif doc_type == "text":
-                    with open(path, "r", encoding="utf-8") as file:
-                        content = file.read()
-                        docs = [Document(page_content=content)]
+                    pages = _read_text_blocks(path, config.INGEST_TEXT_BLOCK_SIZE)
                 else:
                     print(f"Unsupported document type: {doc_type}")
                     continue
                 
-                all_documents.extend(docs)
+                for page in pages:
+                    yield path, page
             except Exception as e:
                 print(f"Failed to load {doc_type}: {path} with error: {e}")
         
-        # Split documents into chunks
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=chunk_size, 
-            chunk_overlap=config.DEFAULT_CHUNK_OVERLAP
+        yield from links
+    
+    def _iter_chunk_batches(self, documents: List[Tuple[str, str]], text_splitter,
+                            batch_size: int, counts: Dict) -> Iterator[Tuple[List[str], List[str]]]:
+        """Yield (doc_paths, texts) batches of chunks, counting pages into counts"""
+        batch_paths, batch_texts = [], []
+        for doc_path, page in self._iter_pages(documents):
+            counts['pages'] += 1
+            for chunk in text_splitter.split_text(page):
+                batch_paths.append(doc_path)
+                batch_texts.append(chunk)
+                if len(batch_texts) == batch_size:
+                    yield batch_paths, batch_texts
+                    batch_paths, batch_texts = [], []
+        if batch_texts:
+            yield batch_paths, batch_texts
+    
+    def _embed_batch(self, texts: List[str], rag_id: int = None) -> Tuple[List[str], np.ndarray]:
+        """Embed one batch; shared-store chunks reuse stored vectors and are keyed by chunk id"""
+        with stage_seconds.time(pipeline='ingest', stage='embedding'):
+            if rag_id is not None:
+                chunk_ids, vectors = chunk_store_service.get_or_embed(
+                    texts, config.EMBEDDING_MODEL_NAME, self.embedding_model.embed_documents
+                )
+                return [str(chunk_id) for chunk_id in chunk_ids], vectors
+            vectors = np.asarray(self.embedding_model.embed_documents(texts), dtype=np.float32)
+            return [str(uuid.uuid4()) for _ in texts], vectors
+    
+    @staticmethod
+    def _write_batch(builder: StreamingIndexBuilder, chroma_store, ids: List[str],
+                     texts: List[str], vectors: np.ndarray):
+        """Add one embedded batch to the FAISS builder or the Chroma collection"""
+        if builder is not None:
+            builder.add(vectors)
+            return
+        # Chunk ids repeat when a batch holds the same shared chunk twice
+        unique = {}
+        for doc_id, text, vector in zip(ids, texts, vectors):
+            unique.setdefault(doc_id, (text, vector))
+        chroma_store._collection.upsert(
+            ids=list(unique),
+            documents=[text for text, _ in unique.values()],
+            embeddings=[vector.tolist() for _, vector in unique.values()]
+        )
+    
+    @staticmethod
+    def _delete_chroma_ids(chroma_store, ids: List[str], batch_size: int):
+        """Delete documents from a Chroma collection in batches it accepts"""
+        for start in range(0, len(ids), batch_size):
+            chroma_store._collection.delete(ids=ids[start:start + batch_size])
+    
+    def _wrap_faiss(self, index, ids: List[str], texts: List[str], positions: List[int] = None) -> FAISS:
+        """Wrap a FAISS index in a LangChain store whose docstore maps index positions to texts"""
+        positions = positions if positions is not None else range(len(ids))
+        return FAISS(
+            embedding_function=self.embedding_model,
+            index=index,
+            docstore=InMemoryDocstore({
+                doc_id: Document(page_content=text) for doc_id, text in zip(ids, texts)
+            }),
+            index_to_docstore_id=dict(zip(positions, ids))
         )
-        chunked_texts = [
-            chunk 
-            for doc in all_documents 
-            for chunk in text_splitter.split_text(doc.page_content)
-        ]
+    
+    def update_shared_index(self, index_name: str, vector_store_type: str, index_spec: Dict, rag_id: int,
+                            removed_ids: List[int], added_ids: List[int], added_texts: List[str],
+                            added_vectors: np.ndarray):
+        """
+        Bring a RAG's vector store in line with its updated chunk references
+        
+        Used after a partial update of the shared chunk store (a link refresh
+        or a document deletion), so nothing is re-embedded here. Chroma only
+        deletes and upserts the changed chunks. FAISS flat indexes are rebuilt
+        from the shared vectors on load anyway; other families are rebuilt from
+        the stored vectors, since HNSW graphs cannot drop entries. The BM25
+        index is rebuilt from the chunk texts.
+        
+        Args:
+            removed_ids: Chunk ids the RAG no longer references
+            added_ids: Chunk ids the RAG references for the first time
+            added_texts: Texts of the added chunks
+            added_vectors: Vectors of the added chunks
+        """
+        index_path = os.path.join(config.VECTOR_DB_PATH, index_name)
+        index_spec = parse_index_spec(index_spec)
+        _, _, texts, vectors = chunk_store_service.load_rag_chunks(rag_id)
         
-        # Create vector store
         if vector_store_type == "faiss":
-            vectorstore = FAISS.from_texts(chunked_texts, self.embedding_model)
-            vectorstore.save_local(index_path)
+            stored_index = os.path.join(index_path, SHARED_INDEX_FILE)
+            if index_spec['type'] != 'flat' and len(texts):
+                builder = StreamingIndexBuilder(index_spec)
+                for start in range(0, len(vectors), config.INGEST_BATCH_SIZE):
+                    builder.add(vectors[start:start + config.INGEST_BATCH_SIZE])
+                # Queries keep reading the old file until the new one is complete
+                faiss.write_index(builder.finish(), stored_index + ".tmp")
+                os.replace(stored_index + ".tmp", stored_index)
+            elif os.path.exists(stored_index):
+                # Its positions no longer match the RAG's chunk references
+                os.remove(stored_index)
         elif vector_store_type == "chroma":
-            vectorstore = Chroma.from_texts(
-                texts=chunked_texts,
-                embedding=self.embedding_model,
-                persist_directory=index_path
-            )
-            vectorstore.persist()
+            store = get_chroma_store(index_path, self.embedding_model)
+            batch_size = min(config.INGEST_BATCH_SIZE, max_batch_size(store._client))
+            self._delete_chroma_ids(store, [str(chunk_id) for chunk_id in removed_ids], batch_size)
+            for start in range(0, len(added_ids), batch_size):
+                self._write_batch(None, store, [str(chunk_id) for chunk_id in added_ids[start:start + batch_size]],
+                                  added_texts[start:start + batch_size], added_vectors[start:start + batch_size])
         else:
             raise ValueError(f"Unsupported vector store type: {vector_store_type}")
         
+        BM25Index.build(texts).save(index_path)
+        self._forget_lexical_index(index_path)
+    
+    def _load_shared_faiss(self, index_path: str, index_spec: Dict, rag_id: int):
+        """
+        Load a FAISS store built from the shared chunk store, or None if the RAG has no shared chunks
+        
+        The store is kept for later queries until the RAG's chunk references
+        change or its stored index file is replaced, so the chunks are read
+        from SQLite and a flat index is rebuilt once rather than per query.
+        """
+        generation = chunk_store_service.generation(rag_id)
+        stored_index = os.path.join(index_path, SHARED_INDEX_FILE)
+        stored_mtime = os.stat(stored_index).st_mtime_ns if os.path.exists(stored_index) else None
+        with self._cache_lock:
+            cached = self._shared_stores.get(rag_id)
+        if cached is not None and cached[:2] == (generation, stored_mtime):
+            cache_requests.inc(cache='faiss_store', result='hit')
+            vectorstore = cached[2]
+        else:
+            cache_requests.inc(cache='faiss_store', result='miss')
+            positions, chunk_ids, texts, vectors = chunk_store_service.load_rag_chunks(rag_id)
+            if not chunk_ids:
+                return None
+            
+            if stored_mtime is not None:
+                index = faiss.read_index(stored_index)
+            else:
+                # Flat index: rebuilt from the shared vectors, so positions are contiguous
+                index = build_faiss_index(parse_index_spec(None), vectors)
+                positions = None
+            vectorstore = self._wrap_faiss(index, [str(chunk_id) for chunk_id in chunk_ids], texts, positions)
+            with self._cache_lock:
+                # Keyed on the generation read before loading, so a change meanwhile forces a reload
+                self._shared_stores[rag_id] = (generation, stored_mtime, vectorstore)
+        # Query-time parameters can change without a rebuild
+        apply_search_params(vectorstore.index, index_spec)
         return vectorstore
     
-    def load_vectordb(self, index_name: str, vector_store_type: str):
-        """Load an existing vector database"""
+    def load_vectordb(self, index_name: str, vector_store_type: str, index_spec: Dict = None,
+                      rag_id: int = None):
+        """
+        Load an existing vector database
+        
+        Args:
+            index_name: Name of the vector store
+            vector_store_type: 'faiss' or 'chroma'
+            index_spec: Index spec whose query-time parameters (ef_search, nprobe)
+                are applied to a FAISS index after loading
+            rag_id: RAG project, for stores built from the shared chunk store
+        """
         index_path = os.path.join(config.VECTOR_DB_PATH, index_name)
         
         if not os.path.exists(index_path):
             raise FileNotFoundError(f"Vector store not found: {index_path}")
         
+        if (vector_store_type == "faiss" and rag_id is not None
+                and not os.path.exists(os.path.join(index_path, LEGACY_FAISS_PICKLE))):
+            vectorstore = self._load_shared_faiss(index_path, parse_index_spec(index_spec), rag_id)
+            if vectorstore is None:
+                raise FileNotFoundError(f"No chunks stored for RAG {rag_id}")
+            return vectorstore
+        
         if vector_store_type == "faiss":
-            return FAISS.load_local(
+            vectorstore = FAISS.load_local(
                 index_path, 
                 self.embedding_model, 
                 allow_dangerous_deserialization=True
             )
+            apply_search_params(vectorstore.index, parse_index_spec(index_spec))
+            return vectorstore
         elif vector_store_type == "chroma":
-            return Chroma(
-                persist_directory=index_path,
-                embedding_function=self.embedding_model
-            )
+            # One long-lived client per directory instead of reopening it per query
+            return get_chroma_store(index_path, self.embedding_model)
         else:
             raise ValueError(f"Unsupported vector store type: {vector_store_type}")
+    
+    def load_lexical_index(self, index_name: str) -> Optional[BM25Index]:
+        """
+        Load the BM25 index saved with a vector store, or None for stores built without one
+        
+        The parsed index is kept for later queries until its file changes.
+        """
+        index_path = os.path.abspath(os.path.join(config.VECTOR_DB_PATH, index_name))
+        try:
+            stat = os.stat(os.path.join(index_path, BM25_INDEX_FILE))
+        except FileNotFoundError:
+            self._forget_lexical_index(index_path)
+            return None
+        version = (stat.st_mtime_ns, stat.st_size)
+        with self._cache_lock:
+            cached = self._lexical_indexes.get(index_path)
+        if cached is not None and cached[0] == version:
+            cache_requests.inc(cache='bm25_index', result='hit')
+            return cached[1]
+        
+        cache_requests.inc(cache='bm25_index', result='miss')
+        lexical_index = BM25Index.load(index_path)
+        if lexical_index is not None:
+            with self._cache_lock:
+                self._lexical_indexes[index_path] = (version, lexical_index)
+        return lexical_index
+    
+    def _forget_lexical_index(self, index_path: str):
+        with self._cache_lock:
+            self._lexical_indexes.pop(os.path.abspath(index_path), None)
+    
+    def forget_indexes(self, index_name: str, rag_id: int = None):
+        """Drop the loaded indexes kept for a vector store, e.g. before deleting it"""
+        self._forget_lexical_index(os.path.join(config.VECTOR_DB_PATH, index_name))
+        with self._cache_lock:
+            self._shared_stores.pop(rag_id, None)
 
 
 # Singleton instance
@@ -1,7 +1,11 @@
 """Web search service for chat integration"""
 import asyncio
-from typing import List, Tuple
+import time
+from typing import Dict, List, Tuple
+from app.config import config
 from app.services.searchtool.web_search import WebSearch
+from app.utils.context_packing import ContextItem, ContextPacker
+from app.utils.metrics import loaded_models, provider_errors
 
 
 class WebSearchService:
@@ -10,38 +14,57 @@ class WebSearchService:
     def __init__(self):
         self.web_search = WebSearch(embedding_model="minilm")
     
-    async def search_and_get_context(self, query: str, num_results: int = 3) -> Tuple[str, List[str]]:
+    async def search_and_get_context(self, query: str, num_results: int = 3,
+                                     deadline: float = None, max_tokens: int = None,
+                                     model_name: str = None) -> Tuple[str, List[str], Dict]:
         """
         Search the web and return relevant context for LLM
         
         Args:
             query: User's search query
             num_results: Number of search results to process (default: 3)
+            deadline: time.monotonic() deadline for the whole search; defaults to
+                config.WEB_SEARCH_TIMEOUT seconds from now. Pages not fetched in
+                time are skipped and context is built from the rest
+            max_tokens: Token budget for the retrieved passages, counted with
+                model_name's tokenizer; at most config.WEB_CONTEXT_MAX_TOKENS
             
         Returns:
-            Tuple of (relevant_context, source_urls)
+            Tuple of (relevant_context, source_urls, search_info) where source_urls
+            are the pages backing the returned context
         """
+        if deadline is None:
+            deadline = time.monotonic() + config.WEB_SEARCH_TIMEOUT
+        
         try:
             # Search and get relevant documents
-            relevant_docs, urls = await self.web_search.search_tool(
+            relevant_docs, urls, search_info = await self.web_search.search_tool(
                 query, 
                 num_results=num_results, 
                 page=1, 
                 backend="auto", 
-                advanced=True
+                advanced=True,
+                deadline=deadline
             )
             
             if not relevant_docs:
-                return "No relevant web search results found.", []
+                return "No relevant web search results found.", [], search_info
             
-            # Take the top 2-3 most relevant documents and combine them
-            top_docs = relevant_docs[:min(3, len(relevant_docs))]
-            combined_content = "\n\n".join(top_docs)
+            # Pack the top 2-3 most relevant documents into the token budget
+            packer = ContextPacker(model_name)
+            packed = packer.pack([
+                ContextItem(doc, priority=i, position=i, truncatable=True, payload=i)
+                for i, doc in enumerate(relevant_docs[:min(3, len(relevant_docs))])
+            ], min(max_tokens or config.WEB_CONTEXT_MAX_TOKENS, config.WEB_CONTEXT_MAX_TOKENS))
+            if not packed:
+                return "No relevant web search results found.", [], search_info
+            combined_content = "\n\n".join(item.text for item in packed)
             
-            # Limit context length to prevent token overflow
-            max_context_length = 3000  # Increased for better context
-            if len(combined_content) > max_context_length:
-                combined_content = combined_content[:max_context_length] + "..."
+            # Only cite the pages that actually made it into the context
+            source_urls = list(dict.fromkeys(
+                search_info["sources"][item.payload] for item in packed
+                if item.payload < len(search_info["sources"]) and search_info["sources"][item.payload]
+            ))
             
             # Format context for LLM with stronger emphasis
             search_context = f"""LIVE WEB SEARCH RESULTS (December 2025) for: "{query}"
@@ -49,29 +72,35 @@ class WebSearchService:
                 Current Information Found:
                 {combined_content}
 
-                Sources: {', '.join(urls[:3])}
+                Sources: {', '.join(source_urls)}
 
                 This information is from live web search and should be prioritized over training data.
             """
             
-            return search_context.strip(), urls[:3]
+            return search_context.strip(), source_urls, search_info
             
         except Exception as e:
+            provider_errors.inc(provider='web_search')
             print(f"Web search error: {str(e)}")
             import traceback
             traceback.print_exc()
-            return f"Web search encountered an error: {str(e)}", []
+            return f"Web search encountered an error: {str(e)}", [], {}
     
-    def search_and_get_context_sync(self, query: str, num_results: int = 3) -> Tuple[str, List[str]]:
+    def search_and_get_context_sync(self, query: str, num_results: int = 3,
+                                    deadline: float = None, max_tokens: int = None,
+                                    model_name: str = None) -> Tuple[str, List[str], Dict]:
         """
         Synchronous wrapper for web search
         
         Args:
             query: User's search query  
             num_results: Number of search results to process (default: 3)
+            deadline: Optional time.monotonic() deadline for the whole search
+            max_tokens: Token budget for the retrieved passages
+            model_name: Model whose tokenizer counts the budget
             
         Returns:
-            Tuple of (relevant_context, source_urls)
+            Tuple of (relevant_context, source_urls, search_info)
         """
         try:
             # Run async function in new event loop
@@ -79,15 +108,19 @@ class WebSearchService:
             asyncio.set_event_loop(loop)
             try:
                 result = loop.run_until_complete(
-                    self.search_and_get_context(query, num_results)
+                    self.search_and_get_context(query, num_results, deadline, max_tokens, model_name)
                 )
                 return result
             finally:
                 loop.close()
         except Exception as e:
             print(f"Web search sync wrapper error: {str(e)}")
-            return f"Web search encountered an error: {str(e)}", []
+            return f"Web search encountered an error: {str(e)}", [], {}
 
 
 # Singleton instance
-web_search_service = WebSearchService()
\ No newline at end of file
+web_search_service = WebSearchService()
+loaded_models.set_function(lambda: web_search_service.web_search.vector_db.embedding_model is not None,
+                           kind='web_search_embedding')
+loaded_models.set_function(lambda: web_search_service.web_search.vector_db.rerank_model is not None,
+                           kind='web_search_reranker')
\ No newline at end of file
@@ -0,0 +1,81 @@
+"""
+Text extraction from downloaded HTML, XML, text and PDF bodies
+
+Imports only the standard library (and pypdf when a PDF is parsed), so the
+link fetcher's extraction processes load it without the services, their
+models or the database.
+"""
+import io
+from html.parser import HTMLParser
+from typing import List, Optional
+
+# Elements whose text is page furniture rather than content
+SKIPPED_TAGS = {'script', 'style', 'noscript', 'template', 'svg', 'nav', 'header', 'footer', 'form', 'aside'}
+BLOCK_TAGS = {
+    'p', 'div', 'br', 'li', 'ul', 'ol', 'tr', 'table', 'section', 'article', 'main',
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'pre', 'blockquote', 'dt', 'dd', 'hr',
+}
+
+
+class _HTMLTextExtractor(HTMLParser):
+    """Collect the visible text of an HTML page, one line per block element"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts: List[str] = []
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIPPED_TAGS:
+            self._skip_depth += 1
+        elif tag in BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag in BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self.parts.append(data)
+
+
+def html_to_text(html: str) -> str:
+    """Visible text of an HTML page with whitespace collapsed"""
+    parser = _HTMLTextExtractor()
+    parser.feed(html)
+    parser.close()
+    lines = (" ".join(line.split()) for line in "".join(parser.parts).splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def pdf_to_text(body: bytes) -> str:
+    """Text of a PDF document, pages separated by blank lines"""
+    from pypdf import PdfReader
+    reader = PdfReader(io.BytesIO(body))
+    return "\n\n".join(page.extract_text() or "" for page in reader.pages)
+
+
+def extract_text(content_type: str, body: bytes, encoding: Optional[str]) -> str:
+    """
+    Convert a downloaded body to plain text
+
+    Module-level so it can run in the link fetcher's extraction process pool.
+    """
+    content_type = content_type.lower()
+    if 'pdf' in content_type or body.startswith(b'%PDF'):
+        return pdf_to_text(body)
+
+    if encoding:
+        text = body.decode(encoding, errors='replace')
+    else:
+        try:
+            text = body.decode('utf-8')
+        except UnicodeDecodeError:
+            text = body.decode('latin-1')
+
+    if 'html' in content_type or 'xml' in content_type or text.lstrip()[:1] == '<':
+        return html_to_text(text)
+    return text
@@ -1,5 +1,6 @@
 """Initialize utils package"""
 from app.utils.ollama_utils import get_ollama_models, check_ollama_available
-from app.utils.file_utils import allowed_file, save_uploaded_file
+from app.utils.file_utils import allowed_file, save_uploaded_file, save_text_document, FileTooLargeError
 
-__all__ = ['get_ollama_models', 'check_ollama_available', 'allowed_file', 'save_uploaded_file']
+__all__ = ['get_ollama_models', 'check_ollama_available', 'allowed_file', 'save_uploaded_file',
+           'save_text_document', 'FileTooLargeError']
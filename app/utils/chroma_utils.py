@@ -0,0 +1,108 @@
+"""Chroma client reuse and batched insert utilities"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import chromadb
+from langchain_community.vectorstores import Chroma
+
+from app.utils.metrics import cache_requests, resident_indexes
+
+# Used when the client cannot report its limit (older chromadb releases)
+DEFAULT_MAX_BATCH_SIZE = 5000
+
+_clients: Dict[str, object] = {}
+_stores: Dict[str, Chroma] = {}
+_lock = threading.Lock()
+resident_indexes.set_function(lambda: len(_stores), kind='chroma')
+
+
+def get_chroma_client(persist_directory: str):
+    """
+    Get the long-lived client for a persist directory
+
+    Opening a PersistentClient loads the SQLite catalogue and segment files, so
+    one client per directory is created on first use and shared by all requests.
+    """
+    path = os.path.abspath(persist_directory)
+    with _lock:
+        client = _clients.get(path)
+        cache_requests.inc(cache='chroma_client', result='miss' if client is None else 'hit')
+        if client is None:
+            client = chromadb.PersistentClient(path=path)
+            _clients[path] = client
+        return client
+
+
+def get_chroma_store(persist_directory: str, embedding_function) -> Chroma:
+    """Get the shared LangChain Chroma store for a persist directory"""
+    path = os.path.abspath(persist_directory)
+    client = get_chroma_client(path)
+    with _lock:
+        store = _stores.get(path)
+        if store is None:
+            store = Chroma(client=client, embedding_function=embedding_function)
+            _stores[path] = store
+        return store
+
+
+def close_chroma_client(persist_directory: str):
+    """Forget the cached client of a directory, e.g. before deleting it"""
+    path = os.path.abspath(persist_directory)
+    with _lock:
+        _stores.pop(path, None)
+        _clients.pop(path, None)
+
+
+def max_batch_size(client) -> int:
+    """Largest number of records the client accepts in one insert"""
+    if hasattr(client, 'get_max_batch_size'):
+        return client.get_max_batch_size()
+    return getattr(client, 'max_batch_size', DEFAULT_MAX_BATCH_SIZE)
+
+
+def upsert_pipelined(
+    store: Chroma,
+    ids: List[str],
+    texts: List[str],
+    embed_documents: Optional[Callable[[List[str]], List[List[float]]]] = None,
+    embeddings: Optional[List[List[float]]] = None
+) -> int:
+    """
+    Insert records in batches of the server's max batch size
+
+    When texts still need embedding, each batch is written on a background
+    thread while the next batch is embedded, so embedding and inserts overlap.
+
+    Args:
+        store: LangChain Chroma store
+        ids: Record ids
+        texts: Record texts
+        embed_documents: Embeds a batch of texts; used when embeddings is None
+        embeddings: Precomputed embeddings parallel to texts
+
+    Returns:
+        Number of batches written
+    """
+    batch_size = max_batch_size(store._client)
+
+    def batches() -> Iterable[Tuple[List[str], List[str], List[List[float]]]]:
+        for start in range(0, len(ids), batch_size):
+            batch_texts = texts[start:start + batch_size]
+            batch_embeddings = (embeddings[start:start + batch_size] if embeddings is not None
+                                else embed_documents(batch_texts))
+            yield ids[start:start + batch_size], batch_texts, batch_embeddings
+
+    written = 0
+    with ThreadPoolExecutor(max_workers=1) as writer:
+        pending = None
+        for batch_ids, batch_texts, batch_embeddings in batches():
+            if pending is not None:
+                pending.result()
+            pending = writer.submit(store._collection.upsert, ids=batch_ids,
+                                    documents=batch_texts, embeddings=batch_embeddings)
+            written += 1
+        if pending is not None:
+            pending.result()
+    return written
@@ -0,0 +1,156 @@
+"""Token-budgeted packing of chat history, retrieved chunks and web context into prompts"""
+from dataclasses import dataclass
+from typing import Any, List, Tuple
+
+from langchain_core.documents import Document
+
+from app.config import config
+from app.utils.token_utils import count_tokens, is_exact, truncate_tokens
+
+# Context window (prompt plus completion tokens) by model name fragment; the
+# longest fragment contained in the (lower-cased) model name wins
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-4.1": 1047576,
+    "gpt-4o": 128000,
+    "gpt-4-turbo": 128000,
+    "gpt-4": 8192,
+    "gpt-3.5": 16385,
+    "llama-3.1": 131072,
+    "llama-3.2": 131072,
+    "llama-3.3": 131072,
+    "llama-4": 131072,
+    "llama3": 8192,
+    "llama2": 4096,
+    "mixtral": 32768,
+    "mistral": 32768,
+    "gemma": 8192,
+    "qwen": 32768,
+    "deepseek": 65536,
+    "phi-4": 16384,
+    "phi-3": 4096,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+
+# Share of the budget given up when counting with an approximate tokenizer,
+# since the model's own one may split the same text into more tokens
+APPROXIMATION_MARGIN = 0.1
+
+# A truncated item shorter than this is not worth its tokens
+MIN_TRUNCATED_TOKENS = 32
+
+
+def context_window(model_type: str, model_name: str) -> int:
+    """Tokens a model accepts per call, prompt and completion together"""
+    if model_type == "Ollama":
+        # Ollama runs models with num_ctx tokens and silently drops the start of longer prompts
+        return config.OLLAMA_NUM_CTX
+    name = (model_name or "").lower()
+    matches = [fragment for fragment in MODEL_CONTEXT_WINDOWS if fragment in name]
+    if not matches:
+        return DEFAULT_CONTEXT_WINDOW
+    return MODEL_CONTEXT_WINDOWS[max(matches, key=len)]
+
+
+def context_budget(model_type: str, model_name: str) -> int:
+    """
+    Prompt tokens to spend on one call of a model
+
+    The context window less COMPLETION_TOKEN_RESERVE for the answer, capped at
+    MAX_CONTEXT_TOKENS, and reduced by APPROXIMATION_MARGIN when the model's
+    tokenizer is only approximated.
+    """
+    budget = min(config.MAX_CONTEXT_TOKENS,
+                 context_window(model_type, model_name) - config.COMPLETION_TOKEN_RESERVE)
+    if not is_exact(model_name):
+        budget = int(budget * (1 - APPROXIMATION_MARGIN))
+    return max(budget, 0)
+
+
+@dataclass
+class ContextItem:
+    """A piece of prompt context competing for the token budget"""
+    text: str
+    priority: float            # Lower packs first
+    position: float = 0        # Order in the packed output
+    truncatable: bool = False  # May be cut to the remaining budget instead of skipped
+    payload: Any = None        # Caller's object (a turn, a Document, ...)
+    tokens: int = 0            # Set while packing
+
+
+class ContextPacker:
+    """
+    Greedy packing of context items under a token budget
+
+    Items are taken in priority order and counted with the model's tokenizer.
+    An item that does not fit is skipped, so smaller lower-priority items can
+    still use the rest of the budget, unless it is truncatable and at least
+    MIN_TRUNCATED_TOKENS remain, in which case it is cut to fit.
+    """
+
+    def __init__(self, model_name: str = None):
+        self.model_name = model_name
+
+    def count(self, text: str) -> int:
+        return count_tokens(text, self.model_name)
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        return truncate_tokens(text, max_tokens, self.model_name)
+
+    def pack(self, items: List[ContextItem], budget: int, separator: str = "\n\n",
+             skip: bool = True) -> List[ContextItem]:
+        """
+        Items that fit in budget tokens, in position order
+
+        Args:
+            separator: Text the caller joins the items with, counted once per item
+            skip: Go on with lower-priority items after one does not fit;
+                otherwise stop there (e.g. to keep a conversation contiguous)
+        """
+        separator_tokens = self.count(separator)
+        remaining = budget
+        packed = []
+        for item in sorted(items, key=lambda item: item.priority):
+            if remaining <= separator_tokens:
+                break
+            item.tokens = self.count(item.text) + separator_tokens
+            if item.tokens > remaining:
+                if not item.truncatable or remaining - separator_tokens < MIN_TRUNCATED_TOKENS:
+                    if skip:
+                        continue
+                    break
+                item.text = self.truncate(item.text, remaining - separator_tokens)
+                item.tokens = self.count(item.text) + separator_tokens
+            remaining -= item.tokens
+            packed.append(item)
+        return sorted(packed, key=lambda item: item.position)
+
+    def pack_texts(self, texts: List[str], budget: int, separator: str = "\n\n") -> List[str]:
+        """Texts (in priority order) that fit in budget, the last one truncated if needed"""
+        items = [ContextItem(text, priority=i, position=i, truncatable=True) for i, text in enumerate(texts)]
+        return [item.text for item in self.pack(items, budget, separator)]
+
+    def pack_documents(self, docs: List[Document], budget: int, separator: str = "\n\n") -> List[Document]:
+        """Documents (in relevance order) that fit in budget, the last one truncated if needed"""
+        items = [
+            ContextItem(doc.page_content, priority=i, position=i, truncatable=True, payload=doc)
+            for i, doc in enumerate(docs)
+        ]
+        packed = []
+        for item in self.pack(items, budget, separator):
+            doc = item.payload
+            if item.text != doc.page_content:
+                doc = Document(page_content=item.text, metadata={**doc.metadata, 'truncated': True})
+            packed.append(doc)
+        return packed
+
+    def pack_turns(self, turns: List[Tuple[str, str]], budget: int,
+                   max_turns: int = None) -> List[Tuple[str, str]]:
+        """Most recent (question, answer) turns that fit in budget, in conversation order"""
+        if max_turns is not None:
+            turns = turns[-max_turns:] if max_turns > 0 else []
+        items = [
+            ContextItem(f"Human: {question}\nAssistant: {answer}", priority=len(turns) - index,
+                        position=index, payload=(question, answer))
+            for index, (question, answer) in enumerate(turns)
+        ]
+        return [item.payload for item in self.pack(items, budget, separator="\n", skip=False)]
@@ -1,10 +1,19 @@
 """File handling utilities"""
+import hashlib
 import os
+import shutil
+import tempfile
 from werkzeug.utils import secure_filename
-from typing import Tuple
+from typing import BinaryIO, Optional, Tuple
 
 
 ALLOWED_EXTENSIONS = {'txt', 'pdf', 'doc', 'docx', 'md'}
+UPLOAD_CHUNK_SIZE = 64 * 1024  # Bytes copied (and hashed) per read
+BLOB_DIR = '.blobs'            # Content-addressed store under the upload folder
+
+
+class FileTooLargeError(ValueError):
+    """Raised when an upload exceeds the configured size limit"""
 
 
 def allowed_file(filename: str) -> bool:
@@ -13,29 +22,141 @@ def allowed_file(filename: str) -> bool:
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
-def save_uploaded_file(file, upload_dir: str) -> Tuple[str, str]:
+def _file_type(filename: str) -> str:
+    return 'pdf' if filename.lower().endswith('.pdf') else 'text'
+
+
+def blob_path(upload_root: str, content_hash: str) -> str:
+    """Location of the stored copy of a content hash"""
+    return os.path.join(upload_root, BLOB_DIR, content_hash[:2], content_hash)
+
+
+def _stream_to_blob(stream: BinaryIO, upload_root: str, max_size: Optional[int]) -> str:
+    """
+    Copy a stream into the blob store in chunks, hashing as it goes
+    
+    The copy is abandoned as soon as max_size is exceeded, so an oversized
+    file never lands in the blob store in full. Uploads are spooled by
+    werkzeug before this runs; the request body as a whole is bounded by
+    MAX_CONTENT_LENGTH (see create_app).
+    
+    Returns:
+        SHA-256 of the content
+    """
+    tmp_dir = os.path.join(upload_root, BLOB_DIR, 'tmp')
+    os.makedirs(tmp_dir, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = stream.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if max_size is not None and size > max_size:
+                    raise FileTooLargeError(f"File exceeds the {max_size // (1024 * 1024)}MB limit")
+                digest.update(chunk)
+                out.write(chunk)
+        
+        content_hash = digest.hexdigest()
+        target = blob_path(upload_root, content_hash)
+        if os.path.exists(target):
+            os.remove(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(tmp_path, target)
+        return content_hash
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _link_blob(upload_root: str, content_hash: str, upload_dir: str, filename: str) -> str:
+    """
+    Hard-link a blob into an upload directory under its original name
+    
+    A different file already using the name keeps it; the new one gets the
+    hash prefix appended instead of overwriting it.
+    """
+    source = blob_path(upload_root, content_hash)
+    os.makedirs(upload_dir, exist_ok=True)
+    file_path = os.path.join(upload_dir, filename)
+    if os.path.exists(file_path):
+        if os.path.samefile(file_path, source):
+            return file_path
+        stem, ext = os.path.splitext(filename)
+        file_path = os.path.join(upload_dir, f"{stem}-{content_hash[:8]}{ext}")
+        if os.path.exists(file_path):
+            return file_path
+    try:
+        os.link(source, file_path)
+    except OSError:
+        # File systems without hard links
+        shutil.copyfile(source, file_path)
+    return file_path
+
+
+def save_uploaded_file(file, upload_dir: str, upload_root: str = None,
+                       max_size: Optional[int] = None) -> Tuple[str, str, str]:
     """
     Save uploaded file
     
+    The upload is streamed into a content-addressed blob store while it is
+    hashed, then hard-linked into upload_dir, so identical files share one
+    copy on disk.
+    
     Args:
         file: File object from request.files
         upload_dir: Directory to save file
+        upload_root: Upload folder holding the blob store; defaults to the
+            parent of upload_dir
+        max_size: Largest accepted size in bytes
         
     Returns:
-        Tuple of (file_path, file_type)
+        Tuple of (file_path, file_type, content_hash)
+        
+    Raises:
+        FileTooLargeError: If the file is larger than max_size
     """
     if not file or not file.filename:
         raise ValueError("No file provided")
     
     filename = secure_filename(file.filename)
-    os.makedirs(upload_dir, exist_ok=True)
-    file_path = os.path.join(upload_dir, filename)
-    file.save(file_path)
-    
-    # Determine file type
-    if filename.endswith('.pdf'):
-        file_type = 'pdf'
-    else:
-        file_type = 'text'
+    upload_root = upload_root or os.path.dirname(os.path.abspath(upload_dir))
+    content_hash = _stream_to_blob(file.stream, upload_root, max_size)
+    file_path = _link_blob(upload_root, content_hash, upload_dir, filename)
+    return file_path, _file_type(filename), content_hash
+
+
+def save_text_document(text: str, upload_dir: str, upload_root: str = None,
+                       max_size: Optional[int] = None) -> Tuple[str, str]:
+    """
+    Save pasted text content as a content-addressed text document
     
-    return file_path, file_type
+    Returns:
+        Tuple of (file_path, content_hash)
+    """
+    data = text.encode('utf-8')
+    if max_size is not None and len(data) > max_size:
+        raise FileTooLargeError(f"Text exceeds the {max_size // (1024 * 1024)}MB limit")
+    upload_root = upload_root or os.path.dirname(os.path.abspath(upload_dir))
+    content_hash = hashlib.sha256(data).hexdigest()
+    target = blob_path(upload_root, content_hash)
+    if not os.path.exists(target):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'wb') as out:
+            out.write(data)
+    file_path = _link_blob(upload_root, content_hash, upload_dir, f"text_doc_{content_hash[:12]}.txt")
+    return file_path, content_hash
+
+
+def remove_uploaded_file(file_path: str, content_hash: str, upload_root: str):
+    """Remove an upload's link and drop its blob once no upload links to it"""
+    if os.path.isfile(file_path):
+        os.remove(file_path)
+    blob = blob_path(upload_root, content_hash)
+    if os.path.isfile(blob) and os.stat(blob).st_nlink <= 1:
+        os.remove(blob)
@@ -0,0 +1,198 @@
+"""FAISS index specification utilities"""
+import json
+from typing import Dict, Optional, Union
+
+import numpy as np
+import faiss
+
+
+# Supported index families and the parameters each one uses
+INDEX_TYPES = {
+    'flat': [],
+    'hnsw': ['hnsw_m', 'ef_search'],
+    'ivf': ['nlist', 'nprobe'],
+    'ivfpq': ['nlist', 'nprobe', 'pq_m', 'pq_nbits'],
+    'sq8': [],
+    'sqfp16': [],
+}
+
+DEFAULT_INDEX_SPEC = {'type': 'flat'}
+DEFAULT_HNSW_M = 32
+DEFAULT_EF_SEARCH = 64
+DEFAULT_PQ_M = 16
+DEFAULT_PQ_NBITS = 8
+# Fewer bits than this leave PQ codes too coarse to be worth it over IVF-Flat
+MIN_PQ_NBITS = 4
+TRAINING_POINTS_PER_CENTROID = 64
+SEARCH_PARAMS = ('ef_search', 'nprobe')
+# Index families that must be trained before vectors can be added
+TRAINED_INDEX_TYPES = ('ivf', 'ivfpq', 'sq8', 'sqfp16')
+# Vectors buffered to train those indexes during a streaming build
+STREAMING_TRAINING_BUFFER = 65536
+
+
+def parse_index_spec(value: Union[str, Dict, None]) -> Dict:
+    """
+    Parse a stored index spec
+
+    Args:
+        value: JSON string from the rag table, a dict, or None
+
+    Returns:
+        Validated spec dict with a 'type' key and integer parameters
+    """
+    if not value:
+        return dict(DEFAULT_INDEX_SPEC)
+    spec = json.loads(value) if isinstance(value, str) else dict(value)
+
+    index_type = spec.get('type', 'flat')
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unsupported index type: {index_type}. "
+                         f"Available types: {list(INDEX_TYPES)}")
+
+    parsed = {'type': index_type}
+    for param in INDEX_TYPES[index_type]:
+        if spec.get(param) not in (None, ''):
+            parsed[param] = int(spec[param])
+    return parsed
+
+
+def index_spec_from_form(form) -> Dict:
+    """Build an index spec from the db_embedding_selection form fields"""
+    spec = {'type': form.get('index_type') or 'flat'}
+    for params in INDEX_TYPES.values():
+        for param in params:
+            if form.get(param):
+                spec[param] = form.get(param)
+    return parse_index_spec(spec)
+
+
+def describe_index_spec(spec: Dict) -> str:
+    """Return the faiss.index_factory description for a spec"""
+    index_type = spec['type']
+    if index_type == 'flat':
+        return 'Flat'
+    if index_type == 'hnsw':
+        return f"HNSW{spec.get('hnsw_m', DEFAULT_HNSW_M)},Flat"
+    if index_type == 'ivf':
+        return f"IVF{spec['nlist']},Flat"
+    if index_type == 'ivfpq':
+        return f"IVF{spec['nlist']},PQ{spec.get('pq_m', DEFAULT_PQ_M)}x{spec.get('pq_nbits', DEFAULT_PQ_NBITS)}"
+    if index_type == 'sq8':
+        return 'SQ8'
+    return 'SQfp16'
+
+
+def build_faiss_index(spec: Dict, vectors: np.ndarray, seed: int = 0) -> faiss.Index:
+    """
+    Build and fill a FAISS index for the spec
+
+    Indexes that need training (IVF, PQ, scalar quantizers) are trained on a
+    random sample of the vectors. L2 metric matches LangChain's FAISS default.
+    PQ k-means needs at least 2**pq_nbits training points, so for smaller
+    corpora pq_nbits is lowered to fit, or IVF-Flat is built instead when
+    fewer than 2**MIN_PQ_NBITS vectors are left.
+
+    Args:
+        spec: Parsed index spec; an unset nlist is derived from the corpus size
+        vectors: float32 matrix of embeddings
+
+    Returns:
+        Filled index with search parameters applied
+    """
+    count, dimension = vectors.shape
+    spec = dict(spec)
+
+    if spec['type'] in ('ivf', 'ivfpq'):
+        nlist = spec.get('nlist') or int(4 * np.sqrt(count))
+        # Keep enough training points per centroid for small corpora
+        spec['nlist'] = max(1, min(nlist, count // 39 or 1))
+    if spec['type'] == 'ivfpq' and dimension % spec.get('pq_m', DEFAULT_PQ_M):
+        raise ValueError(f"pq_m={spec.get('pq_m', DEFAULT_PQ_M)} must divide the embedding dimension {dimension}")
+    if spec['type'] == 'ivfpq' and count < 2 ** spec.get('pq_nbits', DEFAULT_PQ_NBITS):
+        pq_nbits = count.bit_length() - 1
+        if pq_nbits >= MIN_PQ_NBITS:
+            print(f"{count} vectors are too few to train PQ with pq_nbits={spec.get('pq_nbits', DEFAULT_PQ_NBITS)}, "
+                  f"using pq_nbits={pq_nbits}")
+            spec['pq_nbits'] = pq_nbits
+        else:
+            print(f"{count} vectors are too few to train PQ, building an IVF-Flat index instead")
+            spec = {param: value for param, value in spec.items() if param not in ('pq_m', 'pq_nbits')}
+            spec['type'] = 'ivf'
+
+    index = faiss.index_factory(dimension, describe_index_spec(spec), faiss.METRIC_L2)
+
+    if not index.is_trained:
+        sample_size = count
+        if spec['type'] in ('ivf', 'ivfpq'):
+            sample_size = min(count, max(spec['nlist'] * TRAINING_POINTS_PER_CENTROID,
+                                         2 ** spec.get('pq_nbits', DEFAULT_PQ_NBITS) * 39))
+        sample = vectors
+        if sample_size < count:
+            rng = np.random.default_rng(seed)
+            sample = vectors[rng.choice(count, sample_size, replace=False)]
+        print(f"Training {describe_index_spec(spec)} index on {len(sample)} of {count} vectors")
+        index.train(np.ascontiguousarray(sample))
+
+    index.add(vectors)
+    apply_search_params(index, spec)
+    return index
+
+
+def apply_search_params(index: faiss.Index, spec: Optional[Dict]):
+    """Apply query-time parameters (efSearch, nprobe) from a spec to an index"""
+    if not spec:
+        return
+    if spec.get('ef_search') or spec['type'] == 'hnsw':
+        hnsw_index = faiss.downcast_index(index)
+        if hasattr(hnsw_index, 'hnsw'):
+            hnsw_index.hnsw.efSearch = spec.get('ef_search', DEFAULT_EF_SEARCH)
+    if spec.get('nprobe'):
+        try:
+            faiss.extract_index_ivf(index).nprobe = spec['nprobe']
+        except RuntimeError:
+            pass  # Not an IVF index
+
+
+class StreamingIndexBuilder:
+    """
+    Fill a FAISS index batch by batch
+
+    Flat and HNSW indexes take each batch as it arrives. Indexes that need
+    training buffer the first training_buffer vectors, train on them (an unset
+    nlist is derived from the buffer size) and then take later batches
+    directly, so at most one buffer of vectors is held outside the index.
+    """
+
+    def __init__(self, spec: Dict, training_buffer: int = STREAMING_TRAINING_BUFFER):
+        self.spec = dict(spec)
+        self.training_buffer = training_buffer
+        self.index: Optional[faiss.Index] = None
+        self.count = 0
+        self._buffer = []
+        self._buffered = 0
+
+    def add(self, vectors: np.ndarray):
+        """Add a float32 batch"""
+        self.count += len(vectors)
+        if self.index is not None:
+            self.index.add(vectors)
+            return
+        self._buffer.append(vectors)
+        self._buffered += len(vectors)
+        if self.spec['type'] not in TRAINED_INDEX_TYPES or self._buffered >= self.training_buffer:
+            self._build_from_buffer()
+
+    def _build_from_buffer(self):
+        vectors = np.concatenate(self._buffer) if len(self._buffer) > 1 else self._buffer[0]
+        self._buffer = []
+        self._buffered = 0
+        self.index = build_faiss_index(self.spec, np.ascontiguousarray(vectors))
+
+    def finish(self) -> faiss.Index:
+        """Return the filled index"""
+        if self.index is None:
+            if not self._buffer:
+                raise ValueError("No vectors were added to the index")
+            self._build_from_buffer()
+        return self.index
@@ -0,0 +1,68 @@
+"""Process memory measurement utilities"""
+import os
+import resource
+import sys
+import threading
+from typing import Dict
+
+RSS_SAMPLE_INTERVAL = 0.05  # Seconds between samples
+
+
+def current_rss_bytes() -> int:
+    """Resident set size of this process, in bytes"""
+    try:
+        with open('/proc/self/statm', 'r') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        # No procfs (macOS): fall back to the lifetime peak
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class PeakRSSMonitor:
+    """
+    Track the peak RSS of a block of work
+
+    ru_maxrss only reports the lifetime peak of the process, so a background
+    thread samples the current RSS instead, giving a peak per build.
+
+    Usage:
+        with PeakRSSMonitor() as monitor:
+            ...
+        print(monitor.stats())
+    """
+
+    def __init__(self, interval: float = RSS_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.start_bytes = 0
+        self.peak_bytes = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def sample(self):
+        """Take a sample now, e.g. right after a large allocation"""
+        self.peak_bytes = max(self.peak_bytes, current_rss_bytes())
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def __enter__(self) -> "PeakRSSMonitor":
+        self.start_bytes = self.peak_bytes = current_rss_bytes()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.sample()
+
+    def stats(self) -> Dict[str, float]:
+        """Start and peak RSS in MiB"""
+        return {
+            'start_rss_mb': self.start_bytes / 2 ** 20,
+            'peak_rss_mb': self.peak_bytes / 2 ** 20,
+            'peak_rss_delta_mb': (self.peak_bytes - self.start_bytes) / 2 ** 20,
+        }
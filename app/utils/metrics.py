@@ -0,0 +1,262 @@
+"""In-process metrics with Prometheus text exposition"""
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+
+# Seconds; spans SQLite statements (sub-millisecond) to LLM answers and web crawls
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+        pairs.append(f'{name}="{escaped}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+class _Metric:
+    """A named metric family with a fixed set of label names"""
+
+    type_name = ''
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[float, Dict[str, str]], None]] = []
+
+    def add_listener(self, listener: Callable[[float, Dict[str, str]], None]):
+        """Call listener(value, labels) on every update, e.g. to attribute it to the current chat turn"""
+        self._listeners.append(listener)
+
+    def _notify(self, value: float, labels: Dict[str, str]):
+        for listener in self._listeners:
+            listener(value, labels)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} expects labels {list(self.label_names)}, got {sorted(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def samples(self) -> Iterator[Tuple[str, Tuple[str, ...], Tuple[str, ...], float]]:
+        """Yield (sample name, label names, label values, value)"""
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        for sample_name, names, values, value in self.samples():
+            lines.append(f"{sample_name}{_format_labels(names, values)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+
+    type_name = 'counter'
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        super().__init__(name, documentation, label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        if amount < 0:
+            raise ValueError("Counters can only increase")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        if self._listeners:
+            self._notify(amount, labels)
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield self.name, self.label_names, key, value
+
+
+class Gauge(_Metric):
+    """
+    Value that goes up and down
+
+    Besides set/inc/dec, a label set can be bound to a function that is called
+    at scrape time, for values owned elsewhere (models loaded, clients cached).
+    """
+
+    type_name = 'gauge'
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        super().__init__(name, documentation, label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._functions: Dict[Tuple[str, ...], Callable[[], float]] = {}
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], float], **labels):
+        """Report function() as the value of this label set"""
+        key = self._key(labels)
+        with self._lock:
+            self._functions[key] = function
+
+    def value(self, **labels) -> float:
+        key = self._key(labels)
+        if key in self._functions:
+            return float(self._functions[key]())
+        return self._values.get(key, 0)
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+            functions = dict(self._functions)
+        for key, function in functions.items():
+            try:
+                values[key] = float(function())
+            except Exception:
+                continue  # A failing callback drops its sample, not the scrape
+        for key, value in sorted(values.items()):
+            yield self.name, self.label_names, key, value
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets, plus their sum and count"""
+
+    type_name = 'histogram'
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # Per label set: [count per bucket (not cumulative)..., sum]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        position = next(i for i, bound in enumerate(self.buckets) if value <= bound)
+        with self._lock:
+            entry = self._values.setdefault(key, [0] * len(self.buckets) + [0.0])
+            entry[position] += 1
+            entry[-1] += value
+        if self._listeners:
+            self._notify(value, labels)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of a block in seconds, also when it raises"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        entry = self._values.get(self._key(labels))
+        return int(sum(entry[:-1])) if entry else 0
+
+    def samples(self):
+        with self._lock:
+            values = sorted((key, list(entry)) for key, entry in self._values.items())
+        label_names = self.label_names + ('le',)
+        for key, entry in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, entry[:-1]):
+                cumulative += count
+                yield f"{self.name}_bucket", label_names, key + (_format_value(bound),), cumulative
+            yield f"{self.name}_sum", self.label_names, key, entry[-1]
+            yield f"{self.name}_count", self.label_names, key, cumulative
+
+
+class MetricsRegistry:
+    """Named metric families, rendered together for a scrape"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric_class, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = metric_class(name, *args, **kwargs)
+            elif not isinstance(metric, metric_class):
+                raise ValueError(f"Metric {name} is already registered as a {metric.type_name}")
+            return metric
+
+    def counter(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> Counter:
+        """Get or create a counter"""
+        return self._register(Counter, name, documentation, label_names)
+
+    def gauge(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> Gauge:
+        """Get or create a gauge"""
+        return self._register(Gauge, name, documentation, label_names)
+
+    def histogram(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        """Get or create a histogram"""
+        return self._register(Histogram, name, documentation, label_names, buckets)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format (version 0.0.4)"""
+        with self._lock:
+            metrics = [self._metrics[name] for name in sorted(self._metrics)]
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+# Singleton registry and the application's metric families
+registry = MetricsRegistry()
+
+stage_seconds = registry.histogram(
+    'intelliforge_stage_duration_seconds',
+    'Duration of pipeline stages (index_load, retrieval, rerank, embedding, llm_generation, '
+    'web_search, crawl, sqlite)',
+    ['pipeline', 'stage']
+)
+cache_requests = registry.counter(
+    'intelliforge_cache_requests_total',
+    'Cache lookups by cache and result (hit or miss)',
+    ['cache', 'result']
+)
+loaded_models = registry.gauge(
+    'intelliforge_loaded_models',
+    'Models currently loaded in memory',
+    ['kind']
+)
+resident_indexes = registry.gauge(
+    'intelliforge_resident_indexes',
+    'Vector indexes currently held open',
+    ['kind']
+)
+provider_errors = registry.counter(
+    'intelliforge_provider_errors_total',
+    'Failed calls to model providers and external services',
+    ['provider']
+)
@@ -1,6 +1,7 @@
 """Ollama integration utilities"""
 import requests
 from typing import List
+from app.config import config
 
 
 def get_ollama_models() -> List[str]:
@@ -12,14 +13,14 @@ def get_ollama_models() -> List[str]:
     """
     model_list = []
     try:
-        url = "http://localhost:11434/api/tags"
+        url = f"{config.OLLAMA_BASE_URL}/api/tags"
         response = requests.get(url, timeout=2)
         if response.status_code == 200:
             data = response.json()
             for model in data.get("models", []):
                 model_list.append(model["model"])
     except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
-        print(f"Warning: Could not connect to Ollama at localhost:11434. Error: {e}")
+        print(f"Warning: Could not connect to Ollama at {config.OLLAMA_BASE_URL}. Error: {e}")
     
     return model_list
 
@@ -27,7 +28,7 @@ def get_ollama_models() -> List[str]:
 def check_ollama_available() -> bool:
     """Check if Ollama is running"""
     try:
-        url = "http://localhost:11434/api/tags"
+        url = f"{config.OLLAMA_BASE_URL}/api/tags"
         response = requests.get(url, timeout=1)
         return response.status_code == 200
     except:
@@ -0,0 +1,65 @@
+"""Token counting for prompts and completions"""
+import functools
+from typing import Optional
+
+# Used when no tokenizer is available; roughly right for English text
+CHARS_PER_TOKEN = 4
+# Encoding for models tiktoken does not know (Llama, Mixtral, Gemma, ...). Their
+# own tokenizers differ, so counts with it are approximate
+DEFAULT_ENCODING = 'cl100k_base'
+
+
+@functools.lru_cache(maxsize=None)
+def _get_encoding(name: str = DEFAULT_ENCODING):
+    """tiktoken encoding, or None if tiktoken or its BPE files are unavailable (e.g. offline)"""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(name)
+    except Exception as e:
+        print(f"tiktoken encoding '{name}' unavailable ({e}), estimating tokens from characters")
+        return None
+
+
+@functools.lru_cache(maxsize=None)
+def _model_encoding_name(model_name: Optional[str]) -> Optional[str]:
+    """tiktoken's encoding for a model (e.g. 'gpt-4o' or 'openai/gpt-4.1'), None if it has none"""
+    if not model_name:
+        return None
+    try:
+        import tiktoken
+        return tiktoken.encoding_for_model(model_name.rsplit('/', 1)[-1]).name
+    except Exception:
+        return None
+
+
+def get_encoding(model_name: str = None):
+    """The model's own tiktoken encoding, else DEFAULT_ENCODING, else None"""
+    return _get_encoding(_model_encoding_name(model_name) or DEFAULT_ENCODING)
+
+
+def is_exact(model_name: str = None) -> bool:
+    """Whether counts for this model come from its own tokenizer rather than an approximation"""
+    return _model_encoding_name(model_name) is not None and get_encoding(model_name) is not None
+
+
+def count_tokens(text: str, model_name: str = None) -> int:
+    """Number of tokens in text for a model, estimated from its length without tiktoken"""
+    if not text:
+        return 0
+    encoding = get_encoding(model_name)
+    if encoding is None:
+        return len(text) // CHARS_PER_TOKEN
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, max_tokens: int, model_name: str = None) -> str:
+    """The longest prefix of text of at most max_tokens tokens"""
+    if max_tokens <= 0:
+        return ""
+    encoding = get_encoding(model_name)
+    if encoding is None:
+        return text[:max_tokens * CHARS_PER_TOKEN]
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])
@@ -0,0 +1,324 @@
+"""Sampled request tracing with pluggable exporters"""
+import functools
+import inspect
+import json
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional
+
+from app.config import config
+
+
+class _NoopSpan:
+    """Stand-in for spans of unsampled requests; every operation is a no-op"""
+
+    is_recording = False
+    trace_id = None
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def set_attributes(self, attributes: Dict[str, Any]):
+        pass
+
+    def record_error(self, error: BaseException):
+        pass
+
+    def end(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+# Innermost active span (or unsampled trace) of the current request
+_current: ContextVar = ContextVar('current_span', default=None)
+
+
+class _UnsampledTrace(_NoopSpan):
+    """Root of an unsampled request: carries its trace id and records nothing"""
+
+    __slots__ = ('trace_id', '_token')
+
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self._token = None
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        _current.reset(self._token)
+        return False
+
+
+class _Trace:
+    """Spans finished so far in one sampled request"""
+
+    __slots__ = ('trace_id', 'tracer', 'spans', 'lock')
+
+    def __init__(self, trace_id: str, tracer: "Tracer"):
+        self.trace_id = trace_id
+        self.tracer = tracer
+        self.spans: List["Span"] = []
+        self.lock = threading.Lock()
+
+
+class Span:
+    """A timed operation within a sampled trace"""
+
+    __slots__ = ('trace', 'name', 'span_id', 'parent_id', 'start_ns', 'end_ns', 'attributes', 'error', '_token')
+    is_recording = True
+
+    def __init__(self, trace: _Trace, name: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.trace = trace
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes
+        self.error = None
+        self._token = None
+
+    @property
+    def trace_id(self) -> str:
+        return self.trace.trace_id
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def set_attributes(self, attributes: Dict[str, Any]):
+        self.attributes.update(attributes)
+
+    def record_error(self, error: BaseException):
+        self.error = f"{type(error).__name__}: {error}"
+
+    def end(self):
+        """Finish the span; ending the root span exports the whole trace"""
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        with self.trace.lock:
+            self.trace.spans.append(self)
+        if self.parent_id is None:
+            self.trace.tracer._export(self.trace.spans)
+
+    def __enter__(self) -> "Span":
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc is not None:
+            self.record_error(exc)
+        _current.reset(self._token)
+        self.end()
+        return False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start': self.start_ns / 1e9,
+            'duration_ms': (self.end_ns - self.start_ns) / 1e6,
+            'attributes': self.attributes,
+            'error': self.error,
+        }
+
+
+class NoopExporter:
+    """Drop finished traces"""
+
+    def export(self, spans: List[Span]):
+        pass
+
+
+class JsonLinesExporter:
+    """Append one JSON object per span to a file"""
+
+    def __init__(self, path: str = None):
+        self.path = path or config.TRACE_JSONL_PATH
+        self._lock = threading.Lock()
+
+    def export(self, spans: List[Span]):
+        lines = ''.join(json.dumps(span.to_dict(), default=str) + '\n' for span in spans)
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as file:
+                file.write(lines)
+
+
+class MlflowExporter:
+    """Replay finished traces into MLflow tracing"""
+
+    def __init__(self):
+        from mlflow import MlflowClient
+        self.client = MlflowClient()
+
+    def export(self, spans: List[Span]):
+        ordered = sorted(spans, key=lambda span: span.start_ns)
+        root = next(span for span in ordered if span.parent_id is None)
+        root_span = self.client.start_trace(root.name, attributes=root.attributes, start_time_ns=root.start_ns)
+        request_id = getattr(root_span, 'trace_id', None) or root_span.request_id
+        ids = {root.span_id: root_span.span_id}
+        for span in ordered:
+            if span is not root:
+                ids[span.span_id] = self.client.start_span(
+                    span.name, request_id, ids.get(span.parent_id, root_span.span_id),
+                    attributes=span.attributes, start_time_ns=span.start_ns
+                ).span_id
+        for span in reversed(ordered):
+            if span is not root:
+                self.client.end_span(request_id, ids[span.span_id], status='ERROR' if span.error else 'OK',
+                                     end_time_ns=span.end_ns)
+        self.client.end_trace(request_id, status='ERROR' if root.error else 'OK', end_time_ns=root.end_ns)
+
+
+class OpenTelemetryExporter:
+    """Replay finished traces through the OpenTelemetry API, for whatever SDK is configured"""
+
+    def __init__(self):
+        from opentelemetry import trace as otel_trace
+        from opentelemetry.trace import Status, StatusCode
+        self._otel_trace = otel_trace
+        self._error_status = lambda description: Status(StatusCode.ERROR, description)
+        self.tracer = otel_trace.get_tracer('intelliforge')
+
+    @staticmethod
+    def _attributes(attributes: Dict[str, Any]) -> Dict[str, Any]:
+        # OpenTelemetry only takes primitive attribute values
+        return {key: value if isinstance(value, (str, bool, int, float)) else str(value)
+                for key, value in attributes.items() if value is not None}
+
+    def export(self, spans: List[Span]):
+        ordered = sorted(spans, key=lambda span: span.start_ns)
+        otel_spans = {}
+        for span in ordered:
+            parent = otel_spans.get(span.parent_id)
+            context = self._otel_trace.set_span_in_context(parent) if parent is not None else None
+            otel_span = self.tracer.start_span(span.name, context=context, start_time=span.start_ns,
+                                               attributes=self._attributes(span.attributes))
+            if span.error:
+                otel_span.set_status(self._error_status(span.error))
+            otel_spans[span.span_id] = otel_span
+        for span in reversed(ordered):
+            otel_spans[span.span_id].end(end_time=span.end_ns)
+
+
+EXPORTERS = {
+    'none': NoopExporter,
+    'jsonl': JsonLinesExporter,
+    'mlflow': MlflowExporter,
+    'otel': OpenTelemetryExporter,
+}
+
+
+def create_exporter(name: str):
+    """Create an exporter by name, falling back to none if its package is not installed"""
+    if name not in EXPORTERS:
+        raise ValueError(f"Unsupported trace exporter: {name}. Available exporters: {list(EXPORTERS)}")
+    try:
+        return EXPORTERS[name]()
+    except ImportError as e:
+        print(f"Trace exporter '{name}' is unavailable ({e}), traces will not be exported")
+        return NoopExporter()
+
+
+class Tracer:
+    """
+    Head-sampled tracer
+
+    Whether a request is traced is decided once, when its trace starts. Every
+    request gets a trace id; unsampled ones cost a context variable lookup per
+    span and nothing else. Sampled traces are handed to the exporter on a
+    background thread when their root span ends.
+    """
+
+    def __init__(self, sample_rate: float = 0.0, exporter=None):
+        self.sample_rate = sample_rate
+        self.exporter = exporter or NoopExporter()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='trace-export')
+
+    def configure(self, sample_rate: float = None, exporter=None):
+        """Change the sample rate or exporter at runtime"""
+        if sample_rate is not None:
+            self.sample_rate = sample_rate
+        if exporter is not None:
+            self.exporter = exporter
+
+    def start_trace(self, name: str, **attributes):
+        """
+        Root of a request's trace; use as a context manager
+
+        Returns an unsampled trace (which only carries the trace id) unless the
+        request is sampled.
+        """
+        trace_id = uuid.uuid4().hex
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return _UnsampledTrace(trace_id)
+        return Span(_Trace(trace_id, self), name, None, attributes)
+
+    def span(self, name: str, **attributes):
+        """Child span of the current span; NOOP_SPAN outside sampled traces"""
+        parent = _current.get()
+        if parent is None or not parent.is_recording:
+            return NOOP_SPAN
+        return Span(parent.trace, name, parent.span_id, attributes)
+
+    def start_span(self, name: str, **attributes):
+        """Like span(), for spans ended explicitly with end() (e.g. from callbacks) rather than a with block"""
+        return self.span(name, **attributes)
+
+    def _export(self, spans: List[Span]):
+        self._executor.submit(self._safe_export, list(spans))
+
+    def _safe_export(self, spans: List[Span]):
+        try:
+            self.exporter.export(spans)
+        except Exception as e:
+            print(f"Failed to export trace {spans[0].trace_id}: {e}")
+
+
+def current_span():
+    """The innermost active span, or NOOP_SPAN"""
+    current = _current.get()
+    return current if current is not None and current.is_recording else NOOP_SPAN
+
+
+def current_trace_id() -> Optional[str]:
+    """Trace id of the current request, sampled or not"""
+    current = _current.get()
+    return current.trace_id if current is not None else None
+
+
+def traced(name: str) -> Callable:
+    """Decorator running a function (or coroutine function) in a child span"""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with tracer.span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with tracer.span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# Singleton instance
+tracer = Tracer(config.TRACE_SAMPLE_RATE, create_exporter(config.TRACE_EXPORTER))
+span = tracer.span
@@ -0,0 +1,133 @@
+"""Per-turn latency and token accounting for chat and RAG conversations"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional
+
+from app.utils.metrics import cache_requests, stage_seconds
+from app.utils.tracing import current_trace_id
+
+# Stage histogram label -> persisted column (milliseconds)
+STAGE_COLUMNS = {
+    'index_load': 'index_load_ms',
+    'embedding': 'embedding_ms',
+    'retrieval': 'retrieval_ms',
+    'rerank': 'rerank_ms',
+    'llm_generation': 'llm_ms',
+    'web_search': 'web_search_ms',
+}
+
+_current_turn: ContextVar = ContextVar('current_turn', default=None)
+
+
+class TurnStats:
+    """
+    Latency, token and cache accounting for one chat turn
+
+    Stage durations and cache lookups are picked up from the stage histogram
+    and cache counter while the turn is current (see record_turn), so the
+    timers already in the pipelines feed both the metrics endpoint and the
+    persisted turn. Only observations of the turn's own pipeline count.
+    """
+
+    def __init__(self, pipeline: str):
+        self.pipeline = pipeline
+        self.trace_id = current_trace_id()
+        self.rag_id: Optional[int] = None
+        self.model_type: Optional[str] = None
+        self.model_name: Optional[str] = None
+        self.started = time.perf_counter()
+        self.total_seconds: Optional[float] = None
+        self.ttft_seconds: Optional[float] = None
+        self.stage_seconds: Dict[str, float] = {}
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.tokens_estimated = False
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._lock = threading.Lock()
+
+    def add_stage(self, stage: str, seconds: float):
+        with self._lock:
+            self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + seconds
+
+    def add_tokens(self, prompt_tokens: int, completion_tokens: int, estimated: bool = False):
+        with self._lock:
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            self.tokens_estimated = self.tokens_estimated or estimated
+
+    def mark_first_token(self, at: float):
+        """
+        Record when an LLM call produced its first token (a time.perf_counter() value)
+
+        The last LLM call of a turn is the one producing the answer (RAG turns
+        condense the question first), so later calls overwrite earlier ones.
+        """
+        self.ttft_seconds = at - self.started
+
+    def finish(self):
+        if self.total_seconds is None:
+            self.total_seconds = time.perf_counter() - self.started
+
+    def to_row(self) -> Dict[str, Any]:
+        """Column values for the chat_turn_stats table"""
+        def ms(seconds):
+            return round(seconds * 1000, 3) if seconds is not None else None
+
+        row = {
+            'pipeline': self.pipeline,
+            'rag_id': self.rag_id,
+            'model_type': self.model_type,
+            'model_name': self.model_name,
+            'total_ms': ms(self.total_seconds),
+            'ttft_ms': ms(self.ttft_seconds),
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'tokens_estimated': int(self.tokens_estimated),
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+            'trace_id': self.trace_id,
+        }
+        for stage, column in STAGE_COLUMNS.items():
+            row[column] = ms(self.stage_seconds.get(stage))
+        return row
+
+
+def current_turn() -> Optional[TurnStats]:
+    """The turn being recorded in this context, if any"""
+    return _current_turn.get()
+
+
+@contextmanager
+def record_turn(pipeline: str) -> Iterator[TurnStats]:
+    """Make a new TurnStats current for the duration of a chat turn"""
+    turn = TurnStats(pipeline)
+    token = _current_turn.set(turn)
+    try:
+        yield turn
+    finally:
+        turn.finish()
+        _current_turn.reset(token)
+
+
+def _on_stage(seconds: float, labels: Dict[str, str]):
+    turn = _current_turn.get()
+    if turn is not None and labels['pipeline'] == turn.pipeline:
+        turn.add_stage(labels['stage'], seconds)
+
+
+def _on_cache_request(count: float, labels: Dict[str, str]):
+    turn = _current_turn.get()
+    if turn is None:
+        return
+    with turn._lock:
+        if labels['result'] == 'hit':
+            turn.cache_hits += int(count)
+        else:
+            turn.cache_misses += int(count)
+
+
+stage_seconds.add_listener(_on_stage)
+cache_requests.add_listener(_on_cache_request)
@@ -0,0 +1,74 @@
+"""
+Benchmark opening a Chroma store per query against reusing one client
+
+Builds a persistent Chroma store from synthetic normalized embeddings (no
+embedding model is loaded), then times similarity queries two ways: the old
+load_vectordb behaviour, which constructed Chroma(persist_directory=...) for
+every query, and the shared client from app.utils.chroma_utils.
+
+Usage:
+    python -m benchmarks.bench_chroma_client
+    python -m benchmarks.bench_chroma_client --chunks 50000 --queries 200
+"""
+import argparse
+import statistics
+import tempfile
+import time
+from typing import List
+
+import numpy as np
+from langchain_community.vectorstores import Chroma
+
+from app.utils.chroma_utils import close_chroma_client, get_chroma_store, upsert_pipelined
+
+
+def _percentile(samples: List[float], pct: float) -> float:
+    return float(np.percentile(samples, pct))
+
+
+def _time_queries(open_store, queries: np.ndarray, k: int) -> List[float]:
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        open_store().similarity_search_by_vector(query.tolist(), k=k)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(args.seed)
+    vectors = rng.standard_normal((args.chunks, args.dimension)).astype('float32')
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    queries = vectors[rng.choice(args.chunks, args.queries)]
+
+    with tempfile.TemporaryDirectory() as persist_directory:
+        store = get_chroma_store(persist_directory, None)
+        start = time.perf_counter()
+        batches = upsert_pipelined(store, [str(i) for i in range(args.chunks)],
+                                   [f"chunk {i}" for i in range(args.chunks)], embeddings=vectors.tolist())
+        print(f"Inserted {args.chunks} chunks in {batches} batches in {time.perf_counter() - start:.2f}s")
+
+        results = {
+            "open per query": _time_queries(
+                lambda: Chroma(persist_directory=persist_directory, embedding_function=None), queries, args.k),
+            "reused client": _time_queries(
+                lambda: get_chroma_store(persist_directory, None), queries, args.k),
+        }
+        close_chroma_client(persist_directory)
+
+    print(f"\n{'mode':>15} | {'mean ms':>8} | {'p50 ms':>8} | {'p95 ms':>8} | {'first ms':>8}")
+    for mode, latencies in results.items():
+        print(f"{mode:>15} | {statistics.mean(latencies):8.2f} | {_percentile(latencies, 50):8.2f} | "
+              f"{_percentile(latencies, 95):8.2f} | {latencies[0]:8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+Ingestion throughput across embedding models, chunk sizes and backends
+
+For every combination of embedding model (the search tool's EMBEDDING_MODELS
+keys), chunk size and target, ingests a fixture corpus (benchmarks.fixtures)
+and reports chunks/sec, docs/sec, peak RSS, index size on disk and time to
+first query. Targets:
+
+    searchtool  VectorDatabase.add_documents + save (web search / chat tool store)
+    faiss       VectorDBService.create_vectordb with a FAISS store (RAG projects)
+    chroma      VectorDBService.create_vectordb with a Chroma store
+
+Each case runs in a fresh process so peak RSS is not inflated by models or
+indexes of earlier cases; model load time is reported separately and not
+counted in throughput. Time to first query opens the saved store from disk
+and runs one search with the model already loaded.
+
+Usage:
+    python -m benchmarks.bench_ingestion
+    python -m benchmarks.bench_ingestion --models minilm bge --chunk-sizes 256 512 1024 --docs 500
+    python -m benchmarks.bench_ingestion --targets faiss chroma --output ingestion.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List
+
+from benchmarks.fixtures import make_corpus, make_queries
+
+TARGETS = ("searchtool", "faiss", "chroma")
+
+
+def _dir_size(path: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path) for name in names
+    )
+
+
+def _run_searchtool(model_key: str, chunk_size: int, paths: List[str], query: str, workdir: str) -> Dict:
+    from app.services.searchtool.vector_database import VectorDatabase
+    from app.utils.memory_utils import PeakRSSMonitor
+
+    vector_db = VectorDatabase(embedding_model_key=model_key, chunk_size=chunk_size, enable_rerank=False)
+    start = time.perf_counter()
+    vector_db.load_embedding_model()
+    model_load = time.perf_counter() - start
+
+    texts = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as file:
+            texts.append(file.read())
+    store_path = os.path.join(workdir, "searchtool_store")
+    with PeakRSSMonitor() as monitor:
+        start = time.perf_counter()
+        vector_db.add_documents(texts, [{"source": path} for path in paths])
+        vector_db.save(store_path)
+        seconds = time.perf_counter() - start
+
+    reopened = VectorDatabase(embedding_model_key=model_key, chunk_size=chunk_size, enable_rerank=False)
+    reopened.embedding_model = vector_db.embedding_model
+    reopened.is_embedding_gemma = vector_db.is_embedding_gemma
+    start = time.perf_counter()
+    reopened.load(store_path)
+    reopened.search(query, k=5)
+    first_query = time.perf_counter() - start
+
+    return {
+        "chunks": len(vector_db.documents), "seconds": seconds, "model_load_seconds": model_load,
+        "index_bytes": _dir_size(store_path), "time_to_first_query_seconds": first_query,
+        **monitor.stats(),
+    }
+
+
+def _run_rag(backend: str, model_name: str, chunk_size: int, paths: List[str], query: str, workdir: str) -> Dict:
+    from app.config import config
+    config.EMBEDDING_MODEL_NAME = model_name
+    config.DATABASE_PATH = os.path.join(workdir, "benchmark.db")
+    config.VECTOR_DB_PATH = os.path.join(workdir, "vectorDB")
+
+    from app.repositories.database import init_db
+    from app.services.embedding_service import embedding_service
+    from app.services.vector_db_service import vector_db_service
+    init_db()
+
+    # The singletons keep the model they loaded first; with --in-process an
+    # earlier case's model would otherwise embed this one
+    embedding_service._embedding_model = None
+    start = time.perf_counter()
+    vector_db_service.embedding_model = embedding_service.embedding_model
+    model_load = time.perf_counter() - start
+
+    start = time.perf_counter()
+    vector_db_service.create_vectordb([("text", path) for path in paths], backend, chunk_size, "benchmark")
+    seconds = time.perf_counter() - start
+    stats = vector_db_service.last_build_stats
+
+    start = time.perf_counter()
+    vectorstore = vector_db_service.load_vectordb("benchmark", backend)
+    vectorstore.similarity_search(query, k=5)
+    first_query = time.perf_counter() - start
+
+    return {
+        "chunks": stats["chunks"], "seconds": seconds, "model_load_seconds": model_load,
+        "index_bytes": _dir_size(os.path.join(config.VECTOR_DB_PATH, "benchmark")),
+        "time_to_first_query_seconds": first_query,
+        "start_rss_mb": stats["start_rss_mb"], "peak_rss_mb": stats["peak_rss_mb"],
+        "peak_rss_delta_mb": stats["peak_rss_delta_mb"],
+    }
+
+
+def run_case(target: str, model_key: str, chunk_size: int, paths: List[str], query: str) -> Dict:
+    """Ingest the corpus once; meant to run in its own process"""
+    from app.services.searchtool.vector_database import EMBEDDING_MODELS
+
+    workdir = tempfile.mkdtemp(prefix="ingestion_")
+    try:
+        if target == "searchtool":
+            result = _run_searchtool(model_key, chunk_size, paths, query, workdir)
+        else:
+            result = _run_rag(target, EMBEDDING_MODELS[model_key]["model_name"], chunk_size, paths, query, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    result.update({
+        "target": target, "model": model_key, "chunk_size": chunk_size, "docs": len(paths),
+        "chunks_per_second": result["chunks"] / result["seconds"],
+        "docs_per_second": len(paths) / result["seconds"],
+    })
+    return result
+
+
+def main(argv: List[str] = None):
+    from app.services.searchtool.vector_database import EMBEDDING_MODELS
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--models", nargs="+", choices=list(EMBEDDING_MODELS), default=list(EMBEDDING_MODELS))
+    parser.add_argument("--chunk-sizes", type=int, nargs="+",
+                        help="Chunk sizes in characters (default: each model's recommended chunk_size)")
+    parser.add_argument("--targets", nargs="+", choices=TARGETS, default=list(TARGETS))
+    parser.add_argument("--docs", type=int, default=200)
+    parser.add_argument("--words-per-doc", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--in-process", action="store_true",
+                        help="Run cases in this process (faster, but RSS figures include earlier cases)")
+    parser.add_argument("--output", default="ingestion.json")
+    args = parser.parse_args(argv)
+
+    corpus_dir = tempfile.mkdtemp(prefix="ingestion_corpus_")
+    paths = make_corpus(corpus_dir, args.docs, args.words_per_doc, args.seed)
+    query = make_queries(args.docs, 1, args.seed)[0].text
+
+    results = []
+    print(f"{'target':>10} | {'model':>6} | {'chunk':>5} | {'chunks':>6} | {'chunks/s':>8} | {'docs/s':>7} | "
+          f"{'peak MB':>7} | {'+MB':>6} | {'index MB':>8} | {'1st q ms':>8} | {'load s':>6}")
+    try:
+        for model_key in args.models:
+            for chunk_size in args.chunk_sizes or [EMBEDDING_MODELS[model_key]["chunk_size"]]:
+                for target in args.targets:
+                    if args.in_process:
+                        result = run_case(target, model_key, chunk_size, paths, query)
+                    else:
+                        with ProcessPoolExecutor(max_workers=1,
+                                                 mp_context=multiprocessing.get_context("spawn")) as pool:
+                            result = pool.submit(run_case, target, model_key, chunk_size, paths, query).result()
+                    results.append(result)
+                    print(f"{target:>10} | {model_key:>6} | {chunk_size:>5} | {result['chunks']:>6} | "
+                          f"{result['chunks_per_second']:8.1f} | {result['docs_per_second']:7.2f} | "
+                          f"{result['peak_rss_mb']:7.0f} | {result['peak_rss_delta_mb']:6.0f} | "
+                          f"{result['index_bytes'] / 2 ** 20:8.2f} | "
+                          f"{result['time_to_first_query_seconds'] * 1000:8.1f} | "
+                          f"{result['model_load_seconds']:6.1f}")
+    finally:
+        shutil.rmtree(corpus_dir, ignore_errors=True)
+
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump({
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "settings": vars(args),
+            "results": results,
+        }, file, indent=2)
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
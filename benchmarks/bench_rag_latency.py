@@ -0,0 +1,219 @@
+"""
+End-to-end latency of RAGService.query_rag with deterministic local stand-ins
+
+Builds a fixture corpus (benchmarks.fixtures) into a throwaway database and
+vector store, points the Ollama / GitHub model endpoints at a local fake model
+server (benchmarks.fake_llm_server) and runs chat turns through the same
+calls the chat route makes. Reports p50/p95/p99 per stage:
+
+    index_load         load_vectordb + load_lexical_index
+    condense_question  LLM call rewriting the question from chat history
+    retrieval          dense/hybrid candidate retrieval (excluding rerank)
+    rerank             cross-encoder reranking
+    generation         answer LLM call
+    persistence        add_chat_message (includes naming the session on its first turn)
+    total              whole turn
+
+Results go to a JSON file so runs can be compared.
+
+Usage:
+    python -m benchmarks.bench_rag_latency
+    python -m benchmarks.bench_rag_latency --docs 2000 --queries 200 --backend chroma --output chroma.json
+    python -m benchmarks.bench_rag_latency --model-type GitHub --token-latency 0.03 --response-tokens 200
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List
+
+import numpy as np
+from langchain_core.callbacks import BaseCallbackHandler
+
+from app.config import config
+from benchmarks.fake_llm_server import MODEL_NAME, FakeLLMServer
+from benchmarks.fixtures import make_corpus, make_queries
+
+STAGES = ("index_load", "condense_question", "retrieval", "rerank", "generation", "persistence", "total")
+
+
+class StageTimer(BaseCallbackHandler):
+    """Per-stage durations of one chat turn, from chain callbacks and wrapped service calls"""
+
+    def __init__(self):
+        self.durations: Dict[str, float] = defaultdict(float)
+        self._starts = {}
+        self._chain_inputs = {}
+
+    def reset(self):
+        self.durations = defaultdict(float)
+        self._starts.clear()
+        self._chain_inputs.clear()
+
+    def add(self, stage: str, seconds: float):
+        self.durations[stage] += seconds
+
+    def timed(self, stage: str, func: Callable) -> Callable:
+        """Wrap a function so its run time counts towards a stage"""
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.add(stage, time.perf_counter() - start)
+        return wrapper
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+        self._chain_inputs[run_id] = set(inputs) if isinstance(inputs, dict) else set()
+
+    def _start_llm(self, run_id, parent_run_id):
+        # The answer chain's prompt takes the retrieved context; the condense chain's does not
+        stage = "generation" if "context" in self._chain_inputs.get(parent_run_id, ()) else "condense_question"
+        self._starts[run_id] = (stage, time.perf_counter())
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+        self._start_llm(run_id, parent_run_id)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, **kwargs):
+        self._start_llm(run_id, parent_run_id)
+
+    def _end(self, run_id):
+        if run_id in self._starts:
+            stage, start = self._starts.pop(run_id)
+            self.add(stage, time.perf_counter() - start)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_retriever_start(self, serialized, query, *, run_id, **kwargs):
+        self._starts[run_id] = ("retrieval", time.perf_counter())
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_retriever_error(self, error, *, run_id, **kwargs):
+        self._end(run_id)
+
+
+def _summarize(samples: List[float]) -> Dict:
+    values = np.asarray(samples) * 1000
+    return {
+        "n": len(samples),
+        "mean_ms": float(values.mean()),
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99)),
+    }
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=200)
+    parser.add_argument("--words-per-doc", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=2, help="Turns run before measuring")
+    parser.add_argument("--history-turns", type=int, default=4, help="Chat history sent with each turn")
+    parser.add_argument("--backend", choices=config.SUPPORTED_VECTOR_STORES, default="faiss")
+    parser.add_argument("--index-type", default="flat")
+    parser.add_argument("--chunk-size", type=int, default=config.DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--model-type", choices=["Ollama", "GitHub"], default="Ollama")
+    parser.add_argument("--first-token-latency", type=float, default=0.05, help="Seconds")
+    parser.add_argument("--token-latency", type=float, default=0.01, help="Seconds per token")
+    parser.add_argument("--response-tokens", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="rag_latency.json")
+    parser.add_argument("--keep", action="store_true", help="Keep the work directory")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="rag_latency_")
+    server = FakeLLMServer(first_token_latency=args.first_token_latency, token_latency=args.token_latency,
+                           response_tokens=args.response_tokens).start()
+    config.DATABASE_PATH = os.path.join(workdir, "benchmark.db")
+    config.VECTOR_DB_PATH = os.path.join(workdir, "vectorDB")
+    config.UPLOAD_FOLDER = os.path.join(workdir, "uploads")
+    config.OLLAMA_BASE_URL = server.url
+    config.GITHUB_MODELS_BASE_URL = f"{server.url}/v1"
+
+    # Imported after config points at the work directory and the fake server
+    from app.repositories.database import init_db
+    from app.services.rag_service import rag_service
+    from app.services.reranking_service import reranking_service
+    from app.services.vector_db_service import vector_db_service
+
+    try:
+        init_db()
+        rag_id = rag_service.create_rag("latency benchmark")
+        rag_service.update_model_config(rag_id, args.model_type, MODEL_NAME, "fake-key")
+        rag_service.update_vector_db_config(rag_id, config.EMBEDDING_MODEL_NAME, args.backend, args.chunk_size,
+                                            {"type": args.index_type})
+        for path in make_corpus(os.path.join(workdir, "corpus"), args.docs, args.words_per_doc, args.seed):
+            rag_service.add_document(rag_id, "text", path)
+        rag_service.update_prompt_template(rag_id, "You answer questions about the fixture corpus.")
+
+        print(f"Building {args.backend}/{args.index_type} index over {args.docs} documents...")
+        build_start = time.perf_counter()
+        rag_service.create_vector_database(rag_id)
+        build = {"seconds": time.perf_counter() - build_start, **vector_db_service.last_build_stats}
+
+        timer = StageTimer()
+        vector_db_service.load_vectordb = timer.timed("index_load", vector_db_service.load_vectordb)
+        vector_db_service.load_lexical_index = timer.timed("index_load", vector_db_service.load_lexical_index)
+        reranking_service.rerank_documents = timer.timed("rerank", reranking_service.rerank_documents)
+
+        session_id = rag_service.create_chat_session(rag_id, "benchmark")
+        samples: Dict[str, List[float]] = defaultdict(list)
+        queries = make_queries(args.docs, args.warmup + args.queries, args.seed)
+        for turn, query in enumerate(queries):
+            history = [(message['user_message'], message['bot_response'])
+                       for message in rag_service.get_chat_history(session_id)]
+            history = history[-args.history_turns:] if args.history_turns else []
+
+            timer.reset()
+            start = time.perf_counter()
+            result = rag_service.query_rag(rag_id, query.text, history, callbacks=[timer])
+            persist_start = time.perf_counter()
+            rag_service.add_chat_message(session_id, query.text, result['answer'], rag_id,
+                                         turn_stats=result['turn_stats'])
+            timer.add("persistence", time.perf_counter() - persist_start)
+            timer.add("total", time.perf_counter() - start)
+            # The retriever run includes the reranker call
+            timer.durations["retrieval"] -= timer.durations.get("rerank", 0.0)
+
+            if turn >= args.warmup:
+                for stage, seconds in timer.durations.items():
+                    samples[stage].append(seconds)
+
+        stages = {stage: _summarize(samples[stage]) for stage in STAGES if samples.get(stage)}
+        results = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "settings": vars(args),
+            "embedding_model": config.EMBEDDING_MODEL_NAME,
+            "build": build,
+            "stages": stages,
+            "llm_requests": server.requests,
+        }
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+
+        print(f"\nBuilt in {build['seconds']:.1f}s, peak RSS {build.get('peak_rss_mb', 0):.0f} MB")
+        print(f"\n{'stage':>18} | {'n':>5} | {'mean ms':>9} | {'p50 ms':>9} | {'p95 ms':>9} | {'p99 ms':>9}")
+        for stage, summary in stages.items():
+            print(f"{stage:>18} | {summary['n']:5d} | {summary['mean_ms']:9.2f} | {summary['p50_ms']:9.2f} | "
+                  f"{summary['p95_ms']:9.2f} | {summary['p99_ms']:9.2f}")
+        print(f"\nResults written to {args.output}")
+    finally:
+        server.stop()
+        if args.keep:
+            print(f"Work directory kept at {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+"""
+Recall versus latency of index settings and rerank depth
+
+Runs the labeled fixture queries (benchmarks.fixtures) through both retrieval
+paths and reports recall@k, MRR and per-query latency for every setting:
+
+    rag         RerankingRetriever over a FAISS store built by
+                VectorDBService.create_vectordb: flat, HNSW (hnsw_m x ef_search)
+                and IVF (nprobe) indexes, each with reranking off and with
+                top_k_retrieval / rerank_candidates set to every --depths value
+    searchtool  VectorDatabase.search: exact, HNSW (HNSW_M x efSearch) and IVF
+                (nprobe) indexes, with reranking off and with every
+                --multipliers value as initial_k_multiplier
+
+A chunk is relevant when it comes from the document the query was built for,
+so recall@k is the share of queries with a relevant chunk in the top k and
+MRR averages 1 / rank of the first one. Settings not beaten on both recall@k
+(largest k) and p95 latency by another setting of the same target are marked
+as the Pareto frontier. Embeddings are computed once per target; index
+variants are rebuilt from the stored vectors.
+
+Usage:
+    python -m benchmarks.bench_retrieval_recall
+    python -m benchmarks.bench_retrieval_recall --docs 2000 --queries 200 --depths 10 20 40
+    python -m benchmarks.bench_retrieval_recall --targets searchtool --model-key minilm --ef-search 16 64 256
+"""
+import argparse
+import copy
+import json
+import os
+import shutil
+import tempfile
+import time
+from typing import Callable, Dict, List, Sequence
+
+import numpy as np
+
+from app.config import config
+from benchmarks.fixtures import LabeledQuery, make_corpus, make_queries
+
+TARGETS = ("rag", "searchtool")
+
+
+def evaluate(search: Callable[[str], List[set]], queries: Sequence[LabeledQuery], ks: Sequence[int]) -> Dict:
+    """
+    Run every query and score the ranked results
+
+    Args:
+        search: Returns, per ranked result, the set of documents the chunk comes from
+        queries: Labeled queries
+        ks: Cut-offs for recall@k
+    """
+    latencies = []
+    hits = {k: 0 for k in ks}
+    reciprocal_ranks = []
+    for query in queries:
+        start = time.perf_counter()
+        ranked = search(query.text)
+        latencies.append(time.perf_counter() - start)
+        rank = next((position for position, docs in enumerate(ranked, 1) if query.doc_index in docs), None)
+        reciprocal_ranks.append(1.0 / rank if rank else 0.0)
+        for k in ks:
+            hits[k] += bool(rank and rank <= k)
+    latencies = np.asarray(latencies) * 1000
+    return {
+        **{f"recall@{k}": hits[k] / len(queries) for k in ks},
+        "mrr": float(np.mean(reciprocal_ranks)),
+        "mean_ms": float(latencies.mean()),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+    }
+
+
+def mark_pareto(results: List[Dict], recall_key: str):
+    """Flag results that no other result of the same target beats on both recall and p95 latency"""
+    for result in results:
+        result["pareto"] = not any(
+            other is not result and other["target"] == result["target"]
+            and other[recall_key] >= result[recall_key] and other["p95_ms"] <= result["p95_ms"]
+            and (other[recall_key] > result[recall_key] or other["p95_ms"] < result["p95_ms"])
+            for other in results
+        )
+
+
+def run_rag(args, paths: List[str], queries: List[LabeledQuery], ks: List[int]) -> List[Dict]:
+    """RerankingRetriever over FAISS stores built the way RAG projects build them"""
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    from app.services.retriever_service import RerankingRetriever
+    from app.services.vector_db_service import vector_db_service
+    from app.utils.index_utils import apply_search_params, build_faiss_index
+
+    documents = [("text", path) for path in paths]
+    flat_store = vector_db_service.create_vectordb(documents, "faiss", args.chunk_size, "recall")
+    lexical_index = vector_db_service.load_lexical_index("recall") if args.hybrid else None
+
+    # Same chunks as the build, to map each one back to its documents
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=args.chunk_size,
+                                                   chunk_overlap=config.DEFAULT_CHUNK_OVERLAP)
+    doc_index = {path: position for position, path in enumerate(paths)}
+    chunk_docs: Dict[str, set] = {}
+    for batch_paths, batch_texts in vector_db_service._iter_chunk_batches(documents, text_splitter,
+                                                                          config.INGEST_BATCH_SIZE, {'pages': 0}):
+        for path, text in zip(batch_paths, batch_texts):
+            chunk_docs.setdefault(text, set()).add(doc_index[path])
+    vectors = flat_store.index.reconstruct_n(0, flat_store.index.ntotal)
+
+    index_settings = [({"type": "flat"}, [{}])]
+    for hnsw_m in args.hnsw_m:
+        index_settings.append(({"type": "hnsw", "hnsw_m": hnsw_m},
+                               [{"ef_search": ef_search} for ef_search in args.ef_search]))
+    index_settings.append(({"type": "ivf"}, [{"nprobe": nprobe} for nprobe in args.nprobe]))
+
+    results = []
+    for build_spec, search_params in index_settings:
+        index = build_faiss_index(build_spec, vectors) if build_spec["type"] != "flat" else flat_store.index
+        store = copy.copy(flat_store)
+        store.index = index
+        for params in search_params:
+            apply_search_params(index, {**build_spec, **params})
+            setting = ",".join(f"{key}={value}" for key, value in {**build_spec, **params}.items()
+                               if key != "type")
+            for depth in [None] + args.depths:
+                retriever = RerankingRetriever(
+                    base_retriever=store.as_retriever(),
+                    top_k_retrieval=depth or args.k,
+                    top_k_reranked=args.k,
+                    enable_reranking=depth is not None,
+                    lexical_index=lexical_index,
+                    rerank_candidates=depth
+                )
+
+                def search(text: str) -> List[set]:
+                    return [chunk_docs.get(doc.page_content, set()) for doc in retriever.invoke(text)]
+
+                result = {"target": "rag", "index": build_spec["type"], "setting": setting,
+                          "rerank_depth": depth or 0, **evaluate(search, queries, ks)}
+                results.append(result)
+                _print_row(result, ks)
+    return results
+
+
+def run_searchtool(args, paths: List[str], queries: List[LabeledQuery], ks: List[int]) -> List[Dict]:
+    """VectorDatabase.search over each index structure the search tool can pick"""
+    from app.services.searchtool import vector_database
+    from app.services.searchtool.vector_database import VectorDatabase
+
+    vector_db = VectorDatabase(embedding_model_key=args.model_key, chunk_size=args.chunk_size,
+                               enable_rerank=True, index_type="exact")
+    texts = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as file:
+            texts.append(file.read())
+    vector_db.add_documents(texts, [{"doc_index": position} for position in range(len(paths))])
+    exact_vectors = vector_db.vectors
+
+    index_settings = [("exact", None, [{}])]
+    for hnsw_m in args.hnsw_m:
+        index_settings.append(("hnsw", hnsw_m, [{"ef_search": ef_search} for ef_search in args.ef_search]))
+    index_settings.append(("ivf", None, [{"nprobe": nprobe} for nprobe in args.nprobe]))
+
+    default_hnsw_m = vector_database.HNSW_M
+    results = []
+    try:
+        for index_type, hnsw_m, search_params in index_settings:
+            vector_db.index, vector_db.vectors, vector_db.active_index_type = None, exact_vectors, "exact"
+            if index_type != "exact":
+                vector_database.HNSW_M = hnsw_m or default_hnsw_m
+                vector_db._build_ann_index(exact_vectors, index_type)
+            for params in search_params:
+                if "ef_search" in params:
+                    vector_db.index.hnsw.efSearch = params["ef_search"]
+                if "nprobe" in params:
+                    vector_db.index.nprobe = params["nprobe"]
+                setting = ",".join(f"{key}={value}" for key, value in
+                                   {**({"hnsw_m": hnsw_m} if hnsw_m else {}), **params}.items())
+                for multiplier in [None] + args.multipliers:
+
+                    def search(text: str) -> List[set]:
+                        _, metadata, _ = vector_db.search(text, k=args.k, rerank=multiplier is not None,
+                                                          initial_k_multiplier=multiplier or 1,
+                                                          score_threshold=args.score_threshold)
+                        return [{meta.get("doc_index")} for meta in metadata]
+
+                    result = {"target": "searchtool", "index": index_type, "setting": setting,
+                              "rerank_depth": args.k * multiplier if multiplier else 0,
+                              **evaluate(search, queries, ks)}
+                    results.append(result)
+                    _print_row(result, ks)
+    finally:
+        vector_database.HNSW_M = default_hnsw_m
+    return results
+
+
+def _print_header(ks: List[int]):
+    print(f"\n{'target':>10} | {'index':>5} | {'setting':>20} | {'depth':>5} | "
+          + " | ".join(f"{'R@' + str(k):>6}" for k in ks) + f" | {'MRR':>6} | {'p50 ms':>8} | {'p95 ms':>8}")
+
+
+def _print_row(result: Dict, ks: List[int]):
+    marker = " *" if result.get("pareto") else ""
+    print(f"{result['target']:>10} | {result['index']:>5} | {result['setting'] or '-':>20} | "
+          f"{result['rerank_depth']:>5} | " + " | ".join(f"{result[f'recall@{k}']:6.3f}" for k in ks)
+          + f" | {result['mrr']:6.3f} | {result['p50_ms']:8.2f} | {result['p95_ms']:8.2f}{marker}")
+
+
+def main(argv: List[str] = None):
+    from app.services.searchtool.vector_database import EMBEDDING_MODELS, DEFAULT_EMBEDDING_MODEL_KEY
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--targets", nargs="+", choices=TARGETS, default=list(TARGETS))
+    parser.add_argument("--docs", type=int, default=500)
+    parser.add_argument("--words-per-doc", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunk-size", type=int, default=config.DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--k", type=int, default=config.DEFAULT_TOP_K_RERANKED, help="Results returned per query")
+    parser.add_argument("--hnsw-m", type=int, nargs="+", default=[16, 32])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[16, 32, 64, 128])
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--depths", type=int, nargs="+", default=[10, 20, 40],
+                        help="RerankingRetriever top_k_retrieval / rerank_candidates values")
+    parser.add_argument("--multipliers", type=int, nargs="+", default=[2, 3, 5],
+                        help="VectorDatabase.search initial_k_multiplier values")
+    parser.add_argument("--hybrid", action=argparse.BooleanOptionalAction, default=config.ENABLE_HYBRID_RETRIEVAL,
+                        help="Fuse BM25 results in the rag target")
+    parser.add_argument("--model-key", choices=list(EMBEDDING_MODELS), default=DEFAULT_EMBEDDING_MODEL_KEY,
+                        help="Embedding model of the searchtool target")
+    parser.add_argument("--score-threshold", type=float, default=0.3,
+                        help="VectorDatabase.search score_threshold")
+    parser.add_argument("--output", default="retrieval_recall.json")
+    args = parser.parse_args(argv)
+
+    ks = sorted({1, min(3, args.k), args.k})
+    workdir = tempfile.mkdtemp(prefix="retrieval_recall_")
+    config.VECTOR_DB_PATH = os.path.join(workdir, "vectorDB")
+    try:
+        paths = make_corpus(os.path.join(workdir, "corpus"), args.docs, args.words_per_doc, args.seed)
+        queries = make_queries(args.docs, args.queries, args.seed)
+
+        results = []
+        _print_header(ks)
+        if "rag" in args.targets:
+            results.extend(run_rag(args, paths, queries, ks))
+        if "searchtool" in args.targets:
+            results.extend(run_searchtool(args, paths, queries, ks))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    recall_key = f"recall@{args.k}"
+    mark_pareto(results, recall_key)
+    print(f"\nPareto frontier ({recall_key} vs p95 latency, per target):")
+    _print_header(ks)
+    for result in sorted((r for r in results if r["pareto"]), key=lambda r: (r["target"], r["p95_ms"])):
+        _print_row(result, ks)
+
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump({
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "settings": vars(args),
+            "embedding_model": config.EMBEDDING_MODEL_NAME,
+            "results": results,
+        }, file, indent=2)
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Benchmark exact vs. approximate index structures for the search tool's VectorDatabase
+
+Measures build time and per-query latency over synthetic normalized embeddings
+for each corpus size, then reports where HNSW/IVF start paying for their build
+cost. The "ephemeral" column models the web search case: one build followed by
+a handful of queries before the corpus is thrown away.
+
+Usage:
+    python -m benchmarks.bench_vector_index
+    python -m benchmarks.bench_vector_index --sizes 50 500 5000 50000 --queries 5
+"""
+import argparse
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from app.services.searchtool.vector_database import VectorDatabase, DEFAULT_TOP_K
+
+
+def _random_unit_vectors(count: int, dimension: int, rng: np.random.Generator) -> np.ndarray:
+    vectors = rng.standard_normal((count, dimension)).astype('float32')
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def run_case(index_type: str, vectors: np.ndarray, queries: np.ndarray, k: int) -> Dict:
+    """Build one index over the vectors and time it"""
+    # Train IVF on the whole corpus, which arrives in a single batch here
+    vector_db = VectorDatabase(embedding_model_key="minilm", dimension=vectors.shape[1],
+                               index_type=index_type, ivf_training_vectors=len(vectors))
+    vector_db.initialize()
+
+    build_start = time.perf_counter()
+    vector_db._add_vectors(vectors)
+    build_time = time.perf_counter() - build_start
+
+    query_start = time.perf_counter()
+    for query in queries:
+        vector_db._search_vectors(query[None, :], k)
+    query_time = (time.perf_counter() - query_start) / len(queries)
+
+    return {"build_ms": build_time * 1000, "query_ms": query_time * 1000}
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[25, 100, 500, 2000, 10000, 20000, 50000, 100000])
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=5,
+                        help="Queries per corpus (web search issues one or a few)")
+    parser.add_argument("--k", type=int, default=DEFAULT_TOP_K * 3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(args.seed)
+    queries = _random_unit_vectors(args.queries, args.dimension, rng)
+    index_types = ["exact", "hnsw", "ivf"]
+
+    print(f"{'vectors':>8} | " + " | ".join(
+        f"{t:>5} build/query/ephemeral ms" for t in index_types))
+    crossover = None
+    for size in args.sizes:
+        vectors = _random_unit_vectors(size, args.dimension, rng)
+        totals = {}
+        cells = []
+        for index_type in index_types:
+            result = run_case(index_type, vectors, queries, args.k)
+            totals[index_type] = result["build_ms"] + result["query_ms"] * args.queries
+            cells.append(f"{result['build_ms']:9.2f}/{result['query_ms']:7.3f}/{totals[index_type]:9.2f}")
+        print(f"{size:>8} | " + " | ".join(f"{c:>31}" for c in cells))
+
+        if crossover is None and min(totals["hnsw"], totals["ivf"]) < totals["exact"]:
+            crossover = size
+
+    if crossover is None:
+        print("\nExact search was fastest at every size tested")
+    else:
+        print(f"\nApproximate indexes first beat exact search at {crossover} vectors "
+              f"({args.queries} queries per corpus)")
+
+
+if __name__ == "__main__":
+    main()
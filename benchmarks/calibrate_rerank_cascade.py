@@ -0,0 +1,84 @@
+"""
+Calibrate the rerank cascade's early-exit thresholds for an embedding model
+
+Indexes a corpus of text files with the search tool's VectorDatabase, then for
+every calibration query compares the dense top-k with the fully reranked top-k.
+The skip margin is the smallest dense margin (top hit minus k-th hit) at which
+skipped queries still agree with the reranker at the target rate; copy it into
+SKIP_MARGINS in app/services/searchtool/rerank_cascade.py.
+
+Usage:
+    python -m benchmarks.calibrate_rerank_cascade --corpus docs/ --queries queries.txt
+    python -m benchmarks.calibrate_rerank_cascade --corpus docs/ --queries queries.txt --model minilm --k 5
+"""
+import argparse
+import time
+from pathlib import Path
+from typing import List
+
+from app.services.searchtool.rerank_cascade import RerankCascade, calibrate_skip_margin
+from app.services.searchtool.vector_database import EMBEDDING_MODELS, VectorDatabase
+
+
+def _load_corpus(corpus_dir: Path) -> List[str]:
+    return [
+        path.read_text(encoding="utf-8", errors="ignore")
+        for path in sorted(corpus_dir.rglob("*"))
+        if path.is_file() and path.suffix in (".txt", ".md")
+    ]
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", type=Path, required=True, help="Directory of .txt/.md files")
+    parser.add_argument("--queries", type=Path, required=True, help="File with one query per line")
+    parser.add_argument("--model", choices=list(EMBEDDING_MODELS), default="minilm")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--initial-k-multiplier", type=int, default=3)
+    parser.add_argument("--target-agreement", type=float, default=0.95)
+    args = parser.parse_args(argv)
+
+    queries = [line.strip() for line in args.queries.read_text(encoding="utf-8").splitlines() if line.strip()]
+    vector_db = VectorDatabase(embedding_model_key=args.model, rerank_early_exit=False)
+    vector_db.initialize()
+    vector_db.add_documents(_load_corpus(args.corpus))
+
+    dense = vector_db.search_many(queries, args.k * args.initial_k_multiplier, rerank=False, score_threshold=-1.0)
+    start = time.perf_counter()
+    reranked = vector_db.search_many(queries, args.k, rerank=True,
+                                     initial_k_multiplier=args.initial_k_multiplier, score_threshold=-1.0)
+    full_rerank_seconds = time.perf_counter() - start
+
+    margins = []
+    agreements = []
+    for (dense_docs, _, dense_scores), (reranked_docs, _, _) in zip(dense, reranked):
+        if len(dense_scores) < args.k:
+            continue
+        margins.append(dense_scores[0] - dense_scores[args.k - 1])
+        agreements.append(set(dense_docs[:args.k]) == set(reranked_docs))
+
+    skip_margin = calibrate_skip_margin(margins, agreements, args.target_agreement)
+    model_name = EMBEDDING_MODELS[args.model]["model_name"]
+    print(f"{len(margins)} calibration queries, dense/rerank top-{args.k} agreement "
+          f"{sum(agreements) / max(len(agreements), 1):.1%}")
+    if skip_margin is None:
+        print(f"No margin reaches {args.target_agreement:.0%} agreement; leave early exit off for {model_name}")
+        return
+
+    vector_db.rerank_cascade = RerankCascade.for_models(model_name, vector_db.rerank_model_name)
+    vector_db.rerank_cascade.skip_margin = skip_margin
+    start = time.perf_counter()
+    vector_db.search_many(queries, args.k, rerank=True,
+                          initial_k_multiplier=args.initial_k_multiplier, score_threshold=-1.0)
+    cascade_seconds = time.perf_counter() - start
+    stats = vector_db.rerank_cascade.get_stats()
+
+    print(f'Calibrated skip margin for "{model_name}": {skip_margin:.4f}')
+    print(f"Skip rate {stats['skip_rate']:.1%}, first batch only {stats['first_batch_only']}, "
+          f"full rerank {stats['full_rerank']}")
+    print(f"Search time {full_rerank_seconds:.2f}s full rerank vs {cascade_seconds:.2f}s cascade "
+          f"({stats['pairs_saved']} cross-encoder pairs saved)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+Local stand-in for Ollama and OpenAI-compatible chat model servers
+
+Answers every chat request with the same deterministic text after a fixed
+first-token delay plus a per-token delay, so benchmarks measure the app and
+not a model or the network. Speaks:
+
+    Ollama:  GET /api/tags, GET /api/version, POST /api/chat, POST /api/generate
+    OpenAI:  GET /v1/models, POST /v1/chat/completions (plain and SSE streaming)
+
+Usage:
+    python -m benchmarks.fake_llm_server --port 11434 --token-latency 0.02
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List
+
+MODEL_NAME = "fake-model"
+WORDS = ("the service reads the index then ranks the chunks and answers from the "
+         "retrieved context of the documentation").split()
+
+
+class FakeLLMServer:
+    """Threaded fake model server; use as a context manager or call start()/stop()"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, first_token_latency: float = 0.05,
+                 token_latency: float = 0.01, response_tokens: int = 64):
+        self.first_token_latency = first_token_latency
+        self.token_latency = token_latency
+        self.response_tokens = response_tokens
+        self.requests = 0
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def tokens(self) -> Iterator[str]:
+        """Response tokens, paced like a model generating them"""
+        time.sleep(self.first_token_latency)
+        for position in range(self.response_tokens):
+            if position:
+                time.sleep(self.token_latency)
+            yield WORDS[position % len(WORDS)] + " "
+
+    def start(self) -> "FakeLLMServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeLLMServer":
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _json(self, body: Dict, status: int = 200):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _start_chunked(self, content_type: str):
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+
+            def _chunk(self, data: bytes):
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+            def _end_chunked(self):
+                self.wfile.write(b"0\r\n\r\n")
+
+            def _read_body(self) -> Dict:
+                length = int(self.headers.get("Content-Length") or 0)
+                return json.loads(self.rfile.read(length) or b"{}")
+
+            def do_GET(self):
+                if self.path == "/api/tags":
+                    self._json({"models": [{"name": MODEL_NAME, "model": MODEL_NAME}]})
+                elif self.path == "/api/version":
+                    self._json({"version": "0.0.0-fake"})
+                elif self.path.endswith("/models"):
+                    self._json({"object": "list", "data": [{"id": MODEL_NAME, "object": "model"}]})
+                else:
+                    self._json({"error": "not found"}, 404)
+
+            def do_POST(self):
+                fake.requests += 1
+                body = self._read_body()
+                if self.path in ("/api/chat", "/api/generate"):
+                    self._ollama(body, chat=self.path == "/api/chat")
+                elif self.path.endswith("/chat/completions"):
+                    self._openai(body)
+                else:
+                    self._json({"error": "not found"}, 404)
+
+            def _ollama(self, body: Dict, chat: bool):
+                model = body.get("model", MODEL_NAME)
+
+                def message(text: str, done: bool) -> Dict:
+                    payload = {"model": model, "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ"), "done": done}
+                    if chat:
+                        payload["message"] = {"role": "assistant", "content": text}
+                    else:
+                        payload["response"] = text
+                    if done:
+                        payload.update({"done_reason": "stop", "prompt_eval_count": 0,
+                                        "eval_count": fake.response_tokens})
+                    return payload
+
+                if body.get("stream", True):
+                    self._start_chunked("application/x-ndjson")
+                    for token in fake.tokens():
+                        self._chunk(json.dumps(message(token, False)).encode() + b"\n")
+                    self._chunk(json.dumps(message("", True)).encode() + b"\n")
+                    self._end_chunked()
+                else:
+                    self._json(message("".join(fake.tokens()), True))
+
+            def _openai(self, body: Dict):
+                model = body.get("model", MODEL_NAME)
+                created = int(time.time())
+                usage = {"prompt_tokens": 0, "completion_tokens": fake.response_tokens,
+                         "total_tokens": fake.response_tokens}
+                if body.get("stream"):
+                    self._start_chunked("text/event-stream")
+
+                    def event(delta: Dict, finish_reason=None) -> bytes:
+                        payload = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": created,
+                                   "model": model,
+                                   "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+                        return f"data: {json.dumps(payload)}\n\n".encode()
+
+                    self._chunk(event({"role": "assistant", "content": ""}))
+                    for token in fake.tokens():
+                        self._chunk(event({"content": token}))
+                    self._chunk(event({}, "stop"))
+                    self._chunk(b"data: [DONE]\n\n")
+                    self._end_chunked()
+                else:
+                    self._json({
+                        "id": "chatcmpl-fake", "object": "chat.completion", "created": created, "model": model,
+                        "choices": [{"index": 0, "finish_reason": "stop",
+                                     "message": {"role": "assistant", "content": "".join(fake.tokens())}}],
+                        "usage": usage,
+                    })
+
+        return Handler
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--first-token-latency", type=float, default=0.05, help="Seconds")
+    parser.add_argument("--token-latency", type=float, default=0.01, help="Seconds per token")
+    parser.add_argument("--response-tokens", type=int, default=64)
+    args = parser.parse_args(argv)
+
+    server = FakeLLMServer(args.host, args.port, args.first_token_latency, args.token_latency,
+                           args.response_tokens)
+    print(f"Fake model server on {server.url} (Ollama: {server.url}, OpenAI: {server.url}/v1)")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
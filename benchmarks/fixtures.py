@@ -0,0 +1,77 @@
+"""
+Deterministic fixture corpora and labeled queries for benchmarks
+
+Every document is about one topic, named by a handful of pseudo-words that
+appear nowhere else, padded with sentences over a shared technical
+vocabulary. A query built from a topic's words has that document as its
+single relevant answer, which gives retrieval benchmarks a labeled set
+without shipping data files.
+"""
+import os
+import random
+from dataclasses import dataclass
+from typing import List
+
+COMMON_WORDS = (
+    "request response cache index vector query latency throughput service client server "
+    "module function config token model embedding chunk document retrieval ranking batch "
+    "thread process memory disk network timeout retry schema table column record session "
+    "stream buffer queue worker pool handler route template prompt context answer score"
+).split()
+SYLLABLES = "ka lo mi nu pe ra si to vu xe zo bi da fe gu hi jo ly".split()
+TOPIC_WORDS = 4  # Pseudo-words naming each topic
+
+
+@dataclass
+class LabeledQuery:
+    """A query and the index of the document that answers it"""
+    text: str
+    doc_index: int
+
+
+def topic_words(doc_index: int, seed: int = 0) -> List[str]:
+    """The pseudo-words unique to one document"""
+    rng = random.Random(f"{seed}-topic-{doc_index}")
+    return [
+        "".join(rng.choice(SYLLABLES) for _ in range(3)) + str(doc_index * TOPIC_WORDS + word)
+        for word in range(TOPIC_WORDS)
+    ]
+
+
+def make_document(doc_index: int, words: int, seed: int = 0) -> str:
+    """Text of one fixture document, roughly `words` words in paragraphs of five sentences"""
+    rng = random.Random(f"{seed}-doc-{doc_index}")
+    topic = topic_words(doc_index, seed)
+    sentences = []
+    written = 0
+    while written < words:
+        sentence = rng.sample(COMMON_WORDS, 10)
+        sentence[rng.randrange(10)] = rng.choice(topic)
+        sentences.append(" ".join(sentence).capitalize() + ".")
+        written += len(sentence)
+    paragraphs = [" ".join(sentences[start:start + 5]) for start in range(0, len(sentences), 5)]
+    return f"{' '.join(topic)}\n\n" + "\n\n".join(paragraphs)
+
+
+def make_corpus(directory: str, docs: int, words_per_doc: int = 500, seed: int = 0) -> List[str]:
+    """Write a fixture corpus as text files and return their paths"""
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for doc_index in range(docs):
+        path = os.path.join(directory, f"doc_{doc_index:05d}.txt")
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(make_document(doc_index, words_per_doc, seed))
+        paths.append(path)
+    return paths
+
+
+def make_queries(docs: int, count: int, seed: int = 0) -> List[LabeledQuery]:
+    """Queries naming two words of a random document's topic, labeled with that document"""
+    rng = random.Random(f"{seed}-queries")
+    queries = []
+    for _ in range(count):
+        doc_index = rng.randrange(docs)
+        first, second = rng.sample(topic_words(doc_index, seed), 2)
+        filler = rng.sample(COMMON_WORDS, 2)
+        queries.append(LabeledQuery(f"How does {first} handle {filler[0]} {filler[1]} with {second}?", doc_index))
+    return queries
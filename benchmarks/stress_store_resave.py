@@ -0,0 +1,81 @@
+"""
+Check that a memory-mapped search tool store can be saved over itself
+
+Builds a VectorDatabase from a fixture corpus, saves it, loads it back with
+mmap=True and saves it again into the same directory while its documents,
+metadata and index are still mapped from there. The store is then loaded once
+more and compared with the original: same documents, same metadata and the
+same search results. Runs with an exact matrix and with an HNSW index, which
+are written to different files.
+
+Usage:
+    python -m benchmarks.stress_store_resave
+    python -m benchmarks.stress_store_resave --docs 200 --model bge
+"""
+import argparse
+import sys
+import tempfile
+from typing import List
+
+from app.services.searchtool.vector_database import VectorDatabase
+from benchmarks.fixtures import make_document, make_queries
+
+INDEX_TYPES = ("exact", "hnsw")
+
+
+def _open(path: str, model_key: str, like: VectorDatabase) -> VectorDatabase:
+    """Load a saved store with mmap=True, sharing the already loaded embedding model"""
+    store = VectorDatabase(embedding_model_key=model_key, enable_rerank=False)
+    store.load(path, mmap=True)
+    store.embedding_model = like.embedding_model
+    store.is_embedding_gemma = like.is_embedding_gemma
+    return store
+
+
+def run_case(index_type: str, model_key: str, docs: int, queries: List[str]) -> List[str]:
+    """Problems found for one index type; empty when the resaved store matches"""
+    vector_db = VectorDatabase(embedding_model_key=model_key, enable_rerank=False, index_type=index_type)
+    texts = [make_document(doc_index, 300) for doc_index in range(docs)]
+    vector_db.add_documents(texts, [{"source": f"doc-{doc_index}"} for doc_index in range(docs)])
+
+    problems = []
+    with tempfile.TemporaryDirectory(prefix="store-resave-") as path:
+        vector_db.save(path)
+        mapped = _open(path, model_key, vector_db)
+        # Rewrites the files mapped reads are served from
+        mapped.save(path)
+        reopened = _open(path, model_key, vector_db)
+
+        if list(reopened.documents) != list(vector_db.documents):
+            problems.append("documents differ")
+        if list(reopened.metadata) != list(vector_db.metadata):
+            problems.append("metadata differ")
+        for query in queries:
+            expected = vector_db.search(query, k=5, rerank=False, score_threshold=-1.0)
+            found = reopened.search(query, k=5, rerank=False, score_threshold=-1.0)
+            if found[0] != expected[0]:
+                problems.append(f"results differ for {query!r}")
+    return problems
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=50)
+    parser.add_argument("--queries", type=int, default=10)
+    parser.add_argument("--model", default="minilm")
+    args = parser.parse_args(argv)
+
+    queries = [query.text for query in make_queries(args.docs, args.queries)]
+    failed = False
+    for index_type in INDEX_TYPES:
+        problems = run_case(index_type, args.model, args.docs, queries)
+        print(f"{index_type}: {'ok' if not problems else f'{len(problems)} problems'}")
+        for problem in problems[:10]:
+            print(f"  {problem}")
+        failed = failed or bool(problems)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
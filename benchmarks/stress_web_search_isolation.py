@@ -0,0 +1,102 @@
+"""
+Stress test for request isolation in the web search tool
+
+Runs many web-search turns concurrently against one shared WebSearch (as the
+web_search_service singleton does) and checks that every turn only ever sees
+the pages it stored itself. Crawling is replaced by synthetic pages so the run
+is offline; embedding, indexing, retrieval and reranking are the real code paths.
+
+Each request stores pages about its own made-up topic, tagged with a
+request-specific source URL, then searches for that topic. Any returned chunk
+whose source belongs to a different request is cross-talk.
+
+Usage:
+    python -m benchmarks.stress_web_search_isolation
+    python -m benchmarks.stress_web_search_isolation --requests 64 --workers 16 --no-rerank
+"""
+import argparse
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from typing import List
+
+from app.services.searchtool.web_search import WebSearch
+
+TOPICS = [
+    "volcanic soil chemistry", "medieval bookbinding", "tidal power turbines",
+    "sourdough fermentation", "orbital debris tracking", "coral reef bleaching",
+    "baroque harpsichord tuning", "desert irrigation canals", "glacier ice cores",
+    "urban beekeeping", "railway signalling", "antique clock repair",
+]
+
+
+class _Markdown(str):
+    """Stand-in for crawl4ai's string-compatible markdown result"""
+
+    @property
+    def fit_markdown(self) -> str:
+        return str(self)
+
+
+def _fake_crawl_results(request_id: int, topic: str, pages: int) -> List[SimpleNamespace]:
+    results = []
+    for page in range(pages):
+        text = " ".join(
+            f"Section {i} of page {page} explains {topic} in detail for request {request_id}."
+            for i in range(20)
+        )
+        results.append(SimpleNamespace(
+            url=f"https://request-{request_id}.example/{page}",
+            title=f"{topic} #{page}",
+            markdown=_Markdown(text),
+        ))
+    return results
+
+
+def run_request(web_search: WebSearch, request_id: int, pages: int, rerank: bool) -> dict:
+    """One simulated web-search turn on a request-scoped store"""
+    topic = TOPICS[request_id % len(TOPICS)]
+    own_prefix = f"https://request-{request_id}.example/"
+
+    vector_db = web_search.new_store()
+    web_search.process_and_store(_fake_crawl_results(request_id, topic, pages), vector_db)
+    _, metadata, _ = vector_db.search(topic, k=5, rerank=rerank, score_threshold=-1.0)
+
+    foreign = [meta["source"] for meta in metadata if not meta["source"].startswith(own_prefix)]
+    return {"request_id": request_id, "results": len(metadata), "foreign": foreign}
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--pages", type=int, default=5)
+    parser.add_argument("--no-rerank", action="store_true")
+    args = parser.parse_args(argv)
+
+    web_search = WebSearch(embedding_model="minilm")
+    # Load the shared models once up front, as the first real request would
+    web_search.new_store()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        outcomes = list(executor.map(
+            lambda request_id: run_request(web_search, request_id, args.pages, not args.no_rerank),
+            range(args.requests)
+        ))
+    elapsed = time.perf_counter() - start
+
+    leaks = [outcome for outcome in outcomes if outcome["foreign"]]
+    empty = [outcome for outcome in outcomes if not outcome["results"]]
+    print(f"{args.requests} requests on {args.workers} threads in {elapsed:.2f}s")
+    print(f"Requests with cross-talk: {len(leaks)}")
+    print(f"Requests with no results: {len(empty)}")
+    for outcome in leaks[:10]:
+        print(f"  request {outcome['request_id']} saw {outcome['foreign'][:3]}")
+
+    return 1 if leaks or empty else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
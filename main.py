@@ -5,8 +5,10 @@ Main application entry point
 """
 from app import create_app
 
-# Create Flask application
-app = create_app()
+# Create Flask application. Spawned and forkserver worker processes (link
+# text extraction) re-import this module as __mp_main__ and need no app
+if __name__ != "__mp_main__":
+    app = create_app()
 
 if __name__ == "__main__":
     app.run(debug=True, host='0.0.0.0', port=5000)